@@ -15,9 +15,8 @@ def main():
     dataset_path = "yellow_tripdata_2016-01.csv"
     
     analyzer = MobilityDataAnalyzer(dataset_path)
-    analyzer.load_data(nrows=10000)  # Use smaller sample for demo
-    analyzer.clean_data()
-    analyzer.feature_engineering()
+    db = MobilityDBManager()
+    db.ingest_data(analyzer, nrows=10000)  # Use smaller sample for demo
     
     print(f"   ✅ Loaded {len(analyzer.data):,} records")
     print(f"   ✅ Columns: {list(analyzer.data.columns)[:5]}...")
@@ -30,10 +29,6 @@ def main():
     print(f"   📍 Average Distance: {df['trip_distance'].mean():.2f} miles")
     
 
-    db = MobilityDBManager()
-    db.ingest_data(analyzer)
-    
-
     hourly = db.get_hourly_demand()
     peak_hour = hourly.loc[hourly['trip_count'].idxmax(), 'pickup_hour']
     print(f"   🕐 Peak Hour: {int(peak_hour)}:00")
@@ -3,9 +3,14 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import pydeck as pdk
+import os
 from code.mobility_analytics import MobilityDataAnalyzer
 from code.database_manager import MobilityDBManager
+from code.sql_guard import SQLValidationError
+from code.executive_summaries import SummaryStore, ExecutiveSummaryBatch, build_reports
 from code.genai_assistant import GenAIAssistant
+from code.olap_cube import MobilityCube
+from code.metric_index import MetricKnowledgeBase
 
 
 st.set_page_config(
@@ -384,19 +389,30 @@ st.markdown("""
 def get_managers():
     dataset_path = "yellow_tripdata_2016-01.csv"
     
+    spark_output_dir = os.environ.get("MOBILITY_SPARK_OUTPUT", "spark_output")
+    
     analyzer = MobilityDataAnalyzer(dataset_path)
-    with st.spinner("Loading Data Model..."):
-        analyzer.load_data(nrows=50000) 
-        analyzer.clean_data()
-        analyzer.feature_engineering()
-        
     db_manager = MobilityDBManager()
-    db_manager.ingest_data(analyzer)
-    
-    ai_assistant = GenAIAssistant()
+    with st.spinner("Loading Data Model..."):
+        # Prefer the aggregates spark_etl.py already computed; fall back to the CSV.
+        if not db_manager.serve_from_spark(spark_output_dir, analyzer):
+            db_manager.ingest_data(analyzer, nrows=50000)
+    
+    ai_assistant = GenAIAssistant(data_version=db_manager.data_version())
+    # Day/hour/zone facts for insight prompts; rebuilt only when the data changes.
+    # Counts are scaled up when the analyzer holds the serving sample.
+    scale = db_manager.get_kpi_summary()['total_trips'] / max(len(analyzer.data), 1)
+    ai_assistant.knowledge = MetricKnowledgeBase.load_or_build(
+        "metric_index", db_manager.data_version(),
+        lambda: MetricKnowledgeBase.from_cube(MobilityCube.from_frame(analyzer.data), scale=scale))
     
     return analyzer, db_manager, ai_assistant
 
+@st.cache_resource
+def get_summary_store():
+    # Executive summaries written by the batch job (code/executive_summaries.py).
+    return SummaryStore("executive_summaries.db")
+
 try:
     analyzer, db_manager, ai_assistant = get_managers()
 except FileNotFoundError:
@@ -437,8 +453,38 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
     
+    if ai_assistant.cache is not None:
+        cache_stats = ai_assistant.cache.stats()
+        st.caption(f"🗃️ AI cache: {cache_stats['hits']} hits / {cache_stats['hits'] + cache_stats['misses']} "
+                   f"lookups ({cache_stats['hit_rate']:.0%}), {cache_stats['entries']} stored answers")
+    
+    llm_totals = ai_assistant.metrics.totals()
+    if llm_totals['calls']:
+        llm_series = ai_assistant.metrics.summary()
+        llm_calls = [row for row in llm_series if row['provider'] not in ("cache", "rules", "mock")]
+        p95s = [row['latency_p95_s'] for row in llm_calls if row['latency_p95_s'] is not None]
+        st.caption(f"📈 {llm_totals['calls']} AI calls, {sum(r['calls'] for r in llm_calls)} to an LLM, "
+                   f"{llm_totals['errors']} errors; "
+                   f"{llm_totals['prompt_tokens'] + llm_totals['completion_tokens']:,} tokens"
+                   + (f"; p95 latency {max(p95s):.2f}s" if p95s else ""))
+        with st.expander("AI call metrics"):
+            st.dataframe(pd.DataFrame(llm_series).set_index(['operation', 'provider', 'model']).T,
+                         width='stretch')
+            st.download_button("⬇️ JSON", ai_assistant.metrics.to_json(), "llm_metrics.json", "application/json")
+            st.download_button("⬇️ Prometheus", ai_assistant.metrics.to_prometheus(), "llm_metrics.prom",
+                               "text/plain")
+    
+    if db_manager.serving is not None:
+        st.caption(f"📦 Serving Spark aggregates from `{db_manager.serving.output_dir}`; "
+                   f"AI queries and the data view use a {len(analyzer.data):,}-trip sample.")
+    
     st.markdown("<br>", unsafe_allow_html=True)
     
+    approximate_mode = st.toggle(
+        "⚡ Approximate answers",
+        help="Answer AI questions from stratified samples with 95% confidence intervals instead of scanning every trip."
+    )
+    
     if st.button("🔄 Reset AI Engine", width='stretch'):
         st.cache_resource.clear()
         st.rerun()
@@ -452,11 +498,11 @@ if page == "📊 Dashboard":
     </div>
     """, unsafe_allow_html=True)
     
-    df = analyzer.data
-    total_rev = df['total_amount'].sum()
-    avg_fare = df['fare_amount'].mean()
-    total_trips = len(df)
-    avg_dist = df['trip_distance'].mean()
+    kpis = db_manager.get_kpi_summary()
+    total_rev = kpis['total_revenue']
+    avg_fare = kpis['avg_fare']
+    total_trips = kpis['total_trips']
+    avg_dist = kpis['avg_distance']
     
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("💰 Total Revenue", f"${total_rev:,.0f}", "+12.5%")
@@ -533,7 +579,7 @@ if page == "📊 Dashboard":
 
     with c2:
         st.markdown("### 🏆 Top Zones")
-        top_zones = db_manager.get_top_pickup_zones(5)
+        top_zones = db_manager.get_top_pickup_zones(5, approximate=True)
         
         fig2 = go.Figure(data=[go.Pie(
             values=top_zones['trip_count'],
@@ -561,14 +607,21 @@ if page == "📊 Dashboard":
         )
         
         st.plotly_chart(fig2, width='stretch')
+        if len(top_zones):
+            st.caption(f"Pickup cells of {top_zones['cell_deg'].iloc[0]:g}° lat/lon")
 
 
     st.markdown("### 💹 Daily Revenue Trend")
     daily_rev = db_manager.get_revenue_trends()
     
     fig3 = go.Figure()
+    if 'pickup_year' in daily_rev:
+        rev_x = pd.to_datetime(daily_rev[['pickup_year', 'pickup_month', 'pickup_day']]
+                               .rename(columns=lambda c: c.replace('pickup_', '')))
+    else:
+        rev_x = daily_rev['pickup_day']
     fig3.add_trace(go.Scatter(
-        x=daily_rev['pickup_day'],
+        x=rev_x,
         y=daily_rev['total_revenue'],
         mode='lines',
         fill='tozeroy',
@@ -594,6 +647,34 @@ if page == "📊 Dashboard":
     
     st.plotly_chart(fig3, width='stretch')
 
+    st.markdown("### 📝 Executive Summaries")
+    summary_store = get_summary_store()
+    data_version = db_manager.data_version()
+    if ai_assistant.mode == "live":
+        if st.button("📝 Generate executive summaries"):
+            with st.spinner("Generating summaries..."):
+                db_manager.ensure_rollup()
+                # The rollup holds the loaded (possibly sampled) trips; zone
+                # counts already cover every trip.
+                scale = total_trips / max(len(analyzer.data), 1)
+                reports = build_reports(db_manager.conn, db_manager.get_top_pickup_zones(5), scale=scale)
+                run = ExecutiveSummaryBatch(ai_assistant, summary_store).run(reports, data_version)
+            st.caption(f"{run['generated']} generated, {run['skipped']} up to date, {run['failed']} failed "
+                       f"in {run['elapsed_s']:.1f}s")
+    else:
+        st.caption("Summaries are generated by `python -m code.executive_summaries` or with a live AI provider.")
+    
+    summaries = summary_store.list(data_version)
+    labels = {"month": "🗓️ Monthly", "period": "🕒 By time of day", "zone": "📍 Top zones"}
+    for scope, label in labels.items():
+        entries = [e for e in summaries if e['scope'] == scope]
+        if entries:
+            with st.expander(f"{label} ({len(entries)})", expanded=scope == "month"):
+                for entry in entries:
+                    st.markdown(f"**{entry['title']}** — {entry['summary']}")
+    if not summaries:
+        st.caption("No summaries for this dataset yet.")
+
 
 elif page == "🗺️ Geospatial":
     st.markdown("""
@@ -906,21 +987,30 @@ elif page == "🤖 AI Assistant":
 
             sql_query = ai_assistant.text_to_sql(prompt)
             data_context = "No direct SQL mapping."
+            checked = None
             
 
             if "SELECT" in sql_query and "Error" not in sql_query:
                 try:
-                    df_res = db_manager.run_query(sql_query)
-                    data_context = df_res.to_string()
+                    # Rejects writes, unknown columns and costly scans before running;
+                    # aggregates may be rewritten to the hourly rollup.
+                    checked = db_manager.validate_sql(sql_query)
+                    sql_query = checked.sql
+                    if approximate_mode and not checked.rewritten:
+                        df_res = db_manager.run_approx_query(sql_query)
+                    else:
+                        df_res = db_manager.run_query(sql_query)
+                    # Summarized to a token budget by the assistant.
+                    data_context = df_res
+                except SQLValidationError as e:
+                    data_context = f"SQL query rejected: {str(e)}"
                 except Exception as e:
                     data_context = f"SQL execution failed: {str(e)}"
-            
-
-            response = ai_assistant.generate_insight(data_context, prompt)
 
 
         with st.chat_message("assistant"):
-            st.markdown(response)
+            # Tokens are rendered as they arrive instead of after the full answer.
+            response = st.write_stream(ai_assistant.generate_insight_stream(data_context, prompt))
             
 
             if "SELECT" in sql_query:
@@ -932,6 +1022,14 @@ elif page == "🤖 AI Assistant":
   </div>
                     """, unsafe_allow_html=True)
                     st.code(sql_query, language="sql")
+                    source = {"rules": "rule-based intent (no LLM call)", "cache": "cached answer",
+                              "llm": ai_assistant.provider, "mock": "mock rules"}.get(ai_assistant.last_sql_source)
+                    if source:
+                        st.caption(f"SQL from: {source}")
+                    if checked is not None:
+                        st.caption(f"Plan: {checked.describe()}")
+                    elif data_context.startswith("SQL query rejected"):
+                        st.caption(data_context)
         
         st.session_state.messages.append({"role": "assistant", "content": response})
     
@@ -1017,7 +1115,11 @@ elif page == "📋 Data View":
             s1.metric("Min", f"{col_data.min():.2f}")
             s2.metric("Max", f"{col_data.max():.2f}")
             s3.metric("Mean", f"{col_data.mean():.2f}")
-            s4.metric("Median", f"{col_data.median():.2f}")
+            if selected_stat_col in db_manager.get_sketches().digests:
+                median = db_manager.get_quantiles(selected_stat_col, 0.5)
+            else:
+                median = col_data.median()
+            s4.metric("Median", f"{median:.2f}")
             s5.metric("Std Dev", f"{col_data.std():.2f}")
             
 
@@ -0,0 +1,226 @@
+import re
+import logging
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+WEIGHT_COLUMN = "sample_weight"
+STRATA = ['pickup_day', 'pickup_hour']
+
+AGGREGATE_PATTERN = re.compile(r"\b(COUNT|SUM|AVG)\s*\(", re.IGNORECASE)
+EXPLICIT_ALIAS_PATTERN = re.compile(r"^(.*\S)\s+AS\s+(\"[^\"]+\"|\w+)$", re.IGNORECASE | re.DOTALL)
+# A bare alias has to follow something that can end an expression: a name,
+# number, literal or closing parenthesis (not an operator like "*").
+BARE_ALIAS_PATTERN = re.compile(r"^(.*[\w)'\"\]])\s+(\"[^\"]+\"|[A-Za-z_]\w*)$", re.DOTALL)
+# Keywords that cannot end an expression, so a word after them is no alias.
+OPEN_KEYWORDS = {"DISTINCT", "ALL", "AND", "OR", "NOT", "IS", "IN", "LIKE", "GLOB", "BETWEEN", "CASE",
+                 "WHEN", "THEN", "ELSE", "AS", "COLLATE", "ESCAPE", "SELECT"}
+# Constructs the rewrite cannot weight correctly; such queries run exactly.
+UNSUPPORTED_PATTERN = re.compile(
+    r"^\s*SELECT\s+DISTINCT\b|\bOVER\s*\(|\b(?:COUNT|SUM|AVG)\s*\(\s*DISTINCT\b", re.IGNORECASE)
+
+
+def sample_table_name(rate: float) -> str:
+    """Table name for the stratified sample at the given rate, e.g. trips_sample_1pct."""
+    return f"trips_sample_{rate * 100:g}pct".replace(".", "_")
+
+
+def build_stratified_samples(df: pd.DataFrame, rates, seed: int = 42) -> dict:
+    """
+    Draws nested stratified samples of df, one per rate.
+
+    Strata are pickup day x hour, so every hour of every day stays represented.
+    Each stratum keeps ceil(rate * N_h) rows and every kept row gets
+    sample_weight = N_h / n_h, the number of trips it stands for. The samples
+    share one random permutation, so smaller samples are subsets of larger ones.
+
+    Returns:
+        dict: rate -> sampled DataFrame with a sample_weight column.
+    """
+    rng = np.random.default_rng(seed)
+    shuffled = df.iloc[rng.permutation(len(df))]
+    groups = shuffled.groupby(STRATA, sort=False)
+    rank = groups.cumcount().to_numpy()
+    stratum_size = groups[STRATA[0]].transform('size').to_numpy()
+
+    samples = {}
+    for rate in rates:
+        stratum_take = np.ceil(stratum_size * rate)
+        keep = rank < stratum_take
+        sample = shuffled[keep].copy()
+        sample[WEIGHT_COLUMN] = stratum_size[keep] / stratum_take[keep]
+        samples[rate] = sample
+    return samples
+
+
+def _closing_paren(text: str, start: int) -> int:
+    """Index of the parenthesis closing the one opened at text[start]."""
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == '(':
+            depth += 1
+        elif text[i] == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError("Unbalanced parentheses in query.")
+
+
+def _split_top_level(text: str, sep: str = ","):
+    parts, depth, last = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(text[last:i])
+            last = i + 1
+    parts.append(text[last:])
+    return parts
+
+
+def _estimate(func: str, arg: str) -> str:
+    """Weighted (Horvitz-Thompson) replacement for one aggregate call."""
+    w = WEIGHT_COLUMN
+    func = func.upper()
+    if re.match(r"^\s*DISTINCT\b", arg, re.IGNORECASE):
+        raise ValueError(f"{func}(DISTINCT ...) cannot be estimated from a sample.")
+    if func == "COUNT":
+        if arg.strip() in ("*", "1"):
+            return f"SUM({w})"
+        return f"SUM(CASE WHEN ({arg}) IS NOT NULL THEN {w} END)"
+    if func == "SUM":
+        return f"SUM(({arg}) * {w})"
+    return f"(SUM(({arg}) * {w}) / SUM(CASE WHEN ({arg}) IS NOT NULL THEN {w} END))"
+
+
+def _variance_terms(func: str, arg: str) -> list:
+    """
+    SQL terms for the variance of an estimate, treating the sample as Poisson
+    sampling with inclusion probability 1/w: Var(sum) ~ sum(w(w-1)y^2).
+    """
+    w = WEIGHT_COLUMN
+    f = f"{w} * ({w} - 1)"
+    func = func.upper()
+    if func == "COUNT":
+        if arg.strip() in ("*", "1"):
+            return [f"SUM({f})"]
+        return [f"SUM(CASE WHEN ({arg}) IS NOT NULL THEN {f} END)"]
+    if func == "SUM":
+        return [f"SUM({f} * ({arg}) * ({arg}))"]
+    return [
+        f"SUM({f} * ({arg}) * ({arg}))",
+        f"SUM({f} * ({arg}))",
+        f"SUM(CASE WHEN ({arg}) IS NOT NULL THEN {f} END)",
+        f"SUM(CASE WHEN ({arg}) IS NOT NULL THEN {w} END)",
+    ]
+
+
+def _split_alias(item: str):
+    """(expression, alias or None) of a select item; alias only for 'expr AS name' or 'expr name'."""
+    match = EXPLICIT_ALIAS_PATTERN.match(item)
+    if match:
+        return match.group(1).strip(), match.group(2)
+    match = BARE_ALIAS_PATTERN.match(item)
+    if match:
+        expr, alias = match.group(1), match.group(2)
+        last_word = re.search(r"\w+$", expr)
+        if alias.upper() not in OPEN_KEYWORDS | {"END", "NULL"} \
+                and not (last_word and last_word.group(0).upper() in OPEN_KEYWORDS):
+            return expr.strip(), alias
+    return item, None
+
+
+def _rewrite_aggregates(text: str) -> str:
+    out, pos = [], 0
+    for match in AGGREGATE_PATTERN.finditer(text):
+        if match.start() < pos:
+            continue
+        open_idx = match.end() - 1
+        close_idx = _closing_paren(text, open_idx)
+        out.append(text[pos:match.start()])
+        out.append(_estimate(match.group(1), text[open_idx + 1:close_idx]))
+        pos = close_idx + 1
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def rewrite_to_sample(query: str, table: str):
+    """
+    Rewrites an aggregate query over 'trips' to run on a sample table.
+
+    COUNT/SUM/AVG calls anywhere in the query become weighted estimates. Select
+    items that are a single aggregate also get hidden variance columns, so a
+    confidence interval can be attached after execution.
+
+    Returns:
+        tuple: (rewritten_sql, intervals) where intervals is a list of
+        (output_column, function, hidden_columns). Returns (None, []) when the
+        query has no COUNT/SUM/AVG to estimate, or uses SELECT DISTINCT,
+        DISTINCT aggregates, window functions or subqueries, which the
+        rewrite cannot weight safely; the caller then runs it exactly.
+    """
+    query = query.strip().rstrip(";")
+    if not AGGREGATE_PATTERN.search(query) or UNSUPPORTED_PATTERN.search(query) \
+            or len(re.findall(r"\bSELECT\b", query, re.IGNORECASE)) > 1:
+        return None, []
+
+    select = re.match(r"^\s*SELECT\s+", query, re.IGNORECASE)
+    from_match = None
+    depth = 0
+    for m in re.finditer(r"\(|\)|\bFROM\b", query, re.IGNORECASE):
+        if m.group(0) == "(":
+            depth += 1
+        elif m.group(0) == ")":
+            depth -= 1
+        elif depth == 0:
+            from_match = m
+            break
+    if select is None or from_match is None:
+        raise ValueError("Only single SELECT ... FROM trips statements can be approximated.")
+
+    items, extra, intervals = [], [], []
+    for n, item in enumerate(_split_top_level(query[select.end():from_match.start()])):
+        expr, alias = _split_alias(item.strip())
+        single = AGGREGATE_PATTERN.match(expr)
+        if single and _closing_paren(expr, single.end() - 1) == len(expr) - 1:
+            func, arg = single.group(1), expr[single.end():-1]
+            column = alias.strip('"') if alias else expr
+            hidden = [f"__ci_{n}_{k}" for k in range(len(_variance_terms(func, arg)))]
+            extra += [f"{term} AS {name}" for term, name in zip(_variance_terms(func, arg), hidden)]
+            intervals.append((column, func.upper(), hidden))
+            items.append(f"{_estimate(func, arg)} AS \"{column}\"")
+        else:
+            rewritten = _rewrite_aggregates(expr)
+            if alias is None and rewritten != expr:
+                alias = f"\"{expr}\""
+            items.append(f"{rewritten} AS {alias}" if alias else rewritten)
+
+    rest = re.sub(r"\b(FROM|JOIN)(\s+)trips\b", rf"\1\2{table}", query[from_match.start():], flags=re.IGNORECASE)
+    rest = _rewrite_aggregates(rest)
+    rewritten = f"{query[:select.end()]}{', '.join(items + extra)} {rest}"
+    return rewritten, intervals
+
+
+def attach_confidence_intervals(df: pd.DataFrame, intervals, confidence: float = 0.95) -> pd.DataFrame:
+    """
+    Turns the hidden variance columns of a rewritten query's result into
+    <column>_ci_low / <column>_ci_high columns.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    for column, func, hidden in intervals:
+        estimate = df[column].astype('float64')
+        if func == "AVG":
+            v2, v1, v0, total = (df[h].astype('float64') for h in hidden)
+            variance = (v2 - 2 * estimate * v1 + estimate ** 2 * v0) / total ** 2
+        else:
+            variance = df[hidden[0]].astype('float64')
+        half_width = z * np.sqrt(variance.clip(lower=0))
+        df[f"{column}_ci_low"] = estimate - half_width
+        df[f"{column}_ci_high"] = estimate + half_width
+        df = df.drop(columns=hidden)
+    return df
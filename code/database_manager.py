@@ -1,18 +1,96 @@
+import os
+import json
+import hashlib
 import sqlite3
+from datetime import datetime
 import pandas as pd
 import logging
-from code.mobility_analytics import MobilityDataAnalyzer
+from code.mobility_analytics import MobilityDataAnalyzer, PIPELINE_VERSION
+from code.approximate_query import (
+    build_stratified_samples, sample_table_name, rewrite_to_sample, attach_confidence_intervals
+)
+from code.sketches import MobilitySketches, PICKUP_CELL_SIZE
+from code.fast_aggregations import InMemoryAggregator
+from code.shard_store import ShardedTripStore
+from code.serving_layer import SparkServingStore
+from code.sql_guard import SQLGuard, build_rollup, connect_read_only, ROLLUP_TABLE
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+MANIFEST_TABLE = "ingest_manifest"
+FINGERPRINT_SAMPLE_BYTES = 1 << 20
+TIMESTAMP_COLUMNS = ['tpep_pickup_datetime', 'tpep_dropoff_datetime']
+EPOCH = pd.Timestamp("1970-01-01")
+# TLC timestamps are New York wall-clock times and are stored as such.
+DATA_TIMEZONE = "America/New_York"
+SAMPLE_RATES = (0.01, 0.1)
+APPROX_MIN_SAMPLE_ROWS = 5000
+
+
+def file_fingerprint(path: str, nrows: int = None) -> str:
+    """
+    Cheap fingerprint of a source file: size, mtime and the first/last MB of
+    content, plus the row limit it was read with.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha1(f"{stat.st_size}|{stat.st_mtime_ns}|{nrows}".encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+        if stat.st_size > FINGERPRINT_SAMPLE_BYTES:
+            f.seek(-FINGERPRINT_SAMPLE_BYTES, os.SEEK_END)
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def to_epoch_seconds(value) -> int:
+    """
+    Converts a datetime (or anything pd.Timestamp accepts) to the integer epoch
+    seconds used for timestamps in 'trips'. Naive values are taken as wall-clock
+    time, matching how the TLC data is recorded, so SQLite's
+    datetime(col, 'unixepoch') gives the original local time back. Aware
+    values are first converted to New York wall-clock time.
+    """
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(DATA_TIMEZONE).tz_localize(None)
+    return int((ts - EPOCH) // pd.Timedelta(seconds=1))
+
+
+def encode_timestamps(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns a copy of df with the trip timestamps as int64 epoch seconds."""
+    encoded = {}
+    for c in TIMESTAMP_COLUMNS:
+        if c in df.columns and pd.api.types.is_datetime64_any_dtype(df[c]):
+            values = df[c]
+            if isinstance(values.dtype, pd.DatetimeTZDtype):
+                values = values.dt.tz_convert(DATA_TIMEZONE).dt.tz_localize(None)
+            encoded[c] = (values - EPOCH) // pd.Timedelta(seconds=1)
+    return df.assign(**encoded)
+
+
+def decode_timestamps(df: pd.DataFrame) -> pd.DataFrame:
+    """Inverse of encode_timestamps() for frames read back from SQLite."""
+    for c in TIMESTAMP_COLUMNS:
+        if c in df.columns and pd.api.types.is_integer_dtype(df[c]):
+            df[c] = pd.to_datetime(df[c], unit='s')
+    return df
+
+
 class MobilityDBManager:
     """
     Manages SQLite database interactions for Mobility Analytics.
     """
     
-    def __init__(self, db_path: str = "mobility.db"):
+    def __init__(self, db_path: str = "mobility.db", sample_rates=SAMPLE_RATES, shard_dir: str = None):
         self.db_path = db_path
+        self.shards = ShardedTripStore(shard_dir) if shard_dir else None
+        self.sample_rates = sorted(sample_rates)
+        self.sketch_path = f"{os.path.splitext(db_path)[0]}_sketches.npz"
+        self.sketches = None
+        self.aggregator = None
+        self.serving = None
+        self.guard = None
         self.conn = None
 
     def connect(self):
@@ -25,35 +103,378 @@ class MobilityDBManager:
             logging.error(f"Error connecting to database: {e}")
             raise
 
-    def ingest_data(self, analyzer: MobilityDataAnalyzer):
+    def _schema_hash(self):
+        """Hash of the current 'trips' column names and declared types."""
+        columns = self.conn.execute("PRAGMA table_info(trips)").fetchall()
+        if not columns:
+            return None
+        return hashlib.sha1("|".join(f"{c[1]}:{c[2]}" for c in columns).encode()).hexdigest()
+
+    def read_manifest(self) -> dict:
+        """Returns the stored ingest manifest, or an empty dict if there is none."""
+        if self.conn is None:
+            self.connect()
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+        rows = self.conn.execute(f"SELECT key, value FROM {MANIFEST_TABLE}").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def _write_manifest(self, manifest: dict):
+        with self.conn:
+            self.conn.execute(f"DELETE FROM {MANIFEST_TABLE}")
+            self.conn.executemany(
+                f"INSERT INTO {MANIFEST_TABLE} (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in manifest.items()]
+            )
+
+    def is_current(self, analyzer: MobilityDataAnalyzer, nrows: int = None) -> bool:
+        """
+        Checks whether 'trips' already holds the output of the current pipeline
+        for the analyzer's source file, so ingest can be skipped.
+        """
+        if not os.path.exists(analyzer.file_path):
+            return False
+        if analyzer.data is not None:
+            nrows = analyzer.nrows
+        manifest = self.read_manifest()
+        if not manifest:
+            return False
+        if manifest.get("pipeline_version") != PIPELINE_VERSION:
+            return False
+        if manifest.get("source_fingerprint") != file_fingerprint(analyzer.file_path, nrows):
+            return False
+        if manifest.get("schema_hash") != self._schema_hash():
+            return False
+        if manifest.get("sample_rates") != self.sample_rates:
+            return False
+        if not os.path.exists(self.sketch_path):
+            return False
+        if manifest.get("shard_dir") != (self.shards.root_dir if self.shards else None):
+            return False
+        row_count = self.conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+        if manifest.get("row_count") != row_count:
+            return False
+        return analyzer.data is None or len(analyzer.data) == row_count
+
+    def data_version(self) -> str:
         """
-        Loads cleaned data from the Analyzer into SQLite.
+        Short identifier of the data currently served: the ingest manifest's
+        source fingerprint, pipeline version and schema, or the Spark output
+        in serving mode. Changes whenever answers about the data could change.
         """
-        if analyzer.data is None:
+        if self.serving is not None:
+            sample_dir = os.path.join(self.serving.output_dir, "serving_sample")
+            parts = ["spark", os.path.abspath(self.serving.output_dir), str(os.stat(sample_dir).st_mtime_ns)]
+        else:
+            manifest = self.read_manifest()
+            parts = [str(manifest.get(key)) for key in ("source_fingerprint", "pipeline_version", "schema_hash", "row_count")]
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+    def load_trips(self) -> pd.DataFrame:
+        """Reads the 'trips' table back into a DataFrame with decoded timestamps."""
+        if self.conn is None:
+            self.connect()
+        return decode_timestamps(pd.read_sql_query("SELECT * FROM trips", self.conn))
+
+    def ingest_data(self, analyzer: MobilityDataAnalyzer, nrows: int = None, force: bool = False,
+                    chunksize: int = None) -> bool:
+        """
+        Loads cleaned data from the Analyzer into SQLite, along with the
+        stratified samples and the streaming sketches.
+
+        Skipped when the stored manifest shows the database already holds this
+        source file processed by the current pipeline; an unloaded analyzer is
+        then filled from the database instead of the CSV.
+
+        Args:
+            chunksize (int, optional): Stream the CSV in chunks of this many rows
+                instead of loading it whole. The analyzer is left unloaded.
+
+        Returns:
+            bool: True if 'trips' was (re)written, False if ingest was skipped.
+        """
+        if self.conn is None:
+            self.connect()
+
+        if not force and self.is_current(analyzer, nrows):
+            logging.info(f"{self.db_path} is up to date with {analyzer.file_path}. Skipping ingest.")
+            if analyzer.data is None and chunksize is None:
+                analyzer.data = self.load_trips()
+                analyzer.nrows = nrows
+            self.attach_frame(analyzer.data)
+            return False
+
+        if analyzer.data is not None:
+            chunks = [analyzer.data]
+        elif chunksize is not None:
+            chunks = analyzer.iter_chunks(chunksize, nrows=nrows)
+        else:
             logging.warning("No data found in analyzer. Loading default...")
-            analyzer.load_data()
+            analyzer.load_data(nrows=nrows)
             analyzer.clean_data()
             analyzer.feature_engineering()
+            chunks = [analyzer.data]
             
         logging.info("Writing data to SQLite table 'trips'...")
+        self.read_manifest()
+        with self.conn:
+            self.conn.execute(f"DELETE FROM {MANIFEST_TABLE}")
+
+        self.sketches = MobilitySketches()
+        row_count, sample_rows = 0, {}
+        if self.shards:
+            self.shards.begin_ingest()
+        for i, chunk in enumerate(chunks):
+            mode = 'replace' if i == 0 else 'append'
+            encoded = encode_timestamps(chunk)
+            encoded.to_sql('trips', self.conn, if_exists=mode, index=False)
+            if self.shards:
+                self.shards.write(encoded)
+            for table, rows in self.build_samples(chunk, mode).items():
+                sample_rows[table] = sample_rows.get(table, 0) + rows
+            self.sketches.update(chunk)
+            row_count += len(chunk)
+        if self.shards:
+            self.shards.end_ingest()
+        self.create_indexes()
+        self.build_rollup()
+        self.sketches.save(self.sketch_path)
+
+        self.attach_frame(analyzer.data)
+
+        self._write_manifest({
+            "source_file": os.path.basename(analyzer.file_path),
+            "source_fingerprint": file_fingerprint(analyzer.file_path, analyzer.nrows),
+            "row_count": row_count,
+            "pipeline_version": PIPELINE_VERSION,
+            "schema_hash": self._schema_hash(),
+            "sample_rates": self.sample_rates,
+            "sample_rows": sample_rows,
+            "sketch_file": os.path.basename(self.sketch_path),
+            "shard_dir": self.shards.root_dir if self.shards else None,
+        })
+        logging.info(f"Data successfully written to SQLite ({row_count:,} rows).")
+        return True
+
+    def serve_from_spark(self, output_dir: str, analyzer: MobilityDataAnalyzer = None) -> bool:
+        """
+        Serving mode: answers the dashboard aggregations from the Parquet
+        outputs of spark_etl.py, computed over every cleaned trip. The fixed
+        serving_sample slice fills 'trips', the sample tables and the
+        sketches (and the analyzer, if given) for row-level views and ad-hoc SQL.
+
+        Returns:
+            bool: False if output_dir does not hold the Spark serving tables.
+        """
+        if not SparkServingStore.available(output_dir):
+            return False
         if self.conn is None:
             self.connect()
-            
-        analyzer.data.to_sql('trips', self.conn, if_exists='replace', index=False)
-        logging.info("Data successfully written to SQLite.")
 
-    def run_query(self, query: str):
+        self.serving = SparkServingStore(output_dir)
+        sample = self.serving.load_sample()
+        self.read_manifest()
+        with self.conn:
+            # 'trips' no longer mirrors a CSV, so the next ingest_data() must rebuild it.
+            self.conn.execute(f"DELETE FROM {MANIFEST_TABLE}")
+        encode_timestamps(sample).to_sql('trips', self.conn, if_exists='replace', index=False)
+        self.create_indexes()
+        self.build_rollup()
+        self.build_samples(sample)
+        self.sketches = MobilitySketches()
+        self.sketches.update(sample)
+        self.attach_frame(sample)
+        if analyzer is not None:
+            analyzer.data = sample
+        logging.info(f"Serving aggregates from {output_dir}; 'trips' holds the {len(sample):,}-row serving sample.")
+        return True
+
+    def attach_frame(self, df: pd.DataFrame):
+        """
+        Serves the fixed dashboard aggregations from an in-memory copy of
+        'trips' (NumPy fast path). Pass None to go back to SQLite.
+        """
+        self.aggregator = InMemoryAggregator(df) if df is not None else None
+
+    def build_samples(self, df: pd.DataFrame, if_exists: str = 'replace') -> dict:
+        """
+        Writes one stratified sample table per configured rate. With
+        if_exists='append' each chunk is sampled as its own set of strata.
+
+        Returns:
+            dict: sample table name -> row count.
+        """
+        sample_rows = {}
+        for rate, sample in build_stratified_samples(df, self.sample_rates).items():
+            table = sample_table_name(rate)
+            encode_timestamps(sample).to_sql(table, self.conn, if_exists=if_exists, index=False)
+            sample_rows[table] = len(sample)
+            logging.info(f"Wrote {len(sample):,} rows to sample table '{table}'.")
+        return sample_rows
+
+    def run_approx_query(self, query: str, sampling_rate: float = None,
+                         confidence: float = 0.95, params=None) -> pd.DataFrame:
+        """
+        Runs a COUNT/SUM/AVG query against a stratified sample instead of 'trips'.
+
+        Aggregates are scaled by the sample weights and each plain aggregate
+        column gets <column>_ci_low / <column>_ci_high bounds at the given
+        confidence. Without an explicit sampling_rate, the smallest sample with
+        at least APPROX_MIN_SAMPLE_ROWS rows is used; if none is that large (or
+        the query has nothing to estimate) the exact query runs instead and the
+        bounds collapse to the exact value. The rate used is reported in
+        result.attrs['sampling_rate'] (1.0 for exact).
+        """
+        if sampling_rate is None:
+            sample_rows = self.read_manifest().get("sample_rows", {})
+            eligible = [r for r in self.sample_rates
+                        if sample_rows.get(sample_table_name(r), 0) >= APPROX_MIN_SAMPLE_ROWS]
+            sampling_rate = eligible[0] if eligible else 1.0
+        elif sampling_rate < 1.0 and sampling_rate not in self.sample_rates:
+            raise ValueError(f"No sample table for rate {sampling_rate}. Available: {self.sample_rates}")
+
+        table = sample_table_name(sampling_rate) if sampling_rate < 1.0 else 'trips'
+        rewritten, intervals = rewrite_to_sample(query, table)
+        if rewritten is None or table == 'trips':
+            result = self.run_query(query, params)
+            for column, _, _ in intervals:
+                result[f"{column}_ci_low"] = result[column]
+                result[f"{column}_ci_high"] = result[column]
+            result.attrs['sampling_rate'] = 1.0
+            return result
+
+        result = attach_confidence_intervals(self.run_query(rewritten, params), intervals, confidence)
+        result.attrs['sampling_rate'] = sampling_rate
+        return result
+
+    def build_rollup(self) -> int:
+        """Rebuilds the hourly rollup of 'trips' that validate_sql() rewrites aggregates to."""
+        if self.guard is not None and self.guard.conn is not self.conn:
+            self.guard.conn.close()
+        self.guard = None
+        return build_rollup(self.conn)
+
+    def ensure_rollup(self):
+        """Builds the hourly rollup if this database does not have one yet."""
+        if self.conn is None:
+            self.connect()
+        if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (ROLLUP_TABLE,)).fetchone():
+            self.build_rollup()
+
+    def validate_sql(self, query: str, use_rollup: bool = True):
+        """
+        Checks generated SQL before running it (see code/sql_guard.py): a single
+        read-only query over 'trips', its rollup or the sample tables, with
+        known columns, a LIMIT and an acceptable estimated cost.
+
+        Returns:
+            ValidatedQuery: .sql is the query to run.
+
+        Raises:
+            SQLValidationError: If the query must not run.
+        """
+        if self.conn is None:
+            self.connect()
+        if self.guard is None:
+            self.ensure_rollup()
+            # The guard's authorizer must not apply to queries other threads
+            # run on self.conn, so it compiles on a read-only connection of
+            # its own (an in-memory database only has the shared one).
+            conn = self.conn if self.db_path == ":memory:" else connect_read_only(self.db_path)
+            self.guard = SQLGuard(conn, allowed_tables=[sample_table_name(r) for r in self.sample_rates])
+        return self.guard.validate(query, use_rollup)
+
+    def create_indexes(self):
+        """Indexes the epoch-second pickup/dropoff columns for time-range scans."""
+        with self.conn:
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_trips_pickup_ts ON trips (tpep_pickup_datetime)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_trips_dropoff_ts ON trips (tpep_dropoff_datetime)")
+
+    def time_range_predicate(self, start: datetime = None, end: datetime = None,
+                             column: str = 'tpep_pickup_datetime'):
+        """
+        Builds a half-open [start, end) predicate on an epoch-second timestamp
+        column that SQLite can satisfy with an index range scan.
+
+        Returns:
+            tuple: (sql_fragment, params) for use in a WHERE clause.
+        """
+        if column not in TIMESTAMP_COLUMNS:
+            raise ValueError(f"Unknown timestamp column: {column}")
+        clauses, params = [], []
+        if start is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(to_epoch_seconds(start))
+        if end is not None:
+            clauses.append(f"{column} < ?")
+            params.append(to_epoch_seconds(end))
+        return (" AND ".join(clauses) or "1 = 1"), tuple(params)
+
+    def get_trips_between(self, start: datetime = None, end: datetime = None,
+                          columns: str = "*", limit: int = None) -> pd.DataFrame:
+        """Returns trips picked up in [start, end), with timestamps decoded."""
+        predicate, params = self.time_range_predicate(start, end)
+        query = f"SELECT {columns} FROM trips WHERE {predicate}"
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (limit,)
+        return decode_timestamps(self.run_query(query, params))
+
+    def aggregate_time_range(self, measures: dict, group_by=(), start: datetime = None,
+                             end: datetime = None, where: str = None, params: tuple = ()) -> pd.DataFrame:
+        """
+        Aggregates over the monthly shards whose pickup range overlaps
+        [start, end), fanning out across shards in a process pool.
+
+        Example:
+            db.aggregate_time_range({'trips': ('count', '*'), 'revenue': ('sum', 'total_amount')},
+                                    group_by=['pickup_hour'], start=datetime(2016, 1, 5))
+        """
+        if self.shards is None:
+            raise ValueError("Sharded storage is not enabled. Create MobilityDBManager with shard_dir=...")
+        return self.shards.aggregate(
+            measures, group_by,
+            start=to_epoch_seconds(start) if start is not None else None,
+            end=to_epoch_seconds(end) if end is not None else None,
+            where=where, params=params
+        )
+
+    def run_query(self, query: str, params=None):
         """Runs a raw SQL query and returns a DataFrame."""
         if self.conn is None:
             self.connect()
         try:
-            return pd.read_sql_query(query, self.conn)
+            return pd.read_sql_query(query, self.conn, params=params)
         except Exception as e:
             logging.error(f"Query execution failed: {e}")
             raise
 
-    def get_top_pickup_zones(self, limit=10):
-        """Returns top pickup locations by trip count."""
+    def get_sketches(self) -> MobilitySketches:
+        """Returns the ingest-time sketches, loading them from disk if needed."""
+        if self.sketches is None:
+            self.sketches = MobilitySketches.load(self.sketch_path)
+        return self.sketches
+
+    def count_distinct_pickup_cells(self, hour: int = None) -> float:
+        """HyperLogLog estimate of distinct 3-decimal pickup cells, overall or for one hour."""
+        return self.get_sketches().distinct_pickup_cells(hour)
+
+    def get_quantiles(self, column: str, quantiles=(0.25, 0.5, 0.75)):
+        """t-digest estimates of the given quantiles of a fare/distance column."""
+        return self.get_sketches().quantile(column, quantiles)
+
+    def get_top_pickup_zones(self, limit=10, approximate: bool = False):
+        """
+        Returns top pickup locations by trip count. With approximate=True the
+        answer comes from the heavy-hitters sketch instead of a full scan.
+        cell_deg is the grid the cells were counted on: 0.001 degrees here,
+        0.01 in Spark serving mode, which only has the zone_hourly_demand grid.
+        """
+        if self.serving is not None:
+            return self.serving.get_top_pickup_zones(limit)
+        if approximate:
+            return self.get_sketches().top_pickup_zones(limit)
+        if self.aggregator is not None:
+            return self.aggregator.get_top_pickup_zones(limit)
 
         query = """
         SELECT 
@@ -68,10 +489,16 @@ class MobilityDBManager:
         """
         if self.conn is None:
             self.connect()
-        return pd.read_sql_query(query, self.conn, params=(limit,))
+        zones = pd.read_sql_query(query, self.conn, params=(limit,))
+        zones['cell_deg'] = PICKUP_CELL_SIZE
+        return zones
 
     def get_hourly_demand(self):
         """Returns demand per hour of day."""
+        if self.serving is not None:
+            return self.serving.get_hourly_demand()
+        if self.aggregator is not None:
+            return self.aggregator.get_hourly_demand()
         query = """
         SELECT 
             pickup_hour,
@@ -85,6 +512,10 @@ class MobilityDBManager:
 
     def get_revenue_trends(self):
         """Returns daily revenue trends."""
+        if self.serving is not None:
+            return self.serving.get_revenue_trends()
+        if self.aggregator is not None:
+            return self.aggregator.get_revenue_trends()
         query = """
         SELECT 
             pickup_day,
@@ -96,6 +527,22 @@ class MobilityDBManager:
         """
         return self.run_query(query)
 
+    def get_kpi_summary(self) -> dict:
+        """Headline totals: trips, revenue, average fare and distance."""
+        if self.serving is not None:
+            return self.serving.get_kpi_summary()
+        if self.aggregator is not None:
+            return self.aggregator.get_kpi_summary()
+        row = self.run_query("""
+        SELECT
+            COUNT(*) as total_trips,
+            SUM(total_amount) as total_revenue,
+            AVG(fare_amount) as avg_fare,
+            AVG(trip_distance) as avg_distance
+        FROM trips
+        """).iloc[0]
+        return {key: (int(value) if key == 'total_trips' else float(value or 0)) for key, value in row.items()}
+
 if __name__ == "__main__":
 
     db_manager = MobilityDBManager()
@@ -105,11 +552,7 @@ if __name__ == "__main__":
     analyzer = MobilityDataAnalyzer(dataset_path)
     
 
-    analyzer.load_data(nrows=50000)
-    analyzer.clean_data()
-    analyzer.feature_engineering()
-    
-    db_manager.ingest_data(analyzer)
+    db_manager.ingest_data(analyzer, nrows=50000)
     
     print("\nTop Zones:")
     print(db_manager.get_top_pickup_zones())
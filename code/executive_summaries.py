@@ -0,0 +1,397 @@
+import time
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from code.sql_guard import ROLLUP_TABLE
+from code.sketches import PICKUP_CELL_SIZE
+from code.provider_router import NoProviderAvailable
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SUMMARY_TABLE = "executive_summaries"
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+               'September', 'October', 'November', 'December']
+# Day parts as (name, pickup hours).
+PERIODS = [
+    ("Morning rush", range(7, 10)),
+    ("Midday", range(10, 16)),
+    ("Evening rush", range(16, 20)),
+    ("Night", [*range(20, 24), *range(0, 7)]),
+]
+
+SYSTEM_PROMPT = """You write executive summaries of NYC Yellow Taxi operations for company leadership.
+
+Rules:
+- Use ONLY the KPIs provided; cite the key numbers
+- 3-4 sentences: the headline trend, the most likely explanation, one concrete recommendation
+- No preamble, no bullet lists"""
+
+
+class SummaryReport:
+    """One summary to generate: a stable key, its scope (month/period/zone), a title and KPI context."""
+
+    def __init__(self, key: str, scope: str, title: str, context: str):
+        self.key = key
+        self.scope = scope
+        self.title = title
+        self.context = context
+
+    @property
+    def context_hash(self) -> str:
+        return hashlib.sha1(self.context.encode()).hexdigest()
+
+
+def _pct_change(new: float, old: float) -> str:
+    return f"{(new - old) / old:+.1%}" if old else "n/a"
+
+
+def _ratio(num: float, den: float, spec: str, unit: str = "") -> str:
+    """num / den formatted with spec (after unit), or "n/a" when den is zero."""
+    return f"{unit}{num / den:{spec}}" if den else "n/a"
+
+
+def build_reports(conn: sqlite3.Connection, zones=None, scale: float = 1.0, zone_scale: float = 1.0) -> list:
+    """
+    KPI contexts per month, per day part of each month and per top pickup
+    zone, read from the hourly rollup (code/sql_guard.py) so no trip rows are
+    scanned. zones is a DataFrame of lat, lon, trip_count, avg_revenue and
+    cell_deg as returned by MobilityDBManager.get_top_pickup_zones(). Rollup counts and
+    sums are multiplied by scale when the rollup was built from a sample, zone
+    trip counts by zone_scale: get_top_pickup_zones() counts every trip in
+    Spark serving mode too, so zones normally need no scaling.
+    """
+    rows = conn.execute(f"""
+        SELECT pickup_year, pickup_month, pickup_day, pickup_hour, pickup_weekday,
+               trip_count, total_amount_sum, fare_amount_sum, tip_amount_sum, trip_distance_sum
+        FROM {ROLLUP_TABLE}
+        ORDER BY pickup_year, pickup_month, pickup_day, pickup_hour
+    """).fetchall()
+    months = {}
+    for year, month, day, hour, weekday, *values in rows:
+        # A measure that is NULL for a whole hour sums to NULL.
+        months.setdefault((year, month), []).append((day, hour, weekday, *((v or 0) * scale for v in values)))
+
+    reports = []
+    previous = None
+    for (year, month), cells in months.items():
+        name = f"{MONTH_NAMES[month - 1]} {year}"
+        trips = sum(c[3] for c in cells)
+        revenue = sum(c[4] for c in cells)
+        fare = sum(c[5] for c in cells)
+        tips = sum(c[6] for c in cells)
+        distance = sum(c[7] for c in cells)
+
+        daily = {}
+        for day, _, weekday, day_trips, day_revenue, *_ in cells:
+            entry = daily.setdefault(day, [weekday, 0.0, 0.0])
+            entry[1] += day_trips
+            entry[2] += day_revenue
+        days = sorted(daily)
+        best = max(days, key=lambda d: daily[d][2])
+        worst = min(days, key=lambda d: daily[d][2])
+        first_week = sum(daily[d][2] for d in days[:7]) / len(days[:7])
+        last_week = sum(daily[d][2] for d in days[-7:]) / len(days[-7:])
+        weekend = [daily[d][1] for d in days if daily[d][0] in ('Saturday', 'Sunday')]
+        weekday = [daily[d][1] for d in days if daily[d][0] not in ('Saturday', 'Sunday')]
+
+        lines = [
+            f"Month: {name} ({len(days)} days with trips)",
+            f"Trips: {trips:,.0f} ({trips / len(days):,.0f} per day)",
+            f"Revenue: ${revenue:,.0f}; average fare {_ratio(fare, trips, '.2f', '$')}; "
+            f"average distance {_ratio(distance, trips, '.2f')} mi",
+            f"Tips: {_ratio(tips, fare, '.1%')} of fares",
+            f"Best day: {MONTH_NAMES[month - 1][:3]} {best} ({daily[best][0]}), ${daily[best][2]:,.0f}",
+            f"Weakest day: {MONTH_NAMES[month - 1][:3]} {worst} ({daily[worst][0]}), ${daily[worst][2]:,.0f}",
+            f"Average daily revenue, first 7 days vs last 7 days: ${first_week:,.0f} vs ${last_week:,.0f} "
+            f"({_pct_change(last_week, first_week)})",
+        ]
+        if weekend and weekday:
+            lines.append(f"Trips per weekday vs weekend day: {sum(weekday) / len(weekday):,.0f} vs "
+                         f"{sum(weekend) / len(weekend):,.0f}")
+        if previous is not None:
+            lines.append(f"Versus {previous[0]}: trips {_pct_change(trips, previous[1])}, "
+                         f"revenue {_pct_change(revenue, previous[2])}")
+        reports.append(SummaryReport(f"month:{year}-{month:02d}", "month", f"{name} overview", "\n".join(lines)))
+
+        for period, hours in PERIODS:
+            part = [c for c in cells if c[1] in hours]
+            part_trips = sum(c[3] for c in part)
+            if not part_trips:
+                continue
+            part_revenue = sum(c[4] for c in part)
+            by_hour = {}
+            for _, hour, _, hour_trips, *_ in part:
+                by_hour[hour] = by_hour.get(hour, 0.0) + hour_trips
+            peak = max(by_hour, key=by_hour.get)
+            weekend_trips = sum(c[3] for c in part if c[2] in ('Saturday', 'Sunday'))
+            context = "\n".join([
+                f"Period: {period} (hours {', '.join(str(h) for h in sorted(by_hour))}), {name}",
+                f"Trips: {part_trips:,.0f} ({_ratio(part_trips, trips, '.1%')} of the month)",
+                f"Revenue: ${part_revenue:,.0f} ({_ratio(part_revenue, revenue, '.1%')} of the month)",
+                f"Average fare: ${sum(c[5] for c in part) / part_trips:.2f} "
+                f"(month: {_ratio(fare, trips, '.2f', '$')})",
+                f"Average distance: {sum(c[7] for c in part) / part_trips:.2f} mi "
+                f"(month: {_ratio(distance, trips, '.2f')} mi)",
+                f"Busiest hour: {peak}:00 with {by_hour[peak]:,.0f} trips",
+                f"Weekend share of period trips: {weekend_trips / part_trips:.1%}",
+            ])
+            key = f"period:{year}-{month:02d}:{period.lower().replace(' ', '_')}"
+            reports.append(SummaryReport(key, "period", f"{name}: {period}", context))
+        previous = (name, trips, revenue)
+
+    if zones is not None and len(zones):
+        all_trips = sum(sum(c[3] for c in cells) for cells in months.values())
+        all_revenue = sum(sum(c[4] for c in cells) for cells in months.values())
+        for rank, zone in enumerate(zones.itertuples(index=False), start=1):
+            # The cell size depends on the backend, so it is part of the key and the text.
+            cell = getattr(zone, 'cell_deg', PICKUP_CELL_SIZE)
+            context = "\n".join([
+                f"Pickup zone: {cell:g}° grid cell around ({zone.lat:.3f}, {zone.lon:.3f}), "
+                f"rank {rank} of {len(zones)} by pickups",
+                f"Trips: {zone.trip_count * zone_scale:,.0f} "
+                f"({_ratio(zone.trip_count * zone_scale, all_trips, '.2%')} of all trips)",
+                f"Average revenue per trip: ${zone.avg_revenue:.2f} "
+                f"(overall: {_ratio(all_revenue, all_trips, '.2f', '$')})",
+            ])
+            reports.append(SummaryReport(f"zone:{cell:g}:{zone.lat:.3f},{zone.lon:.3f}", "zone",
+                                         f"Zone #{rank} ({zone.lat:.3f}, {zone.lon:.3f}, {cell:g}° cell)", context))
+    return reports
+
+
+class SummaryStore:
+    """
+    Generated summaries in SQLite, keyed on report key and data version, so
+    the app reads them without calling an LLM and a batch run skips reports
+    whose KPI context has not changed.
+    """
+
+    def __init__(self, path: str = "executive_summaries.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+                    report_key TEXT NOT NULL,
+                    data_version TEXT NOT NULL,
+                    scope TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    context_hash TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    provider TEXT,
+                    attempts INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (report_key, data_version)
+                )
+            """)
+
+    def has(self, report: SummaryReport, data_version: str) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT context_hash FROM {SUMMARY_TABLE} WHERE report_key = ? AND data_version = ?",
+                (report.key, data_version or "")).fetchone()
+        return row is not None and row[0] == report.context_hash
+
+    def put(self, report: SummaryReport, data_version: str, summary: str, provider: str, attempts: int):
+        with self._lock, self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {SUMMARY_TABLE} "
+                "(report_key, data_version, scope, title, context_hash, summary, provider, attempts, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (report.key, data_version or "", report.scope, report.title, report.context_hash,
+                 summary, provider, attempts, time.time()))
+
+    def list(self, data_version: str, scope: str = None) -> list:
+        """Stored summaries of a data version as dicts, in report key order."""
+        query = (f"SELECT report_key, scope, title, summary, provider, created_at FROM {SUMMARY_TABLE} "
+                 "WHERE data_version = ?")
+        params = [data_version or ""]
+        if scope is not None:
+            query += " AND scope = ?"
+            params.append(scope)
+        with self._lock:
+            rows = self.conn.execute(query + " ORDER BY report_key", params).fetchall()
+        return [dict(zip(('key', 'scope', 'title', 'summary', 'provider', 'created_at'), row)) for row in rows]
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the batch workers: requests_per_minute on average,
+    bursts of up to burst. pause() holds every worker back, e.g. after a 429.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.interval = 60.0 / requests_per_minute
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self.resume_at:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.interval)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) * self.interval
+                else:
+                    wait = self.resume_at - now
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated = self.resume_at
+
+
+class SummaryGenerationError(RuntimeError):
+    """A report that still failed after the last retry; rate_limited counts the 429s on the way."""
+
+    def __init__(self, message: str, rate_limited: int):
+        super().__init__(message)
+        self.rate_limited = rate_limited
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or "rate limit" in str(error).lower()
+
+
+def retry_after(error: Exception):
+    """Seconds from the provider's Retry-After header, if it sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ExecutiveSummaryBatch:
+    """
+    Generates SummaryReports through a GenAIAssistant's ProviderRouter and
+    stores them in a SummaryStore.
+
+    At most max_workers requests run at once and the RateLimiter keeps the
+    job under requests_per_minute. Failures are retried up to max_retries
+    times with jittered exponential backoff; a rate-limit error also pauses
+    every worker for the provider's Retry-After (or the backoff), and when
+    every circuit is open the workers wait until the first one half-opens.
+    Build the assistant with max_retries=0 so SDK-level retries do not hide
+    rate limits from this loop. Reports
+    already stored for the data version with the same KPI context are
+    skipped unless force is set.
+    """
+
+    def __init__(self, assistant, store: SummaryStore, max_workers: int = 4, requests_per_minute: float = 60,
+                 max_retries: int = 3, backoff: float = 1.0, max_tokens: int = 300):
+        if assistant.router is None:
+            raise ValueError("Executive summaries need a live LLM provider (set an API key or LLM_BASE_URL).")
+        self.assistant = assistant
+        self.store = store
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(requests_per_minute, burst=max_workers)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_tokens = max_tokens
+        self._rng = random.Random()
+
+    def _circuit_wait(self) -> float:
+        """Seconds until the first open circuit lets a trial request through."""
+        now = time.monotonic()
+        waits = [e.breaker.opened_at + e.breaker.reset_timeout - now
+                 for e in self.assistant.router.endpoints if e.breaker.state == "open"]
+        return max(0.0, min(waits)) if waits else 0.0
+
+    def _generate(self, report: SummaryReport):
+        """
+        (summary, provider, attempts, rate limited count) for one report.
+
+        Raises:
+            SummaryGenerationError: If the last retry failed too.
+        """
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"{report.title}\n\nKPIs:\n{report.context}\n\nWrite the executive summary."},
+        ]
+        rate_limited = 0
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                summary, provider = self.assistant.router.complete(
+                    messages, max_tokens=self.max_tokens, temperature=0.3)
+                return summary.strip(), provider, attempt + 1, rate_limited
+            except Exception as e:
+                rate_limited += is_rate_limited(e)
+                if attempt == self.max_retries:
+                    raise SummaryGenerationError(str(e), rate_limited) from e
+                delay = self.backoff * 2 ** attempt * self._rng.uniform(0.5, 1.5)
+                if is_rate_limited(e):
+                    delay = retry_after(e) or delay
+                    self.limiter.pause(delay)
+                elif isinstance(e, NoProviderAvailable):
+                    delay = max(delay, self._circuit_wait())
+                    self.limiter.pause(delay)
+                logging.warning(f"{report.key}: attempt {attempt + 1} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def run(self, reports, data_version: str = None, force: bool = False) -> dict:
+        """Generates and stores the reports that are missing or stale; returns run statistics."""
+        start = time.monotonic()
+        todo = [r for r in reports if force or not self.store.has(r, data_version)]
+        stats = {'reports': len(reports), 'skipped': len(reports) - len(todo), 'generated': 0, 'failed': 0,
+                 'retries': 0, 'rate_limited': 0, 'errors': {}}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="summaries") as executor:
+            futures = {executor.submit(self._generate, report): report for report in todo}
+            for future in as_completed(futures):
+                report = futures[future]
+                try:
+                    summary, provider, attempts, rate_limited = future.result()
+                except SummaryGenerationError as e:
+                    logging.error(f"{report.key}: giving up after {self.max_retries + 1} attempts: {e}")
+                    stats['failed'] += 1
+                    stats['retries'] += self.max_retries
+                    stats['rate_limited'] += e.rate_limited
+                    stats['errors'][report.key] = str(e)
+                    continue
+                self.store.put(report, data_version, summary, provider, attempts)
+                stats['generated'] += 1
+                stats['retries'] += attempts - 1
+                stats['rate_limited'] += rate_limited
+        stats['elapsed_s'] = time.monotonic() - start
+        logging.info(f"Executive summaries: {stats['generated']} generated, {stats['skipped']} up to date, "
+                     f"{stats['failed']} failed in {stats['elapsed_s']:.1f}s")
+        return stats
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    from code.database_manager import MobilityDBManager
+    from code.mock_llm_server import MockLLMServer
+    from code.genai_assistant import GenAIAssistant
+
+    # Offline run: a local mock endpoint that rate-limits 30% of requests.
+    # python -m code.executive_summaries [mobility.db]
+    server = MockLLMServer(first_token_delay=0.3, failure_rate=0.3).start()
+    os.environ["OPENAI_API_KEY"] = "mock"
+    assistant = GenAIAssistant(cache_path=None, base_url=server.base_url, max_retries=0)
+
+    db_manager = MobilityDBManager(sys.argv[1] if len(sys.argv) > 1 else "mobility.db")
+    db_manager.ensure_rollup()
+    reports = build_reports(db_manager.conn, db_manager.get_top_pickup_zones(5))
+    store = SummaryStore()
+    batch = ExecutiveSummaryBatch(assistant, store, max_workers=4, requests_per_minute=300, backoff=0.5)
+    print(batch.run(reports, db_manager.data_version(), force=True))
+    print(f"{server.requests} requests served by the mock endpoint")
+    for entry in store.list(db_manager.data_version())[:3]:
+        print(f"\n[{entry['title']}] {entry['summary']}")
+    server.stop()
@@ -0,0 +1,134 @@
+import time
+import logging
+import numpy as np
+import pandas as pd
+from code.sketches import pickup_cell_key, decode_pickup_cell, PICKUP_CELL_SIZE
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class InMemoryAggregator:
+    """
+    Computes the fixed dashboard aggregations straight from the analyzer's
+    in-memory frame with np.bincount over compact integer keys, instead of a
+    round trip through SQLite.
+
+    Keys (hour, day, pickup cell) and the measure columns are extracted once
+    at construction; each get_* call is then a handful of bincounts and
+    returns the same DataFrame as the matching MobilityDBManager method.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.rows = len(df)
+        self.hour = df['pickup_hour'].to_numpy(dtype='int64')
+        self.day = df['pickup_day'].to_numpy(dtype='int64')
+        self.trip_distance = df['trip_distance'].to_numpy(dtype='float64')
+        self.total_amount = df['total_amount'].to_numpy(dtype='float64')
+        self.fare_amount = df['fare_amount'].to_numpy(dtype='float64')
+        self._lat = df['pickup_latitude'].to_numpy()
+        self._lon = df['pickup_longitude'].to_numpy()
+        self._cells = None
+
+    def _group(self, codes, size, columns):
+        """Counts and sums per code, restricted to non-empty groups."""
+        count = np.bincount(codes, minlength=size)
+        present = np.flatnonzero(count)
+        sums = [np.bincount(codes, weights=values, minlength=size)[present] for values in columns]
+        return present, count[present], sums
+
+    def get_hourly_demand(self) -> pd.DataFrame:
+        hours, count, (distance,) = self._group(self.hour, 24, [self.trip_distance])
+        return pd.DataFrame({
+            'pickup_hour': hours,
+            'trip_count': count,
+            'avg_distance': distance / count,
+        })
+
+    def get_revenue_trends(self) -> pd.DataFrame:
+        days, count, (revenue, fare) = self._group(self.day, 32, [self.total_amount, self.fare_amount])
+        return pd.DataFrame({
+            'pickup_day': days,
+            'total_revenue': revenue,
+            'avg_fare': fare / count,
+        })
+
+    def get_kpi_summary(self) -> dict:
+        trips = self.rows
+        return {
+            'total_trips': trips,
+            'total_revenue': float(self.total_amount.sum()),
+            'avg_fare': float(self.fare_amount.mean()) if trips else 0.0,
+            'avg_distance': float(self.trip_distance.mean()) if trips else 0.0,
+        }
+
+    def get_top_pickup_zones(self, limit: int = 10) -> pd.DataFrame:
+        if self._cells is None:
+            self._cells = np.unique(pickup_cell_key(self._lat, self._lon), return_inverse=True)
+        keys, inverse = self._cells
+        count = np.bincount(inverse, minlength=len(keys))
+        revenue = np.bincount(inverse, weights=self.total_amount, minlength=len(keys))
+
+        limit = min(limit, len(keys))
+        top = np.argpartition(-count, limit - 1)[:limit] if limit else np.empty(0, dtype='int64')
+        top = top[np.lexsort((keys[top], -count[top]))]
+        lat, lon = decode_pickup_cell(keys[top])
+        return pd.DataFrame({
+            'lat': lat,
+            'lon': lon,
+            'trip_count': count[top],
+            'avg_revenue': revenue[top] / count[top],
+            'cell_deg': PICKUP_CELL_SIZE,
+        })
+
+
+def benchmark(db_manager, aggregator: InMemoryAggregator, repeat: int = 5) -> pd.DataFrame:
+    """
+    Times each fixed aggregation through SQLite and through the in-memory
+    aggregator (best of `repeat`), and checks both return the same values.
+    """
+    calls = {
+        'get_hourly_demand': lambda target: target.get_hourly_demand(),
+        'get_revenue_trends': lambda target: target.get_revenue_trends(),
+        'get_top_pickup_zones': lambda target: target.get_top_pickup_zones(10),
+    }
+    sql_path = db_manager.aggregator
+    db_manager.aggregator = None
+    results = []
+    try:
+        for name, call in calls.items():
+            timings = {}
+            for label, target in (('sqlite', db_manager), ('numpy', aggregator)):
+                best = np.inf
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    out = call(target)
+                    best = min(best, time.perf_counter() - start)
+                timings[label] = (best, out)
+            sqlite_df, numpy_df = timings['sqlite'][1], timings['numpy'][1]
+            if name == 'get_top_pickup_zones':
+                matches = np.array_equal(sqlite_df['trip_count'].to_numpy(), numpy_df['trip_count'].to_numpy())
+            else:
+                matches = np.allclose(sqlite_df.to_numpy(dtype='float64'), numpy_df.to_numpy(dtype='float64'))
+            results.append({
+                'aggregation': name,
+                'sqlite_ms': timings['sqlite'][0] * 1000,
+                'numpy_ms': timings['numpy'][0] * 1000,
+                'speedup': timings['sqlite'][0] / timings['numpy'][0],
+                'matches': matches,
+            })
+    finally:
+        db_manager.aggregator = sql_path
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    from code.mobility_analytics import MobilityDataAnalyzer
+    from code.database_manager import MobilityDBManager
+
+    analyzer = MobilityDataAnalyzer("yellow_tripdata_2016-01.csv")
+    db_manager = MobilityDBManager()
+    db_manager.ingest_data(analyzer, nrows=500000)
+
+    print(f"\nBenchmark over {len(analyzer.data):,} rows:")
+    print(benchmark(db_manager, InMemoryAggregator(analyzer.data)).to_string(index=False))
@@ -1,90 +1,156 @@
 import os
+import time
 import logging
+import importlib.util
 from typing import Optional
-from dotenv import load_dotenv
+from functools import partial
+from code.llm_cache import LLMResponseCache
+from code.provider_router import ProviderEndpoint, ProviderRouter
+from code.intent_sql import IntentEngine
+from code.llm_metrics import REGISTRY
 
 
-load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Providers in priority order: (name, API key variable, SDK module, model,
+# max concurrent requests).
+PROVIDERS = [
+    ("groq", "GROQ_API_KEY", "groq", "llama-3.3-70b-versatile", 2),
+    ("deepseek", "DEEPSEEK_API_KEY", "openai", "deepseek-chat", 4),
+    ("openai", "OPENAI_API_KEY", "openai", "gpt-3.5-turbo", 4),
+]
+PROVIDER_BASE_URLS = {"deepseek": "https://api.deepseek.com"}
+
+_env_loaded = False
+
+
+def load_env():
+    """Reads .env into the environment once, on first use rather than at import."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 class GenAIAssistant:
     """
     Multi-provider AI Assistant for Mobility Analytics.
-    Priority: OpenAI > Gemini > DeepSeek > Mock
+    Priority: Groq > DeepSeek > OpenAI > Mock
+
+    Every provider with an API key and an installed SDK is registered with a
+    ProviderRouter, which hedges slow requests to the next provider and skips
+    failing ones (code/provider_router.py). SDKs are imported and clients
+    built on the first request, so an assistant that is never queried stays
+    cheap. A provider's endpoint can be overridden with <NAME>_BASE_URL.
     """
     
-    def __init__(self):
+    def __init__(self, cache_path: Optional[str] = "llm_cache.db", data_version: Optional[str] = None,
+                 base_url: Optional[str] = None, max_retries: Optional[int] = None, metrics=None):
+        load_env()
+        # Points the OpenAI-compatible client at another endpoint, e.g. a local
+        # mock server (code/mock_llm_server.py) for tests.
+        self.base_url = base_url or os.getenv("LLM_BASE_URL")
         self.groq_key = os.getenv("GROQ_API_KEY")
         self.openai_key = os.getenv("OPENAI_API_KEY")
         self.gemini_key = os.getenv("GEMINI_API_KEY")
         self.deepseek_key = os.getenv("DEEPSEEK_API_KEY")
         
-        print(f"DEBUG: GROQ_KEY: {bool(self.groq_key)}")
-        print(f"DEBUG: OPENAI_KEY: {bool(self.openai_key)}")
-        print(f"DEBUG: GEMINI_KEY: {bool(self.gemini_key)}")
-        print(f"DEBUG: DEEPSEEK_KEY: {bool(self.deepseek_key)}")
-        
-        self.client = None
         self.mode = "mock"
         self.provider = "none"
+        self.model = None
+        self.router = None
         
-
-        if self.groq_key:
-            try:
-                from groq import Groq
-                self.client = Groq(api_key=self.groq_key)
-                self.provider = "groq"
-                self.mode = "live"
-                self.model = "llama-3.3-70b-versatile"
-                logging.info("✅ Connected to Groq (Free Tier)")
-                print("✅ Groq API working! (Free)")
-            except ImportError:
-                logging.error("Groq library not installed. Run: pip install groq")
-                print("❌ Groq library missing. Run: pip install groq")
-            except Exception as e:
-                logging.error(f"Groq failed: {e}")
-                print(f"❌ Groq error: {e}")
+        endpoints = []
+        # With a fallback provider, SDK-level retries would only hide failures
+        # from the router's circuit breakers, so they are switched off. Callers
+        # with their own retry policy (e.g. batch jobs) pass max_retries=0.
+        if max_retries is None:
+            max_retries = 0 if sum(bool(os.getenv(p[1])) for p in PROVIDERS) > 1 else 2
+        for name, key_var, module, model, max_concurrency in PROVIDERS:
+            api_key = os.getenv(key_var)
+            if not api_key:
+                continue
+            # find_spec locates the SDK without importing it.
+            if importlib.util.find_spec(module) is None:
+                logging.error(f"{module} library not installed, skipping {name}. Run: pip install {module}")
+                continue
+            endpoints.append(ProviderEndpoint(name, model, partial(self._connect, name, api_key, max_retries),
+                                              max_concurrency))
+            logging.info(f"✅ Registered {name} ({model})")
         
-
-        if self.mode == "mock" and self.deepseek_key:
-            try:
-                from openai import OpenAI
-                self.client = OpenAI(api_key=self.deepseek_key, base_url="https://api.deepseek.com")
-                self.provider = "deepseek"
-                self.mode = "live"
-                self.model = "deepseek-chat"
-                logging.info("✅ Connected to DeepSeek")
-                print("✅ DeepSeek API working!")
-            except Exception as e:
-                logging.error(f"DeepSeek failed: {e}")
-                print(f"❌ DeepSeek error: {e}")
-        
-
-        if self.mode == "mock" and self.openai_key:
-            try:
-                from openai import OpenAI
-                self.client = OpenAI(api_key=self.openai_key)
-                self.provider = "openai"
-                self.mode = "live"
-                self.model = "gpt-3.5-turbo"
-                logging.info("✅ Connected to OpenAI")
-                print("✅ OpenAI API working!")
-            except Exception as e:
-                logging.error(f"OpenAI failed: {e}")
-                print(f"❌ OpenAI error: {e}")
-        
-        if self.mode == "mock":
-            logging.warning("⚠️ All APIs failed. Using MOCK mode.")
-            print("⚠️ Running in MOCK mode (no API connected)")
-
-    def generate_insight(self, context_data: str, prompt: str) -> str:
-        """Generate insight from data with improved contextual prompting."""
-        if self.mode == "mock":
-            return self._mock_insight_response(prompt)
+        if endpoints:
+            # The primary provider names the cache scope and error messages.
+            self.router = ProviderRouter(endpoints)
+            self.provider, self.model, self.mode = endpoints[0].name, endpoints[0].model, "live"
+        else:
+            logging.warning("⚠️ No API configured. Using MOCK mode.")
         
-
+        # Answers are cached per provider/model and data version; set
+        # data_version to the loaded dataset's version so new data misses.
+        self.data_version = data_version
+        self.cache = LLMResponseCache(cache_path) if cache_path and self.mode == "live" else None
+        # Optional MetricKnowledgeBase (code/metric_index.py); when set, the
+        # facts most relevant to each question are added to insight prompts.
+        self.knowledge = None
+        # Token budget for the query result part of insight prompts; None uses
+        # result_summarizer.CONTEXT_TOKEN_BUDGET.
+        self.context_tokens = None
+        # Common questions are answered by templates; last_sql_source records
+        # where the latest text_to_sql answer came from (rules/cache/llm/mock).
+        self.intents = IntentEngine()
+        self.last_sql_source = None
+        # Every text_to_sql/generate_insight call is recorded here
+        # (code/llm_metrics.py); by default the process-wide registry.
+        self.metrics = metrics if metrics is not None else REGISTRY
+
+    @property
+    def client(self):
+        """SDK client of the primary provider, created on first access."""
+        return self.router.endpoints[0].client if self.router else None
+
+    def _connect(self, provider: str, api_key: str, max_retries: int):
+        base_url = os.getenv(f"{provider.upper()}_BASE_URL") or self.base_url or PROVIDER_BASE_URLS.get(provider)
+        if provider == "groq":
+            from groq import Groq
+            return Groq(api_key=api_key, base_url=base_url, max_retries=max_retries)
+        from openai import OpenAI
+        return OpenAI(api_key=api_key, base_url=base_url, max_retries=max_retries)
+
+    def _cached(self, kind: str, question: str, context: str = None) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.get(kind, question, self.provider, self.model, self.data_version, context)
+
+    def _store(self, kind: str, question: str, response: str, context: str = None):
+        if self.cache is not None and response:
+            self.cache.put(kind, question, self.provider, self.model, response, self.data_version, context)
+
+    def _record(self, operation: str, start: float, provider: str, trace: dict = None, **fields):
+        """Adds a call that began at start (perf_counter) to self.metrics, with what the router traced."""
+        trace = trace or {}
+        usage = trace.get('usage')
+        if usage is not None:
+            fields.setdefault('prompt_tokens', usage[0])
+            fields.setdefault('completion_tokens', usage[1])
+        # Rule-based and mock answers involve no model.
+        model = trace.get('model', None if provider in ("rules", "mock") else self.model)
+        self.metrics.record(operation, trace.get('provider', provider), model,
+                            time.perf_counter() - start, retries=max(trace.get('attempts', 1) - 1, 0),
+                            first_token_s=trace.get('first_token_s'), **fields)
+
+    def _context_text(self, context_data) -> str:
+        """Query results as prompt text: DataFrames are summarized, strings capped, both to context_tokens."""
+        # Imported here: the summarizer needs pandas, which callers with a
+        # query result have loaded anyway.
+        from code.result_summarizer import summarize_result, truncate_to_tokens, CONTEXT_TOKEN_BUDGET
+        budget = self.context_tokens or CONTEXT_TOKEN_BUDGET
+        if isinstance(context_data, str):
+            return truncate_to_tokens(context_data, budget)
+        return summarize_result(context_data, budget)
+
+    def _insight_messages(self, context_data: str, prompt: str):
+        """System and user messages for an insight request."""
         system_msg = """You are an expert data analyst specializing in NYC taxi and urban mobility analytics.
 
 Your role:
@@ -110,7 +176,9 @@ Rules:
         if "No direct SQL mapping" in context_data:
             data_summary = "No specific data query was executed. Provide general insights about NYC taxi patterns based on your knowledge of the January 2016 dataset."
         else:
-            data_summary = f"Query Results:\n{context_data[:1500]}"
+            data_summary = f"Query Results:\n{context_data}"
+        if self.knowledge is not None:
+            data_summary += f"\n\nRelevant Metrics:\n{self.knowledge.context_for(prompt)}"
         
         user_msg = f"""{data_summary}
 
@@ -120,56 +188,132 @@ Provide a data-driven answer with:
 1. Key finding (with numbers)
 2. Why it matters
 3. Actionable recommendation"""
+        return system_msg, user_msg
+
+    def generate_insight(self, context_data, prompt: str) -> str:
+        """Generate insight from data (a query result DataFrame or text) with improved contextual prompting."""
+        start = time.perf_counter()
+        if self.mode == "mock":
+            self._record("insight", start, "mock")
+            return self._mock_insight_response(prompt)
+        
+        context_data = self._context_text(context_data)
+        cached = self._cached("insight", prompt, context_data)
+        if cached is not None:
+            self._record("insight", start, "cache", cache="hit")
+            return cached
+        
+
+        system_msg, user_msg = self._insight_messages(context_data, prompt)
+        cache = "miss" if self.cache is not None else None
+        trace = {}
         
         try:
-            if self.provider == "groq":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_msg},
-                        {"role": "user", "content": user_msg}
-                    ],
-                    max_tokens=600,
-                    temperature=0.4
-                )
-                return response.choices[0].message.content
-            
-            elif self.provider == "openai" or self.provider == "deepseek":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_msg},
-                        {"role": "user", "content": user_msg}
-                    ],
-                    max_tokens=400,
-                    temperature=0.4
-                )
-                return response.choices[0].message.content
-            
-            elif self.provider == "gemini":
-                full_prompt = f"{system_msg}\n\n{user_msg}"
-                response = self.client.generate_content(full_prompt)
-                return response.text
-                
+            insight, _ = self.router.complete(
+                [
+                    {"role": "system", "content": system_msg},
+                    {"role": "user", "content": user_msg}
+                ],
+                trace=trace,
+                max_tokens=600 if self.provider == "groq" else 400,
+                temperature=0.4
+            )
         except Exception as e:
-            error_msg = str(e).lower()
-            logging.error(f"{self.provider} error: {e}")
-            
-
-            if "quota" in error_msg or "limit" in error_msg or "rate" in error_msg:
-                return f"**⚠️ {self.provider.upper()} quota exceeded.**\n\n{self._mock_insight_response(prompt)}"
-            elif "402" in str(e) or "insufficient" in error_msg:
-                return f"**⚠️ {self.provider.upper()} balance insufficient.**\n\n{self._mock_insight_response(prompt)}"
-            else:
-                return f"**❌ API Error:** {str(e)[:100]}\n\n{self._mock_insight_response(prompt)}"
+            self._record("insight", start, self.provider, trace, error=True, cache=cache)
+            return self._insight_error(e, prompt)
+        
+        self._record("insight", start, self.provider, trace, cache=cache)
+        self._store("insight", prompt, insight, context_data)
+        return insight
+
+    def generate_insight_stream(self, context_data, prompt: str):
+        """
+        Streaming variant of generate_insight: yields the answer in pieces as
+        the provider sends them, so the UI can render the first words at once.
+        Cached answers and mock responses are yielded in one piece.
+        Streams report no token usage, so tokens are estimated from length.
+        The call is recorded however the stream ends: finished, failed, or
+        cancelled because the caller stopped reading.
+        """
+        start = time.perf_counter()
+        if self.mode == "mock":
+            self._record("insight", start, "mock")
+            yield self._mock_insight_response(prompt)
+            return
+        
+        context_data = self._context_text(context_data)
+        cached = self._cached("insight", prompt, context_data)
+        if cached is not None:
+            self._record("insight", start, "cache", cache="hit")
+            yield cached
+            return
         
-        return self._mock_insight_response(prompt)
+        from code.result_summarizer import estimate_tokens
+        system_msg, user_msg = self._insight_messages(context_data, prompt)
+        cache = "miss" if self.cache is not None else None
+        prompt_tokens = estimate_tokens(system_msg) + estimate_tokens(user_msg)
+        trace = {}
+        parts = []
+        # Stays "cancelled" if the caller closes the generator mid-stream.
+        outcome, error = "cancelled", None
+        try:
+            for token in self.router.stream(
+                [
+                    {"role": "system", "content": system_msg},
+                    {"role": "user", "content": user_msg}
+                ],
+                trace=trace,
+                max_tokens=600 if self.provider == "groq" else 400,
+                temperature=0.4
+            ):
+                parts.append(token)
+                yield token
+            outcome = "done"
+        except Exception as e:
+            outcome, error = "error", e
+        finally:
+            self._record("insight", start, self.provider, trace, error=outcome == "error",
+                         cancelled=outcome == "cancelled", cache=cache, prompt_tokens=prompt_tokens,
+                         completion_tokens=estimate_tokens("".join(parts)))
+        
+        if error is not None:
+            yield ("\n\n" if parts else "") + self._insight_error(error, prompt)
+            return
+        self._store("insight", prompt, "".join(parts), context_data)
+
+    def _insight_error(self, e: Exception, prompt: str) -> str:
+        """User-facing message for a failed insight call, with the mock answer as fallback."""
+        error_msg = str(e).lower()
+        logging.error(f"{self.provider} error: {e}")
+        
+
+        if "quota" in error_msg or "limit" in error_msg or "rate" in error_msg:
+            return f"**⚠️ {self.provider.upper()} quota exceeded.**\n\n{self._mock_insight_response(prompt)}"
+        elif "402" in str(e) or "insufficient" in error_msg:
+            return f"**⚠️ {self.provider.upper()} balance insufficient.**\n\n{self._mock_insight_response(prompt)}"
+        else:
+            return f"**❌ API Error:** {str(e)[:100]}\n\n{self._mock_insight_response(prompt)}"
 
     def text_to_sql(self, natural_language_query: str) -> str:
         """Convert natural language to SQL with improved accuracy."""
+        start = time.perf_counter()
+        sql = self.intents.to_sql(natural_language_query)
+        if sql is not None:
+            self.last_sql_source = "rules"
+            self._record("sql", start, "rules")
+            return sql
+        
         if self.mode == "mock":
+            self.last_sql_source = "mock"
+            self._record("sql", start, "mock")
             return self._mock_sql_response(natural_language_query)
         
+        cached = self._cached("sql", natural_language_query)
+        if cached is not None:
+            self.last_sql_source = "cache"
+            self._record("sql", start, "cache", cache="hit")
+            return cached
+        
 
         system_prompt = """You are an expert SQL analyst. Convert natural language questions to SQLite queries.
 
@@ -177,8 +321,8 @@ DATABASE SCHEMA:
 Table: trips
 
 Columns:
-- tpep_pickup_datetime (DATETIME) - Pickup timestamp
-- tpep_dropoff_datetime (DATETIME) - Dropoff timestamp
+- tpep_pickup_datetime (INTEGER) - Pickup time as Unix epoch seconds (indexed)
+- tpep_dropoff_datetime (INTEGER) - Dropoff time as Unix epoch seconds (indexed)
 - trip_distance (FLOAT) - Trip distance in miles
 - fare_amount (FLOAT) - Base fare amount
 - total_amount (FLOAT) - Total charge (fare + tips + tolls)
@@ -209,34 +353,22 @@ RULES:
 - Always include ORDER BY for rankings
 - Use meaningful column aliases
 - Add LIMIT when asking for "top N" or "busiest"
+- Filter time ranges on the raw epoch columns, e.g. tpep_pickup_datetime >= strftime('%s', '2016-01-05 17:00:00'), and use datetime(tpep_pickup_datetime, 'unixepoch') only for display
 """
 
+        cache = "miss" if self.cache is not None else None
+        trace = {}
         try:
-            if self.provider == "groq":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": natural_language_query}
-                    ],
-                    max_tokens=250,
-                    temperature=0.1
-                )
-                sql = response.choices[0].message.content.strip()
-            elif self.provider == "openai" or self.provider == "deepseek":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": natural_language_query}
-                    ],
-                    max_tokens=200,
-                    temperature=0.1
-                )
-                sql = response.choices[0].message.content.strip()
-            elif self.provider == "gemini":
-                response = self.client.generate_content(f"{system_prompt}\n\nQuery: {natural_language_query}")
-                sql = response.text.strip()
+            sql, _ = self.router.complete(
+                [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": natural_language_query}
+                ],
+                trace=trace,
+                max_tokens=250 if self.provider == "groq" else 200,
+                temperature=0.1
+            )
+            sql = sql.strip()
             
 
             if "```" in sql:
@@ -245,13 +377,16 @@ RULES:
                     sql = sql[4:]
                 sql = sql.strip()
             
+            self._store("sql", natural_language_query, sql)
+            self.last_sql_source = "llm"
+            self._record("sql", start, self.provider, trace, cache=cache)
             return sql
                 
         except Exception as e:
             logging.error(f"{self.provider} SQL error: {e}")
+            self._record("sql", start, self.provider, trace, error=True, cache=cache)
+            self.last_sql_source = "mock"
             return self._mock_sql_response(natural_language_query)
-        
-        return self._mock_sql_response(natural_language_query)
 
     def _mock_insight_response(self, prompt: str) -> str:
         p = prompt.lower()
@@ -4,6 +4,7 @@ import seaborn as sns
 import sqlite3
 from mobility_analytics import MobilityDataAnalyzer
 from database_manager import MobilityDBManager
+from olap_cube import MobilityCube
 import os
 
 DATASET_PATH = "yellow_tripdata_2016-01.csv"
@@ -28,13 +29,10 @@ def load_and_ingest_data():
             raise FileNotFoundError(f"Neither {DATASET_PATH} nor dataset_sample.csv found.")
 
     analyzer = MobilityDataAnalyzer(path_to_use)
-    df = analyzer.load_data(nrows=SAMPLE_SIZE)
-    analyzer.clean_data()
-    analyzer.feature_engineering()
     
     print("Ingesting data into Database...")
     db_manager = MobilityDBManager(DB_PATH)
-    db_manager.ingest_data(analyzer)
+    db_manager.ingest_data(analyzer, nrows=SAMPLE_SIZE)
     return db_manager, analyzer.data
 
 def run_sql_queries(db_manager):
@@ -146,9 +144,7 @@ def generate_visualizations(df):
     plt.close()
 
     plt.figure(figsize=(12, 8))
-    heatmap_data = df.pivot_table(index='pickup_weekday', columns='pickup_hour', values='VendorID', aggfunc='count')
-    days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    heatmap_data = heatmap_data.reindex(days_order)
+    heatmap_data = MobilityCube.from_frame(df).pivot('weekday', 'hour')
     
     sns.heatmap(heatmap_data, cmap="YlOrRd", annot=False, fmt="d")
     plt.title('Hourly Demand Heatmap (Day vs Hour)')
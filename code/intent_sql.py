@@ -0,0 +1,335 @@
+import re
+import logging
+from code.llm_cache import normalize_question
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Below this share of understood words, text_to_sql asks the LLM instead.
+CONFIDENCE_THRESHOLD = 0.75
+
+# measure -> (column, aggregate when none is named, output name, phrases that ask for it).
+# Trips are counted; "total" trips is the same count and no other aggregate applies.
+MEASURES = {
+    'trips': (None, "COUNT", "trips", ["trips", "rides", "pickups", "demand", "volume", "busiest",
+                                       "busy", "quietest", "how many", "number of", "count", "traffic"]),
+    'revenue': ("total_amount", "SUM", "revenue", ["revenue", "earnings", "income", "money", "total amount",
+                                                   "sales"]),
+    'fare': ("fare_amount", "AVG", "fare", ["fare", "fares", "price", "prices", "cost"]),
+    'distance': ("trip_distance", "AVG", "distance", ["distance", "distances", "miles", "how far", "trip length"]),
+    'tip': ("tip_amount", "AVG", "tip", ["tip", "tips", "tipping", "gratuity"]),
+    'duration': ("trip_duration_min", "AVG", "duration_min", ["duration", "how long", "minutes", "trip time"]),
+    'passengers': ("passenger_count", "AVG", "passengers", ["passengers", "passenger", "occupancy"]),
+}
+
+# Words naming the aggregate of the measure right after them ("total fare",
+# "sum of tips", "average revenue", "maximum distance").
+AGGREGATE_WORDS = {
+    "total": "SUM", "sum": "SUM", "average": "AVG", "avg": "AVG", "mean": "AVG",
+    "maximum": "MAX", "max": "MAX", "highest": "MAX", "largest": "MAX", "biggest": "MAX", "longest": "MAX",
+    "minimum": "MIN", "min": "MIN", "lowest": "MIN", "smallest": "MIN", "shortest": "MIN",
+}
+# These rank groups instead when the question has a group-by ("day with the highest revenue").
+RANKING_AGGREGATES = {"highest", "largest", "biggest", "longest", "lowest", "smallest", "shortest"}
+# Output name prefix per aggregate, e.g. avg_fare, total_tip, max_distance.
+AGGREGATE_PREFIX = {"SUM": "total", "AVG": "avg", "MAX": "max", "MIN": "min"}
+
+# dimension -> (column, phrases)
+DIMENSIONS = {
+    # "peak"/"rush" are ranking words, so "peak hours" ranks the hours.
+    'hour': ("pickup_hour", ["hour", "hours", "hourly", "time of day", "times of day", "time", "times"]),
+    'weekday': ("pickup_weekday", ["weekday", "day of week", "day of the week", "days of the week", "weekdays"]),
+    'day': ("pickup_day", ["day", "days", "daily", "date", "dates", "per day", "each day", "trend", "trends",
+                           "over time"]),
+}
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+NUMBER_WORDS = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+                'eight': 8, 'nine': 9, 'ten': 10, 'twenty': 20}
+# Parts of the day as [start, end) pickup hours; night wraps past midnight.
+DAY_PARTS = {'morning': (6, 12), 'afternoon': (12, 17), 'evening': (17, 22), 'night': (22, 6),
+             'late night': (0, 5)}
+
+DESCENDING = ["top", "highest", "most", "busiest", "peak", "rush", "best", "largest", "biggest", "longest", "maximum",
+              "max"]
+ASCENDING = ["lowest", "least", "quietest", "fewest", "worst", "smallest", "shortest", "minimum", "min", "slowest"]
+# Words that carry no slot but do not make the question harder to answer.
+FILLER = {
+    "what", "whats", "which", "when", "is", "are", "was", "were", "the", "a", "an", "of", "by", "per", "for",
+    "in", "on", "at", "show", "me", "give", "list", "get", "find", "tell", "how", "does", "do", "did",
+    "during", "and", "to", "with", "each", "every", "all", "overall",
+    "taxi", "taxis", "cab", "cabs", "yellow", "nyc", "data", "dataset", "pattern",
+    "patterns", "distribution", "breakdown", "across", "has", "have", "had", "see",
+    "compare", "between", "from", "january", "jan", "2016", "month", "this", "that", "there", "it",
+    "i", "can", "you", "please", "amount", "generate", "generated", "most", "much", "many",
+    "rank", "ranked", "ranking", "order", "sorted", "th", "st", "nd", "rd", "only", "just",
+    "s", "trip", "ride", "be", "will", "would", "value", "values", "level", "levels",
+}
+# Left over, these are a condition the template cannot express ("over 10
+# miles", "zero tip", "weekdays vs weekends"); ignoring one would answer a
+# different question, so the question goes to the LLM.
+CONSTRAINT_WORDS = {
+    "over", "under", "above", "below", "more", "less", "than", "greater", "fewer", "exceeding", "within",
+    "zero", "no", "not", "without", "except", "excluding", "vs", "versus", "first", "last", "before",
+    "after", "since", "until",
+}
+
+
+class SQLIntent:
+    """
+    A parsed question: (measure, aggregate) pairs, optional group-by
+    dimension, filters and ranking, plus its SQL.
+    """
+
+    def __init__(self, measures, dimension, filters, order, limit, confidence, unknown_words):
+        self.measures = measures
+        self.dimension = dimension
+        self.filters = filters
+        self.order = order
+        self.limit = limit
+        self.confidence = confidence
+        self.unknown_words = unknown_words
+        self.sql = self._to_sql()
+
+    @staticmethod
+    def alias(measure: str, aggregate: str) -> str:
+        column, default, name, _ = MEASURES[measure]
+        if aggregate == default and measure in ('trips', 'revenue'):
+            return name
+        return f"{AGGREGATE_PREFIX[aggregate]}_{name}"
+
+    def _to_sql(self) -> str:
+        select = [f"{'COUNT(*)' if m == 'trips' else f'{agg}({MEASURES[m][0]})'} AS {self.alias(m, agg)}"
+                  for m, agg in self.measures]
+        where = f" WHERE {' AND '.join(self.filters)}" if self.filters else ""
+        if self.dimension is None:
+            return f"SELECT {', '.join(select)} FROM trips{where}"
+        column = DIMENSIONS[self.dimension][0]
+        if self.order:
+            order = f"{self.alias(*self.measures[0])} {self.order}"
+        elif self.dimension == 'weekday':
+            order = f"CASE {column} " + " ".join(
+                f"WHEN '{d.capitalize()}' THEN {i}" for i, d in enumerate(WEEKDAYS)) + " END"
+        else:
+            order = column
+        sql = f"SELECT {column}, {', '.join(select)} FROM trips{where} GROUP BY {column} ORDER BY {order}"
+        return f"{sql} LIMIT {self.limit}" if self.limit else sql
+
+
+class IntentEngine:
+    """
+    Rule-based NL-to-SQL for dashboard-style questions.
+
+    Phrases are matched against fixed vocabularies to fill slots: measures
+    (trips, revenue, fare, distance, tip, duration, passengers) with the
+    aggregate named before them (total/sum, average/mean, maximum, minimum;
+    otherwise a count of trips, total revenue and averages of the rest), a
+    group-by dimension (hour, day, weekday), ranking direction and top-N,
+    and time filters (day of month or ranges of days, weekdays, weekends,
+    parts of the day, hour ranges). Confidence is the share of the
+    question's words that were understood, so anything mentioning concepts
+    outside the vocabulary (zones, payment types, airports...) falls back
+    to the LLM. A leftover number or condition word ("over", "zero", "vs")
+    sets it to 0, since the template would silently drop that condition.
+    """
+
+    def __init__(self, threshold: float = CONFIDENCE_THRESHOLD):
+        self.threshold = threshold
+        self._measure_phrases = self._phrases({m: words for m, (_, _, _, words) in MEASURES.items()})
+        self._dimension_phrases = self._phrases({d: words for d, (_, words) in DIMENSIONS.items()})
+
+    @staticmethod
+    def _phrases(vocabulary: dict):
+        """(regex, slot) pairs, longest phrase first so 'trip time' wins over 'time'."""
+        pairs = [(phrase, slot) for slot, phrases in vocabulary.items() for phrase in phrases]
+        pairs.sort(key=lambda p: -len(p[0]))
+        return [(re.compile(rf"\b{re.escape(phrase)}\b"), slot) for phrase, slot in pairs]
+
+    @staticmethod
+    def _consume(text: str, match) -> str:
+        """Blanks out a matched span so later rules and the coverage count skip it."""
+        return text[:match.start()] + " " * (match.end() - match.start()) + text[match.end():]
+
+    def _filters(self, text: str):
+        filters = []
+        first_days = re.search(r"\bfirst\s+(\d{1,2}|" + "|".join(NUMBER_WORDS) + r")\s+days\b", text)
+        if first_days:
+            count = first_days.group(1)
+            count = int(count) if count.isdigit() else NUMBER_WORDS[count]
+            if 1 <= count <= 31:
+                filters.append(f"pickup_day BETWEEN 1 AND {count}")
+                text = self._consume(text, first_days)
+        day_range = re.search(r"\b(?:days?|jan(?:uary)?)\s+(\d{1,2})(?:st|nd|rd|th)?\s*(?:to|through|and|-)\s*"
+                              r"(?:days?\s+|jan(?:uary)?\s+)?(\d{1,2})(?:st|nd|rd|th)?\b", text)
+        if day_range:
+            low, high = sorted(int(d) for d in day_range.groups())
+            filters.append(f"pickup_day BETWEEN {low} AND {high}")
+            text = self._consume(text, day_range)
+        else:
+            day = re.search(r"\b(?:on\s+)?(?:day|jan(?:uary)?)\s+(\d{1,2})(?:st|nd|rd|th)?\b", text)
+            if day and 1 <= int(day.group(1)) <= 31:
+                filters.append(f"pickup_day = {int(day.group(1))}")
+                text = self._consume(text, day)
+
+        week = re.search(r"\b(first|second|third|fourth|last)\s+week\b", text)
+        if week:
+            start = {'first': 1, 'second': 8, 'third': 15, 'fourth': 22, 'last': 25}[week.group(1)]
+            filters.append(f"pickup_day BETWEEN {start} AND {min(start + 6, 31)}")
+            text = self._consume(text, week)
+
+        hour_range = re.search(r"\b(?:between|from)\s+(\d{1,2})\s*(am|pm)?\s*(?:and|to|-)\s*(\d{1,2})\s*(am|pm)?\b",
+                               text)
+        if hour_range:
+            start, start_half, end, end_half = hour_range.groups()
+            start, end = self._to_hour(int(start), start_half or end_half), self._to_hour(int(end), end_half)
+            if start is not None and end is not None:
+                filters.append(self._hour_filter(start, end))
+                text = self._consume(text, hour_range)
+        else:
+            at = re.search(r"\b(?:at\s+)?(\d{1,2})\s*(am|pm)\b", text)
+            if at and self._to_hour(int(at.group(1)), at.group(2)) is not None:
+                filters.append(f"pickup_hour = {self._to_hour(int(at.group(1)), at.group(2))}")
+                text = self._consume(text, at)
+
+        for part in sorted(DAY_PARTS, key=len, reverse=True):
+            match = re.search(rf"\b(?:in\s+the\s+)?{part}s?(?:\s+rush(?:\s+hours?)?)?\b", text)
+            if match:
+                filters.append(self._hour_filter(*DAY_PARTS[part]))
+                text = self._consume(text, match)
+                break
+
+        weekend = re.search(r"\bweekends?\b", text)
+        if weekend:
+            filters.append("pickup_weekday IN ('Saturday', 'Sunday')")
+            text = self._consume(text, weekend)
+        else:
+            workdays = re.search(r"\b(?:workdays?|business days?|week ?days)\b", text)
+            named = [d for d in WEEKDAYS if re.search(rf"\b{d}s?\b", text)]
+            if named:
+                listed = ", ".join(f"'{d.capitalize()}'" for d in named)
+                filters.append(f"pickup_weekday IN ({listed})")
+                for d in named:
+                    text = self._consume(text, re.search(rf"\b{d}s?\b", text))
+            elif workdays and re.search(r"\b(?:on|during)\s+(?:workdays?|business days?|week ?days)\b", text):
+                filters.append("pickup_weekday NOT IN ('Saturday', 'Sunday')")
+                text = self._consume(text, workdays)
+        return filters, text
+
+    @staticmethod
+    def _aggregate(text: str, measure: str, start: int, end: int, grouped: bool):
+        """
+        (aggregate, text) for the measure named at text[start:end]: the
+        aggregate word right before it, if any applies, is consumed; else AVG
+        for "<measure> per trip", else the measure's default.
+        """
+        default = MEASURES[measure][1]
+        match = re.search(r"\b(" + "|".join(AGGREGATE_WORDS) + r")\s+(?:(?:of|the|trip|ride)\s+)*$", text[:start])
+        if match is None or (grouped and match.group(1) in RANKING_AGGREGATES):
+            if measure != 'trips' and re.match(r"\s+per\s+(?:trip|ride)s?\b", text[end:]):
+                return "AVG", text
+            return default, text
+        aggregate = AGGREGATE_WORDS[match.group(1)]
+        if measure == 'trips':
+            if aggregate != "SUM":
+                return default, text
+            aggregate = default
+        return aggregate, text[:match.start(1)] + " " * len(match.group(1)) + text[match.end(1):]
+
+    @staticmethod
+    def _to_hour(hour: int, half: str):
+        if half == "am":
+            hour = 0 if hour == 12 else hour
+        elif half == "pm":
+            hour = hour if hour == 12 else hour + 12
+        return hour if 0 <= hour <= 24 else None
+
+    @staticmethod
+    def _hour_filter(start: int, end: int) -> str:
+        if start < end:
+            return f"pickup_hour BETWEEN {start} AND {end - 1}"
+        return f"(pickup_hour >= {start} OR pickup_hour < {end})"
+
+    def parse(self, question: str) -> SQLIntent:
+        text = f" {normalize_question(question)} "
+        words = text.split()
+
+        filters, text = self._filters(text)
+
+        limit, order = None, None
+        top = re.search(r"\b(top|bottom)\s+(\d+|" + "|".join(NUMBER_WORDS) + r")\b", text)
+        if top:
+            count = top.group(2)
+            limit = int(count) if count.isdigit() else NUMBER_WORDS[count]
+            order = "ASC" if top.group(1) == "bottom" else "DESC"
+            text = self._consume(text, top)
+
+        rank, direction = None, None
+        for words_list, words_direction in ((ASCENDING, "ASC"), (DESCENDING, "DESC")):
+            rank = re.search(r"\b(" + "|".join(words_list) + r")\b", text)
+            if rank:
+                direction = words_direction
+                break
+
+        named = []
+        for pattern, measure in self._measure_phrases:
+            match = pattern.search(text)
+            while match:
+                named.append((match.start(), match.end(), measure))
+                text = self._consume(text, match)
+                match = pattern.search(text)
+
+        dimension = None
+        for pattern, name in self._dimension_phrases:
+            match = pattern.search(text)
+            if match:
+                dimension = dimension or name
+                text = self._consume(text, match)
+        if dimension is None and re.search(r"\bwhen\b", text) and (order or rank):
+            dimension = 'hour'
+
+        measures = []
+        for start, end, measure in sorted(named):
+            aggregate, text = self._aggregate(text, measure, start, end, dimension is not None)
+            if (measure, aggregate) not in measures:
+                measures.append((measure, aggregate))
+        if not measures and dimension is not None:
+            measures = [('trips', "COUNT")]
+
+        # A ranking word that did not become an aggregate ranks the groups.
+        # "busiest"/"quietest" were consumed as the trips measure but still rank.
+        if rank and (text[rank.start():rank.end()].strip() or rank.group(1) in ("busiest", "quietest")):
+            order = order or direction
+            if dimension is not None:
+                text = self._consume(text, rank)
+        if order and dimension is not None and limit is None:
+            # "busiest hour" wants one row, "peak hours" a short list.
+            plural = re.search(r"\b(hours|days|weekdays|times)\b", " ".join(words))
+            limit = 5 if plural else 1
+
+        unknown = [w for w in text.split() if w not in FILLER]
+        content = [w for w in words if w not in FILLER]
+        constraints = [w for w in unknown if w.isdigit() or w in NUMBER_WORDS or w in CONSTRAINT_WORDS]
+        if not measures or constraints:
+            confidence = 0.0
+        else:
+            confidence = 1.0 - len(unknown) / max(len(content), 1)
+        return SQLIntent(measures, dimension, filters, order, limit, round(confidence, 2), unknown)
+
+    def to_sql(self, question: str):
+        """SQL for question if it is understood with enough confidence, else None."""
+        intent = self.parse(question)
+        if intent.confidence < self.threshold:
+            logging.info(f"Intent confidence {intent.confidence:.2f} for {question!r} "
+                         f"(unknown: {intent.unknown_words}); deferring to the LLM.")
+            return None
+        return intent.sql
+
+
+if __name__ == "__main__":
+    engine = IntentEngine()
+    for question in ["What's the average fare?", "Top 5 busiest hours", "Which day had the highest revenue?",
+                     "Show revenue by day", "Average tip on weekends by hour", "How many trips on January 5th?",
+                     "Average distance between 5pm and 8pm on Fridays", "Which payment type tips the most?",
+                     "Total tips by weekday", "Average fare for trips over 10 miles"]:
+        intent = engine.parse(question)
+        print(f"{question}\n  confidence {intent.confidence:.2f}: {intent.sql}")
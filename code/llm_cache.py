@@ -0,0 +1,168 @@
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CACHE_TABLE = "llm_cache"
+EMBEDDING_DIM = 256
+
+
+def normalize_question(text: str) -> str:
+    """Lower-cases, strips punctuation and collapses whitespace: 'Top 5 busiest hours?' -> 'top 5 busiest hours'."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def embed_question(text: str, dim: int = EMBEDDING_DIM):
+    """
+    Cheap local embedding: hashed character trigrams of the normalized text,
+    L2-normalized, so cosine similarity is a dot product. Catches rephrasings
+    and typos, not synonyms. Returns a float32 numpy vector.
+    """
+    # numpy is imported on first use, so importing the assistant stays cheap.
+    import numpy as np
+    padded = f"  {normalize_question(text)}  "
+    vector = np.zeros(dim, dtype='float32')
+    for i in range(len(padded) - 2):
+        digest = hashlib.blake2b(padded[i:i + 3].encode(), digest_size=4).digest()
+        vector[int.from_bytes(digest, 'little') % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class LLMResponseCache:
+    """
+    Disk-backed cache of LLM answers (SQLite), shared across app restarts.
+
+    Entries are keyed on (kind, normalized question, provider, model, data
+    version, context hash), so a new dataset or model never returns stale
+    answers. Entries expire after ttl_seconds and the least recently used are
+    evicted beyond max_entries. With similarity_threshold set, a miss also
+    checks entries of the same scope whose question embedding has cosine
+    similarity at or above the threshold.
+    """
+
+    def __init__(self, path: str = "llm_cache.db", ttl_seconds: float = 7 * 24 * 3600,
+                 max_entries: int = 5000, similarity_threshold: float = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+                    key TEXT PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    embedding BLOB,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hit_count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{CACHE_TABLE}_scope ON {CACHE_TABLE} (scope)")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{CACHE_TABLE}_access ON {CACHE_TABLE} (last_access)")
+
+    @staticmethod
+    def _scope(kind, provider, model, data_version, context) -> str:
+        context_hash = hashlib.sha1(context.encode()).hexdigest() if context else ""
+        return json.dumps([kind, provider, model, data_version, context_hash])
+
+    @staticmethod
+    def _key(scope: str, question: str) -> str:
+        return hashlib.sha1(f"{scope}|{question}".encode()).hexdigest()
+
+    def get(self, kind: str, question: str, provider: str, model: str,
+            data_version: str = None, context: str = None):
+        """Cached response for the question, or None."""
+        scope = self._scope(kind, provider, model, data_version, context)
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT key, response, created_at FROM {CACHE_TABLE} WHERE key = ?",
+                (self._key(scope, normalized),)
+            ).fetchone()
+            semantic = False
+            if row is None and self.similarity_threshold is not None:
+                row = self._nearest(scope, question)
+                semantic = row is not None
+            if row is not None and now - row[2] > self.ttl_seconds:
+                with self.conn:
+                    self.conn.execute(f"DELETE FROM {CACHE_TABLE} WHERE key = ?", (row[0],))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            with self.conn:
+                self.conn.execute(
+                    f"UPDATE {CACHE_TABLE} SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?",
+                    (now, row[0])
+                )
+            self.hits += 1
+            self.semantic_hits += semantic
+            return row[1]
+
+    def _nearest(self, scope: str, question: str):
+        rows = self.conn.execute(
+            f"SELECT key, response, created_at, embedding FROM {CACHE_TABLE} WHERE scope = ?", (scope,)
+        ).fetchall()
+        if not rows:
+            return None
+        import numpy as np
+        matrix = np.frombuffer(b"".join(r[3] for r in rows), dtype='float32').reshape(len(rows), -1)
+        scores = matrix @ embed_question(question)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        return rows[best][:3]
+
+    def put(self, kind: str, question: str, provider: str, model: str, response: str,
+            data_version: str = None, context: str = None):
+        """Stores a response, evicting the least recently used entries beyond max_entries."""
+        scope = self._scope(kind, provider, model, data_version, context)
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {CACHE_TABLE} "
+                "(key, scope, question, embedding, response, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._key(scope, normalized), scope, normalized, embed_question(question).tobytes(),
+                 response, now, now)
+            )
+            self.conn.execute(
+                f"DELETE FROM {CACHE_TABLE} WHERE key IN ("
+                f"SELECT key FROM {CACHE_TABLE} ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock, self.conn:
+            self.conn.execute(f"DELETE FROM {CACHE_TABLE}")
+
+    def stats(self) -> dict:
+        """Hit/miss counts of this process plus the size of the persistent cache."""
+        with self._lock:
+            entries, lifetime_hits = self.conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(hit_count), 0) FROM {CACHE_TABLE}"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'lifetime_hits': lifetime_hits,
+        }
@@ -0,0 +1,169 @@
+import json
+import threading
+from code.provider_router import LatencyTracker
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+# Label sets are (operation, provider, model); provider is also "cache",
+# "rules" or "mock" for answers that did not call an LLM.
+LABELS = ("operation", "provider", "model")
+
+
+class CallSeries:
+    """Counters and rolling latency windows of one (operation, provider, model)."""
+
+    def __init__(self, window: int):
+        self.calls = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_sum = 0.0
+        self.first_token_sum = 0.0
+        self.first_token_count = 0
+        self.latency = LatencyTracker(window)
+        self.first_token = LatencyTracker(window)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """
+    In-process metrics of assistant calls: one CallSeries per operation
+    (sql/insight/summary), provider and model, with call, error,
+    cancellation, retry, cache and token counters plus the last window latencies and times to
+    first token for percentiles. summary() feeds the app, to_json() and
+    to_prometheus() export the same numbers.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, provider: str, model: str, latency_s: float, error: bool = False,
+               cache: str = None, first_token_s: float = None, prompt_tokens: int = 0,
+               completion_tokens: int = 0, retries: int = 0, cancelled: bool = False):
+        """
+        Adds one call. cache is "hit", "miss" or None when no cache was
+        consulted; first_token_s is only known for streamed answers.
+        cancelled marks a stream the caller stopped reading before it ended.
+        """
+        key = (operation, provider or "none", model or "")
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = CallSeries(self.window)
+            series.calls += 1
+            series.errors += bool(error)
+            series.cancelled += bool(cancelled)
+            series.cache_hits += cache == "hit"
+            series.cache_misses += cache == "miss"
+            series.retries += retries
+            series.prompt_tokens += prompt_tokens or 0
+            series.completion_tokens += completion_tokens or 0
+            series.latency_sum += latency_s
+            if first_token_s is not None:
+                series.first_token_sum += first_token_s
+                series.first_token_count += 1
+        series.latency.add(latency_s)
+        if first_token_s is not None:
+            series.first_token.add(first_token_s)
+
+    def summary(self) -> list:
+        """One dict per series: labels, counters and latency percentiles in seconds."""
+        with self._lock:
+            items = sorted(self._series.items())
+        rows = []
+        for labels, series in items:
+            row = dict(zip(LABELS, labels))
+            row.update(calls=series.calls, errors=series.errors, cancelled=series.cancelled,
+                       cache_hits=series.cache_hits,
+                       cache_misses=series.cache_misses, retries=series.retries,
+                       prompt_tokens=series.prompt_tokens, completion_tokens=series.completion_tokens,
+                       tokens_per_call=(series.prompt_tokens + series.completion_tokens) / series.calls)
+            for q in QUANTILES:
+                row[f"latency_p{round(q * 100)}_s"] = series.latency.percentile(q * 100)
+                row[f"first_token_p{round(q * 100)}_s"] = series.first_token.percentile(q * 100)
+            rows.append(row)
+        return rows
+
+    def totals(self) -> dict:
+        """Counters summed over every series, with the cache hit rate."""
+        rows = self.summary()
+        totals = {key: sum(row[key] for row in rows)
+                  for key in ("calls", "errors", "cancelled", "cache_hits", "cache_misses", "retries",
+                              "prompt_tokens", "completion_tokens")}
+        lookups = totals['cache_hits'] + totals['cache_misses']
+        totals['cache_hit_rate'] = totals['cache_hits'] / lookups if lookups else 0.0
+        return totals
+
+    def to_json(self) -> str:
+        return json.dumps({'totals': self.totals(), 'series': self.summary()}, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format: counters plus latency summaries."""
+        with self._lock:
+            items = sorted(self._series.items())
+        counters = [
+            ("llm_calls_total", "Assistant calls.", lambda s: [("", s.calls)]),
+            ("llm_errors_total", "Assistant calls that failed.", lambda s: [("", s.errors)]),
+            ("llm_cancelled_total", "Streamed answers abandoned before the end.", lambda s: [("", s.cancelled)]),
+            ("llm_retries_total", "Extra provider attempts (hedges and failovers).", lambda s: [("", s.retries)]),
+            ("llm_cache_lookups_total", "Answer cache lookups.",
+             lambda s: [(',result="hit"', s.cache_hits), (',result="miss"', s.cache_misses)]),
+            ("llm_tokens_total", "Prompt and completion tokens.",
+             lambda s: [(',type="prompt"', s.prompt_tokens), (',type="completion"', s.completion_tokens)]),
+        ]
+        lines = []
+        for name, help_text, values in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for labels, series in items:
+                base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(LABELS, labels))
+                lines += [f"{name}{{{base}{extra}}} {value}" for extra, value in values(series)]
+
+        summaries = [
+            ("llm_latency_seconds", "Assistant call latency.", "latency", "latency_sum", "calls"),
+            ("llm_first_token_seconds", "Time to first streamed token.",
+             "first_token", "first_token_sum", "first_token_count"),
+        ]
+        for name, help_text, tracker, total, count in summaries:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+            for labels, series in items:
+                if not getattr(series, count):
+                    continue
+                base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(LABELS, labels))
+                for q in QUANTILES:
+                    value = getattr(series, tracker).percentile(q * 100)
+                    lines.append(f'{name}{{{base},quantile="{q}"}} {value:.6f}')
+                lines.append(f"{name}_sum{{{base}}} {getattr(series, total):.6f}")
+                lines.append(f"{name}_count{{{base}}} {getattr(series, count)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+# Shared by every assistant in the process unless one is given its own.
+REGISTRY = MetricsRegistry()
+
+
+if __name__ == "__main__":
+    import random
+
+    rng = random.Random(0)
+    registry = MetricsRegistry()
+    for _ in range(200):
+        registry.record("sql", "openai", "gpt-3.5-turbo", rng.lognormvariate(-0.5, 0.4), cache="miss",
+                        prompt_tokens=650, completion_tokens=rng.randint(20, 60), retries=rng.random() < 0.05)
+        registry.record("sql", "cache", "gpt-3.5-turbo", 0.002, cache="hit")
+        registry.record("insight", "openai", "gpt-3.5-turbo", rng.lognormvariate(0.8, 0.3),
+                        first_token_s=rng.lognormvariate(-1, 0.3), prompt_tokens=900, completion_tokens=150)
+    print(json.dumps(registry.totals(), indent=2))
+    print(registry.to_prometheus())
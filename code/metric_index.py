@@ -0,0 +1,315 @@
+import os
+import re
+import json
+import logging
+import numpy as np
+from code.llm_cache import embed_question, EMBEDDING_DIM
+from code.mobility_analytics import zone_cell_center
+from code.olap_cube import MobilityCube, WEEKDAYS
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Text indexes switch from exact search to IVF above this many documents.
+IVF_MIN_DOCUMENTS = 2000
+
+
+def embed_texts(texts, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Stacks the hashed-trigram embeddings of texts into an (n, dim) float32 array."""
+    if not texts:
+        return np.zeros((0, dim), dtype='float32')
+    return np.vstack([embed_question(t, dim) for t in texts]).astype('float32')
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _top_k(scores: np.ndarray, k: int):
+    """Per-row indices and values of the k largest scores, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.zeros((len(scores), 0), dtype='int64'), np.zeros((len(scores), 0))
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return top, np.take_along_axis(scores, top, axis=1)
+
+
+class FlatIndex:
+    """Exact inner-product search over L2-normalized vectors (cosine similarity)."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def search(self, queries: np.ndarray, k: int = 5):
+        """
+        Batched search: one matrix product for all queries.
+
+        Returns:
+            tuple: (ids, scores), each shaped (len(queries), k).
+        """
+        return _top_k(np.atleast_2d(queries) @ self.vectors.T, k)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), np.ascontiguousarray(self.vectors))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        return cls(np.load(os.path.join(path, "vectors.npy"), mmap_mode='r' if mmap else None))
+
+
+class IVFIndex:
+    """
+    Inverted-file index: vectors are clustered with spherical k-means and
+    stored grouped by cluster; a query only scores the vectors of its
+    nprobe nearest clusters. Approximate, but sub-linear in the index size.
+    """
+
+    def __init__(self, centroids, vectors, ids, offsets, nprobe: int = 4):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: int = None, nprobe: int = 4, iterations: int = 10, seed: int = 0):
+        n = len(vectors)
+        nlist = nlist or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(n, size=min(nlist, n), replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            empty = ~np.any(sums, axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize_rows(sums)
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        ids = np.argsort(assign, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(centroids)))])
+        return cls(centroids.astype('float32'), vectors[ids], ids, offsets, nprobe)
+
+    def search(self, queries: np.ndarray, k: int = 5):
+        """Returns (ids, scores) shaped (len(queries), k); missing slots have id -1."""
+        queries = np.atleast_2d(queries)
+        probes, _ = _top_k(queries @ self.centroids.T, self.nprobe)
+        out_ids = np.full((len(queries), k), -1, dtype='int64')
+        out_scores = np.full((len(queries), k), -np.inf)
+        for q, lists in enumerate(probes):
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists])
+            if len(rows) == 0:
+                continue
+            top, scores = _top_k((self.vectors[rows] @ queries[q])[None, :], k)
+            out_ids[q, :top.shape[1]] = self.ids[rows[top[0]]]
+            out_scores[q, :top.shape[1]] = scores[0]
+        return out_ids, out_scores
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name in ("centroids", "vectors", "ids", "offsets"):
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, nprobe: int = 4):
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r' if mmap else None)
+                  for name in ("centroids", "vectors", "ids", "offsets")}
+        return cls(nprobe=nprobe, **arrays)
+
+
+class MetricKnowledgeBase:
+    """
+    Retrieval over aggregated mobility metrics for the AI assistant.
+
+    Short fact documents (one per day, hour, weekday and busy zone cell) are
+    generated from a MobilityCube and embedded into a vector index, so a
+    question pulls in the few most relevant facts instead of a raw table dump.
+    Each day's 24-hour demand profile is indexed separately for "similar day"
+    search. Everything persists as .npy files that are memory-mapped on load.
+    """
+
+    def __init__(self, documents, text_index, profiles, profile_days):
+        self.documents = documents
+        self.text_index = text_index
+        self.profiles = profiles
+        self.profile_days = profile_days
+        self.profile_index = FlatIndex(profiles)
+
+    @classmethod
+    def from_cube(cls, cube: MobilityCube, scale: float = 1.0, top_zones: int = 100):
+        """
+        Builds the documents and indexes from a cube.
+
+        Args:
+            scale (float): Multiplier for counts and sums, for cubes built from
+                a uniform sample (e.g. total trips / sample rows).
+            top_zones (int): Number of busiest zone cells to describe.
+        """
+        documents = []
+
+        def add(kind, key, topic, text):
+            # Only the short topic is embedded: the numbers in the text would
+            # otherwise dominate the trigram vector.
+            documents.append({'kind': kind, 'key': key, 'topic': topic, 'text': text})
+
+        def stats(dimension):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return {
+                    'trips': cube.rollup(dimension) * scale,
+                    'revenue': cube.rollup(dimension, 'revenue') * scale,
+                    'fare': cube.rollup(dimension, 'fare', 'mean'),
+                    'distance': cube.rollup(dimension, 'distance', 'mean'),
+                    'tip': cube.rollup(dimension, 'tip', 'mean'),
+                }
+
+        def add_ranking(dimension, label, s):
+            present = np.flatnonzero(s['trips'])
+            if len(present) == 0:
+                return
+            parts = []
+            for measure, name, fmt in (('trips', 'trips', '{:,.0f}'), ('revenue', 'revenue', '${:,.0f}'),
+                                       ('fare', 'average fare', '${:.2f}'), ('distance', 'average distance', '{:.2f} mi')):
+                values = s[measure][present]
+                hi, lo = present[np.argmax(values)], present[np.argmin(values)]
+                parts.append(f"highest {name} {label(hi)} ({fmt.format(s[measure][hi])}), "
+                             f"lowest {label(lo)} ({fmt.format(s[measure][lo])})")
+            add('ranking', dimension, f"which {dimension} busiest quietest highest lowest most least peak {dimension}s",
+                f"{dimension.capitalize()}s ranked: " + "; ".join(parts) + ".")
+
+        day_hour = cube.rollup(['day', 'hour']) * scale
+        day_weekday = cube.rollup(['day', 'weekday'])
+        s = stats('day')
+        add_ranking('day', lambda d: f"day {d}", s)
+        for day in np.flatnonzero(s['trips']):
+            peak = int(np.argmax(day_hour[day]))
+            weekday = WEEKDAYS[int(np.argmax(day_weekday[day]))]
+            add('day', int(day), f"day {day} january {day} {weekday} daily",
+                f"Day {day} ({weekday}): {s['trips'][day]:,.0f} trips, revenue ${s['revenue'][day]:,.0f}, "
+                f"average fare ${s['fare'][day]:.2f}, average distance {s['distance'][day]:.2f} mi, "
+                f"average tip ${s['tip'][day]:.2f}, busiest hour {peak}:00 ({day_hour[day, peak]:,.0f} trips).")
+
+        weekday_hour = cube.rollup(['weekday', 'hour']) * scale
+        s = stats('hour')
+        add_ranking('hour', lambda h: f"{h}:00", s)
+        for hour in np.flatnonzero(s['trips']):
+            busiest = WEEKDAYS[int(np.argmax(weekday_hour[:, hour]))]
+            add('hour', int(hour), f"hour {hour} {hour}:00 {hour} o'clock hourly",
+                f"Hour {hour}:00: {s['trips'][hour]:,.0f} trips, revenue ${s['revenue'][hour]:,.0f}, "
+                f"average fare ${s['fare'][hour]:.2f}, average distance {s['distance'][hour]:.2f} mi; "
+                f"busiest on {busiest}s.")
+
+        s = stats('weekday')
+        add_ranking('weekday', lambda w: WEEKDAYS[w], s)
+        for w in np.flatnonzero(s['trips']):
+            peak = int(np.argmax(weekday_hour[w]))
+            add('weekday', WEEKDAYS[w], f"{WEEKDAYS[w]} {WEEKDAYS[w]}s weekday",
+                f"{WEEKDAYS[w]}s: {s['trips'][w]:,.0f} trips, revenue ${s['revenue'][w]:,.0f}, "
+                f"average fare ${s['fare'][w]:.2f}, average distance {s['distance'][w]:.2f} mi, "
+                f"peak hour {peak}:00.")
+
+        zone_hour = cube.rollup(['zone', 'hour'])
+        s = stats('zone')
+        ranked = np.argsort(-s['trips'], kind='stable')[:top_zones]
+        ranked = ranked[s['trips'][ranked] > 0]
+        lat, lon = zone_cell_center(ranked, cube.cell_size)
+        if len(ranked):
+            top = ", ".join(f"#{rank} near ({la:.3f}, {lo:.3f}) with {s['trips'][zone]:,.0f} trips"
+                            for rank, (zone, la, lo) in enumerate(zip(ranked[:5], lat, lon), start=1))
+            add('ranking', 'zone', "busiest pickup zone top pickup zones which zone location area",
+                f"Busiest pickup zones: {top}.")
+        for rank, (zone, la, lo) in enumerate(zip(ranked, lat, lon), start=1):
+            add('zone', int(zone), f"pickup zone #{rank} near {la:.3f} {lo:.3f}",
+                f"Pickup zone #{rank} near ({la:.3f}, {lo:.3f}): {s['trips'][zone]:,.0f} trips, "
+                f"revenue ${s['revenue'][zone]:,.0f}, average fare ${s['fare'][zone]:.2f}, "
+                f"average distance {s['distance'][zone]:.2f} mi, busiest hour {int(np.argmax(zone_hour[zone]))}:00.")
+
+        vectors = embed_texts([d['topic'] for d in documents])
+        text_index = IVFIndex.build(vectors) if len(vectors) >= IVF_MIN_DOCUMENTS else FlatIndex(vectors)
+
+        # Demand profiles: each day's share of trips per hour, centred and
+        # normalized so the dot product is the Pearson correlation of shapes.
+        profile_days = np.flatnonzero(day_hour.sum(axis=1))
+        shares = day_hour[profile_days] / day_hour[profile_days].sum(axis=1, keepdims=True)
+        profiles = _normalize_rows(shares - shares.mean(axis=1, keepdims=True)).astype('float32')
+
+        logging.info(f"Metric knowledge base: {len(documents)} documents, {len(profile_days)} day profiles.")
+        return cls(documents, text_index, profiles, profile_days)
+
+    def search(self, questions, k: int = 5):
+        """Top-k documents for each question (batched). Returns a list of document lists."""
+        questions = [questions] if isinstance(questions, str) else list(questions)
+        ids, scores = self.text_index.search(embed_texts(questions), k)
+        return [[dict(self.documents[i], score=float(sc)) for i, sc in zip(row_ids, row_scores) if i >= 0]
+                for row_ids, row_scores in zip(ids, scores)]
+
+    def similar_days(self, day: int, k: int = 3):
+        """Days whose hourly demand profile is most similar to the given day's: [(day, correlation)]."""
+        position = np.flatnonzero(self.profile_days == day)
+        if len(position) == 0:
+            return []
+        ids, scores = self.profile_index.search(self.profiles[position[0]], k + 1)
+        return [(int(self.profile_days[i]), float(sc)) for i, sc in zip(ids[0], scores[0])
+                if self.profile_days[i] != day][:k]
+
+    def context_for(self, question: str, k: int = 5) -> str:
+        """Compact bullet list of the facts most relevant to question, for an LLM prompt."""
+        facts = [doc['text'] for doc in self.search(question, k)[0]]
+        mentioned = re.search(r"\b(?:day|jan(?:uary)?)\s+(\d{1,2})\b", question, re.IGNORECASE)
+        if mentioned:
+            day = int(mentioned.group(1))
+            similar = self.similar_days(day)
+            if similar:
+                listed = ", ".join(f"day {d} (r={r:.2f})" for d, r in similar)
+                facts.append(f"Days with the most similar hourly demand to day {day}: {listed}.")
+        return "\n".join(f"- {fact}" for fact in facts)
+
+    def save(self, path: str, version: str = None):
+        os.makedirs(path, exist_ok=True)
+        self.text_index.save(os.path.join(path, "text_index"))
+        np.save(os.path.join(path, "profiles.npy"), self.profiles)
+        np.save(os.path.join(path, "profile_days.npy"), self.profile_days)
+        with open(os.path.join(path, "documents.json"), "w") as f:
+            json.dump({
+                'version': version,
+                'index': type(self.text_index).__name__,
+                'documents': self.documents,
+            }, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        with open(os.path.join(path, "documents.json")) as f:
+            meta = json.load(f)
+        index_cls = IVFIndex if meta['index'] == 'IVFIndex' else FlatIndex
+        kb = cls(meta['documents'],
+                 index_cls.load(os.path.join(path, "text_index"), mmap),
+                 np.load(os.path.join(path, "profiles.npy"), mmap_mode='r' if mmap else None),
+                 np.load(os.path.join(path, "profile_days.npy")))
+        kb.version = meta.get('version')
+        return kb
+
+    @classmethod
+    def load_or_build(cls, path: str, version: str, build):
+        """Loads the index at path if it was saved for this data version, otherwise calls build() and saves it."""
+        if os.path.exists(os.path.join(path, "documents.json")):
+            kb = cls.load(path)
+            if kb.version == version:
+                return kb
+        kb = build()
+        kb.save(path, version)
+        return kb
+
+
+if __name__ == "__main__":
+    from code.mobility_analytics import MobilityDataAnalyzer
+
+    analyzer = MobilityDataAnalyzer("yellow_tripdata_2016-01.csv")
+    analyzer.load_data(nrows=200000)
+    analyzer.clean_data()
+    analyzer.feature_engineering()
+
+    kb = MetricKnowledgeBase.from_cube(MobilityCube.from_frame(analyzer.data))
+    for question in ["Which hour has the highest average fare?", "What happened on day 23?"]:
+        print(f"\n{question}\n{kb.context_for(question)}")
@@ -2,10 +2,36 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import logging
+from code.pipeline import (
+    NYC_LAT_RANGE, NYC_LON_RANGE, ZONE_CELL_SIZE, zone_grid_shape,
+    CLEANING_RULES, FEATURE_RULES, pandas_mask, add_pandas_features
+)
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Bump whenever the pipeline definition (code/pipeline.py) changes what ends up
+# in the cleaned frame, so persisted copies (e.g. mobility.db) are rebuilt.
+PIPELINE_VERSION = 2
+
+
+def assign_zone_cell(lat, lon, cell_size: float = ZONE_CELL_SIZE) -> np.ndarray:
+    """
+    Maps coordinates to integer zone-cell ids (row-major over the NYC grid).
+    Points outside the bounding box are clamped to the edge cells.
+    """
+    rows, cols = zone_grid_shape(cell_size)
+    r = np.clip(((np.asarray(lat, dtype='float64') - NYC_LAT_RANGE[0]) / cell_size).astype('int64'), 0, rows - 1)
+    c = np.clip(((np.asarray(lon, dtype='float64') - NYC_LON_RANGE[0]) / cell_size).astype('int64'), 0, cols - 1)
+    return r * cols + c
+
+
+def zone_cell_center(cell_id, cell_size: float = ZONE_CELL_SIZE):
+    """Returns (lat, lon) of the centre of the given zone-cell id(s)."""
+    _, cols = zone_grid_shape(cell_size)
+    r, c = np.divmod(np.asarray(cell_id, dtype='int64'), cols)
+    return NYC_LAT_RANGE[0] + (r + 0.5) * cell_size, NYC_LON_RANGE[0] + (c + 0.5) * cell_size
+
 class MobilityDataAnalyzer:
     """
     A class to handle loading, cleaning, and feature engineering of NYC Taxi Trip data.
@@ -14,6 +40,7 @@ class MobilityDataAnalyzer:
     def __init__(self, file_path: str):
         self.file_path = file_path
         self.data = None
+        self.nrows = None
         
     def load_data(self, nrows: int = None):
         """
@@ -23,6 +50,7 @@ class MobilityDataAnalyzer:
             nrows (int, optional): Number of rows to read. Useful for testing.
         """
         logging.info(f"Loading data from {self.file_path}...")
+        self.nrows = nrows
         try:
 
             dtype_map = {
@@ -61,9 +89,29 @@ class MobilityDataAnalyzer:
             logging.error(f"Error loading data: {e}")
             raise
 
+    def iter_chunks(self, chunksize: int, nrows: int = None):
+        """
+        Streams the CSV in chunks, yielding each chunk cleaned and
+        feature-engineered, so files larger than RAM can be processed.
+        
+        Args:
+            chunksize (int): Rows read per chunk.
+            nrows (int, optional): Total number of rows to read.
+        """
+        logging.info(f"Streaming data from {self.file_path} in chunks of {chunksize:,}...")
+        self.nrows = nrows
+        for chunk in pd.read_csv(self.file_path, chunksize=chunksize, nrows=nrows):
+            chunk['tpep_pickup_datetime'] = pd.to_datetime(chunk['tpep_pickup_datetime'])
+            chunk['tpep_dropoff_datetime'] = pd.to_datetime(chunk['tpep_dropoff_datetime'])
+            self.data = chunk
+            self.clean_data()
+            self.feature_engineering()
+            yield self.data
+        self.data = None
+
     def clean_data(self):
         """
-        Cleans the dataset:
+        Cleans the dataset with pipeline.CLEANING_RULES:
         1. Removes field with 0 passenger count.
         2. Removes trips with 0 distance.
         3. Removes trips with 0 or negative fares.
@@ -75,19 +123,7 @@ class MobilityDataAnalyzer:
         logging.info("Starting data cleaning...")
         initial_count = len(self.data)
         
-
-        
-
-        
-
-        
-
-        self.data = self.data[
-            (self.data['pickup_latitude'].between(40.5, 40.95)) &
-            (self.data['pickup_longitude'].between(-74.25, -73.7)) &
-            (self.data['dropoff_latitude'].between(40.5, 40.95)) &
-            (self.data['dropoff_longitude'].between(-74.25, -73.7))
-        ]
+        self.data = self.data[pandas_mask(self.data, CLEANING_RULES)]
         
         cleaned_count = len(self.data)
         logging.info(f"Data cleaning complete. Removed {initial_count - cleaned_count} rows. Remaining: {cleaned_count}")
@@ -95,8 +131,8 @@ class MobilityDataAnalyzer:
 
     def feature_engineering(self):
         """
-        Adds derived features:
-        - Hour, Day, Month, Weekday
+        Adds derived features (pipeline.FEATURES), then applies FEATURE_RULES:
+        - Hour, Day, Month, Year, Weekday
         - Trip Duration (minutes)
         """
         if self.data is None:
@@ -105,15 +141,9 @@ class MobilityDataAnalyzer:
         logging.info("Starting feature engineering...")
         
 
-        self.data['pickup_hour'] = self.data['tpep_pickup_datetime'].dt.hour
-        self.data['pickup_day'] = self.data['tpep_pickup_datetime'].dt.day
-        self.data['pickup_month'] = self.data['tpep_pickup_datetime'].dt.month
-        self.data['pickup_weekday'] = self.data['tpep_pickup_datetime'].dt.day_name()
-        
-
-        self.data['trip_duration_min'] = (self.data['tpep_dropoff_datetime'] - self.data['tpep_pickup_datetime']).dt.total_seconds() / 60.0
+        self.data = add_pandas_features(self.data)
 
-        self.data = self.data[(self.data['trip_duration_min'] > 0) & (self.data['trip_duration_min'] < 600)]
+        self.data = self.data[pandas_mask(self.data, FEATURE_RULES)]
         
         logging.info("Feature engineering complete.")
         return self.data
@@ -0,0 +1,127 @@
+import json
+import time
+import random
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_REPLY = ("📈 Revenue peaks between 6 and 8 PM, when trips are longest. "
+                 "Evening demand matters for fleet planning. Shift more cabs to Midtown after 5 PM.")
+
+
+class MockLLMServer:
+    """
+    Minimal OpenAI-compatible chat completions endpoint for local testing.
+
+    Serves POST /v1/chat/completions with either a JSON completion or, with
+    "stream": true, server-sent events carrying one word per chunk. Latency
+    before the first token, the delay between tokens and a failure rate can
+    be set to mimic a slow or flaky provider. Point GenAIAssistant at it with
+    base_url=server.base_url (or LLM_BASE_URL) and any API key.
+    """
+
+    def __init__(self, port: int = 0, reply: str = DEFAULT_REPLY, first_token_delay: float = 0.2,
+                 token_delay: float = 0.02, failure_rate: float = 0.0, seed: int = 0):
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}/v1"
+        self._thread = None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                    failing = server._rng.random() < server.failure_rate
+                time.sleep(server.first_token_delay)
+                if failing:
+                    self._json(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit"}})
+                    return
+
+                model = body.get("model", "mock-model")
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Cache-Control", "no-cache")
+                    self.end_headers()
+                    words = server.reply.split(" ")
+                    try:
+                        for i, word in enumerate(words):
+                            token = word if i == 0 else f" {word}"
+                            self._event({"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                                         "model": model,
+                                         "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+                            time.sleep(server.token_delay)
+                        self._event({"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                                     "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                        self.wfile.write(b"data: [DONE]\n\n")
+                        self.wfile.flush()
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client stopped reading, e.g. a cancelled hedged stream.
+                        pass
+                    return
+
+                words = len(server.reply.split())
+                # Roughly four characters per prompt token.
+                prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+                self._json(200, {
+                    "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": server.reply}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": words,
+                              "total_tokens": prompt_tokens + words},
+                })
+
+            def _event(self, payload):
+                self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+                self.wfile.flush()
+
+            def _json(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self):
+        """Serves in a background thread and returns self."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Mock LLM server listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    server = MockLLMServer(port=8089)
+    print(f"Mock OpenAI-compatible endpoint: {server.base_url}")
+    print("Run the app against it with: LLM_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=mock streamlit run code/app.py")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+import logging
+from code.mobility_analytics import assign_zone_cell, zone_grid_shape, ZONE_CELL_SIZE
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Measure name -> source column. 'trips' is the cell count itself.
+MEASURES = {
+    'revenue': 'total_amount',
+    'fare': 'fare_amount',
+    'tip': 'tip_amount',
+    'distance': 'trip_distance',
+}
+
+STATS = ('sum', 'count', 'mean', 'std', 'sumsq')
+
+
+class MobilityCube:
+    """
+    Sparse OLAP cube of trip measures over hour x weekday x day x zone x payment_type.
+
+    Only non-empty cells are stored, as sorted linear keys with per-cell counts,
+    sums and sums of squares. All stats are additive, so cubes built from
+    different chunks or partitions can be merged, and any slice or roll-up is
+    answered from the cells without touching raw rows.
+    """
+
+    def __init__(self, keys, counts, sums, sumsqs, cell_size: float = ZONE_CELL_SIZE):
+        self.cell_size = cell_size
+        self.dimensions = {
+            'hour': 24,
+            'weekday': 7,
+            'day': 32,
+            'zone': int(np.prod(zone_grid_shape(cell_size))),
+            'payment_type': 7,
+        }
+        self.keys = keys
+        self.counts = counts
+        self.sums = sums
+        self.sumsqs = sumsqs
+        self._decoded = None
+        self._rollups = {}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, cell_size: float = ZONE_CELL_SIZE):
+        """
+        Builds the cube in one pass over a cleaned, feature-engineered frame.
+        """
+        cube = cls.empty(cell_size)
+        pickup = df['tpep_pickup_datetime'].dt
+        codes = [
+            pickup.hour.to_numpy(),
+            pickup.dayofweek.to_numpy(),
+            pickup.day.to_numpy(),
+            assign_zone_cell(df['pickup_latitude'].to_numpy(), df['pickup_longitude'].to_numpy(), cell_size),
+            np.clip(df['payment_type'].to_numpy(), 0, 6),
+        ]
+        linear = np.ravel_multi_index(codes, tuple(cube.dimensions.values()))
+        keys, inverse = np.unique(linear, return_inverse=True)
+
+        values = np.nan_to_num(np.column_stack([df[c].to_numpy(dtype='float64') for c in MEASURES.values()]))
+        sums = np.column_stack([np.bincount(inverse, weights=v, minlength=len(keys)) for v in values.T])
+        sumsqs = np.column_stack([np.bincount(inverse, weights=v * v, minlength=len(keys)) for v in values.T])
+        counts = np.bincount(inverse, minlength=len(keys))
+
+        logging.info(f"Built cube with {len(keys):,} non-empty cells from {len(df):,} rows.")
+        return cls(keys, counts, sums.reshape(len(keys), len(MEASURES)),
+                   sumsqs.reshape(len(keys), len(MEASURES)), cell_size)
+
+    @classmethod
+    def empty(cls, cell_size: float = ZONE_CELL_SIZE):
+        shape = (0, len(MEASURES))
+        return cls(np.empty(0, dtype='int64'), np.empty(0, dtype='int64'),
+                   np.empty(shape), np.empty(shape), cell_size)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def merge(self, other: "MobilityCube") -> "MobilityCube":
+        """Returns a new cube holding the combined cells of self and other."""
+        if other.cell_size != self.cell_size:
+            raise ValueError("Cannot merge cubes built with different zone cell sizes.")
+        keys, inverse = np.unique(np.concatenate([self.keys, other.keys]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([self.counts, other.counts]),
+                             minlength=len(keys)).astype('int64')
+        sums = np.zeros((len(keys), len(MEASURES)))
+        sumsqs = np.zeros((len(keys), len(MEASURES)))
+        np.add.at(sums, inverse, np.vstack([self.sums, other.sums]))
+        np.add.at(sumsqs, inverse, np.vstack([self.sumsqs, other.sumsqs]))
+        return MobilityCube(keys, counts, sums, sumsqs, self.cell_size)
+
+    def _codes(self, dimension: str) -> np.ndarray:
+        if self._decoded is None:
+            codes = np.unravel_index(self.keys, tuple(self.dimensions.values()))
+            self._decoded = dict(zip(self.dimensions, codes))
+        return self._decoded[dimension]
+
+    def slice(self, **filters) -> "MobilityCube":
+        """
+        Restricts the cube to cells matching the filters, e.g.
+        cube.slice(hour=[17, 18], weekday=1). Weekdays may be given by name.
+        """
+        mask = np.ones(len(self.keys), dtype=bool)
+        for dimension, value in filters.items():
+            if dimension not in self.dimensions:
+                raise ValueError(f"Unknown dimension: {dimension}")
+            wanted = np.atleast_1d(value)
+            if dimension == 'weekday':
+                wanted = [WEEKDAYS.index(v) if isinstance(v, str) else v for v in wanted]
+            mask &= np.isin(self._codes(dimension), wanted)
+        return MobilityCube(self.keys[mask], self.counts[mask], self.sums[mask], self.sumsqs[mask], self.cell_size)
+
+    def rollup(self, dimensions, measure: str = 'trips', stat: str = 'sum') -> np.ndarray:
+        """
+        Aggregates the cube down to the given dimensions.
+
+        Args:
+            dimensions (list): Dimensions to keep, in output axis order.
+            measure (str): 'trips' or one of MEASURES.
+            stat (str): One of STATS. Ignored for 'trips', which is always
+                the trip count.
+
+        Returns:
+            np.ndarray: Dense array shaped by the kept dimensions' sizes.
+                Results are memoized, so treat them as read-only.
+        """
+        if stat not in STATS:
+            raise ValueError(f"Unknown stat: {stat}")
+        dimensions = [dimensions] if isinstance(dimensions, str) else list(dimensions)
+        cache_key = (tuple(dimensions), measure, stat)
+        if cache_key not in self._rollups:
+            self._rollups[cache_key] = self._rollup(dimensions, measure, stat)
+        return self._rollups[cache_key]
+
+    def _rollup(self, dimensions, measure, stat):
+        shape = tuple(self.dimensions[d] for d in dimensions)
+        if dimensions:
+            index = np.ravel_multi_index([self._codes(d) for d in dimensions], shape)
+        else:
+            index = np.zeros(len(self.keys), dtype='int64')
+        size = int(np.prod(shape))
+
+        count = np.bincount(index, weights=self.counts, minlength=size)
+        if measure == 'trips':
+            return count.astype('int64').reshape(shape)
+        if measure not in MEASURES:
+            raise ValueError(f"Unknown measure: {measure}")
+        m = list(MEASURES).index(measure)
+        total = np.bincount(index, weights=self.sums[:, m], minlength=size)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if stat == 'sum':
+                out = total
+            elif stat == 'count':
+                out = count
+            elif stat == 'sumsq':
+                out = np.bincount(index, weights=self.sumsqs[:, m], minlength=size)
+            elif stat == 'mean':
+                out = total / count
+            else:
+                sumsq = np.bincount(index, weights=self.sumsqs[:, m], minlength=size)
+                var = (sumsq - total * total / count) / (count - 1)
+                out = np.sqrt(np.clip(var, 0, None))
+        return out.reshape(shape)
+
+    def pivot(self, index: str, columns: str, measure: str = 'trips', stat: str = 'sum') -> pd.DataFrame:
+        """
+        Two-dimensional roll-up as a labelled DataFrame, with empty rows and
+        columns dropped (the same shape pandas.pivot_table would give).
+        """
+        counts = self.rollup([index, columns])
+        grid = counts if measure == 'trips' else self.rollup([index, columns], measure, stat)
+        frame = pd.DataFrame(grid, index=self._labels(index), columns=self._labels(columns))
+        frame = frame.loc[counts.sum(axis=1) > 0, counts.sum(axis=0) > 0]
+        frame.index.name = f"pickup_{index}" if index in ('hour', 'weekday', 'day') else index
+        frame.columns.name = f"pickup_{columns}" if columns in ('hour', 'weekday', 'day') else columns
+        return frame
+
+    def to_frame(self, dimensions, measure: str = 'trips', stat: str = 'sum') -> pd.DataFrame:
+        """Long-format roll-up: one row per non-empty group of the kept dimensions."""
+        dimensions = [dimensions] if isinstance(dimensions, str) else list(dimensions)
+        values = self.rollup(dimensions, measure, stat)
+        counts = self.rollup(dimensions)
+        nonzero = np.nonzero(counts)
+        frame = pd.DataFrame({d: np.asarray(self._labels(d))[codes] for d, codes in zip(dimensions, nonzero)})
+        frame[f"{measure}_{stat}" if measure != 'trips' else 'trips'] = values[nonzero]
+        return frame
+
+    def _labels(self, dimension: str):
+        if dimension == 'weekday':
+            return WEEKDAYS
+        return list(range(self.dimensions[dimension]))
+
+
+if __name__ == "__main__":
+    from code.mobility_analytics import MobilityDataAnalyzer
+
+    analyzer = MobilityDataAnalyzer("yellow_tripdata_2016-01.csv")
+    analyzer.load_data(nrows=100000)
+    analyzer.clean_data()
+    analyzer.feature_engineering()
+
+    cube = MobilityCube.from_frame(analyzer.data)
+    print("\nTrips by weekday x hour:")
+    print(cube.pivot('weekday', 'hour'))
+    print("\nAverage fare by hour, card payments only:")
+    print(cube.slice(payment_type=1).to_frame('hour', 'fare', 'mean'))
@@ -0,0 +1,202 @@
+import logging
+from functools import reduce
+import numpy as np
+import pandas as pd
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# NYC bounding box used for coordinate cleaning and the zone-cell grid.
+NYC_LAT_RANGE = (40.5, 40.95)
+NYC_LON_RANGE = (-74.25, -73.7)
+ZONE_CELL_SIZE = 0.01
+
+PICKUP = "tpep_pickup_datetime"
+DROPOFF = "tpep_dropoff_datetime"
+
+# The trip pipeline, declared once. Each engine (pandas for the laptop path,
+# Spark for the cluster path, DuckDB/SQL) compiles these same definitions, so
+# they all keep the same rows and derive the same columns.
+#
+# Rules are (column, op, value) with op one of '>', '<', 'between' (inclusive);
+# a row is kept only if every rule holds (nulls fail).
+CLEANING_RULES = [
+    ("passenger_count", ">", 0),
+    ("trip_distance", ">", 0),
+    ("total_amount", ">", 0),
+    ("pickup_latitude", "between", NYC_LAT_RANGE),
+    ("pickup_longitude", "between", NYC_LON_RANGE),
+    ("dropoff_latitude", "between", NYC_LAT_RANGE),
+    ("dropoff_longitude", "between", NYC_LON_RANGE),
+]
+
+# Derived features as (name, kind, source column(s)).
+FEATURES = [
+    ("pickup_hour", "hour", PICKUP),
+    ("pickup_day", "day", PICKUP),
+    ("pickup_month", "month", PICKUP),
+    ("pickup_year", "year", PICKUP),
+    ("pickup_weekday", "weekday", PICKUP),
+    ("trip_duration_min", "minutes_between", (PICKUP, DROPOFF)),
+]
+
+# Rules on derived features, applied after FEATURES.
+FEATURE_RULES = [
+    ("trip_duration_min", ">", 0),
+    ("trip_duration_min", "<", 600),
+]
+
+
+def zone_grid_shape(cell_size: float = ZONE_CELL_SIZE):
+    """Returns (rows, cols) of the zone-cell grid over the NYC bounding box."""
+    rows = int(np.ceil(round((NYC_LAT_RANGE[1] - NYC_LAT_RANGE[0]) / cell_size, 9)))
+    cols = int(np.ceil(round((NYC_LON_RANGE[1] - NYC_LON_RANGE[0]) / cell_size, 9)))
+    return rows, cols
+
+
+# --- pandas ---------------------------------------------------------------
+
+def pandas_mask(df: pd.DataFrame, rules=CLEANING_RULES) -> np.ndarray:
+    """Boolean array of the rows of df that pass every rule."""
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in rules:
+        values = df[column].to_numpy(dtype='float64', na_value=np.nan)
+        if op == ">":
+            mask &= values > value
+        elif op == "<":
+            mask &= values < value
+        elif op == "between":
+            mask &= (values >= value[0]) & (values <= value[1])
+        else:
+            raise ValueError(f"Unsupported rule operator: {op}")
+    return mask
+
+
+def add_pandas_features(df: pd.DataFrame, features=FEATURES) -> pd.DataFrame:
+    """Adds the derived feature columns to df in place and returns it."""
+    for name, kind, source in features:
+        if kind == "minutes_between":
+            start, end = source
+            df[name] = (df[end] - df[start]).dt.total_seconds() / 60.0
+        elif kind == "weekday":
+            df[name] = df[source].dt.day_name()
+        elif kind in ("hour", "day", "month", "year"):
+            df[name] = getattr(df[source].dt, kind)
+        else:
+            raise ValueError(f"Unsupported feature kind: {kind}")
+    return df
+
+
+def run_pandas(df: pd.DataFrame) -> pd.DataFrame:
+    """Full pipeline on a frame with parsed datetime columns."""
+    df = df[pandas_mask(df, CLEANING_RULES)].copy()
+    add_pandas_features(df)
+    return df[pandas_mask(df, FEATURE_RULES)]
+
+
+# --- Spark ----------------------------------------------------------------
+
+def spark_condition(rules=CLEANING_RULES):
+    """Single Spark Column that is true for rows passing every rule."""
+    from pyspark.sql.functions import col
+
+    conditions = []
+    for column, op, value in rules:
+        if op == ">":
+            conditions.append(col(column) > value)
+        elif op == "<":
+            conditions.append(col(column) < value)
+        elif op == "between":
+            conditions.append(col(column).between(*value))
+        else:
+            raise ValueError(f"Unsupported rule operator: {op}")
+    return reduce(lambda a, b: a & b, conditions)
+
+
+def add_spark_features(df, features=FEATURES):
+    """Returns df with the derived feature columns added."""
+    from pyspark.sql import functions as F
+
+    kinds = {"hour": F.hour, "day": F.dayofmonth, "month": F.month, "year": F.year}
+    for name, kind, source in features:
+        if kind == "minutes_between":
+            start, end = source
+            expr = (F.unix_timestamp(F.col(end)) - F.unix_timestamp(F.col(start))) / 60.0
+        elif kind == "weekday":
+            expr = F.date_format(F.col(source), "EEEE")
+        elif kind in kinds:
+            expr = kinds[kind](F.col(source))
+        else:
+            raise ValueError(f"Unsupported feature kind: {kind}")
+        df = df.withColumn(name, expr)
+    return df
+
+
+def run_spark(df):
+    """Full pipeline on a Spark DataFrame read with the trip schema."""
+    df = add_spark_features(df.filter(spark_condition(CLEANING_RULES)))
+    return df.filter(spark_condition(FEATURE_RULES))
+
+
+# --- SQL / DuckDB ---------------------------------------------------------
+
+def sql_condition(rules=CLEANING_RULES) -> str:
+    """WHERE-clause text for the rules."""
+    conditions = []
+    for column, op, value in rules:
+        if op in (">", "<"):
+            conditions.append(f"{column} {op} {value!r}")
+        elif op == "between":
+            conditions.append(f"{column} BETWEEN {value[0]!r} AND {value[1]!r}")
+        else:
+            raise ValueError(f"Unsupported rule operator: {op}")
+    return " AND ".join(conditions)
+
+
+def sql_features(features=FEATURES) -> list:
+    """SELECT-list expressions for the derived features (DuckDB dialect)."""
+    items = []
+    for name, kind, source in features:
+        if kind == "minutes_between":
+            start, end = source
+            expr = f"(epoch({end}) - epoch({start})) / 60.0"
+        elif kind == "weekday":
+            expr = f"dayname({source})"
+        elif kind in ("hour", "day", "month", "year"):
+            expr = f"{kind}({source})"
+        else:
+            raise ValueError(f"Unsupported feature kind: {kind}")
+        items.append(f"{expr} AS {name}")
+    return items
+
+
+def pipeline_sql(source: str) -> str:
+    """Full pipeline as one SQL query over `source` (a table or subquery)."""
+    return (
+        f"SELECT * FROM ("
+        f"SELECT *, {', '.join(sql_features())} FROM {source} WHERE {sql_condition(CLEANING_RULES)}"
+        f") WHERE {sql_condition(FEATURE_RULES)}"
+    )
+
+
+def run_duckdb(csv_path: str, nrows: int = None) -> pd.DataFrame:
+    """
+    Full pipeline executed by DuckDB straight off the CSV. Usually the fastest
+    engine for a single month on one machine. Requires `pip install duckdb`.
+    """
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("run_duckdb requires the duckdb package (pip install duckdb).") from e
+
+    source = f"read_csv_auto('{csv_path}', timestampformat='%Y-%m-%d %H:%M:%S')"
+    if nrows is not None:
+        source = f"(SELECT * FROM {source} LIMIT {int(nrows)})"
+    logging.info(f"Running pipeline with DuckDB on {csv_path}...")
+    return duckdb.sql(pipeline_sql(source)).df()
+
+
+if __name__ == "__main__":
+    print("Cleaning rules (SQL):", sql_condition(CLEANING_RULES))
+    print("Feature rules (SQL):", sql_condition(FEATURE_RULES))
+    print("Features (SQL):", ", ".join(sql_features()))
@@ -0,0 +1,410 @@
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Hedge delay until a provider has this many latency samples.
+DEFAULT_HEDGE_AFTER = 2.0
+MIN_LATENCY_SAMPLES = 20
+# How long a request waits for a free slot when every provider is busy.
+QUEUE_TIMEOUT = 30.0
+
+
+class NoProviderAvailable(RuntimeError):
+    """Every provider is either circuit-open or at its concurrency limit."""
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a failing provider.
+
+    closed: calls pass; failure_threshold consecutive failures open it.
+    open: calls are rejected for reset_timeout seconds, then it is half-open.
+    half_open: a single trial call passes; success closes, failure re-opens.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = "half_open"
+                self._trial = False
+            if self.state == "half_open":
+                if self._trial:
+                    return False
+                self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logging.warning(f"Circuit opened after {self.failures} consecutive failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    def abandon(self):
+        """A call was cancelled before it finished: free the half-open trial slot."""
+        with self._lock:
+            self._trial = False
+
+
+def percentile(values, q: float) -> float:
+    """q-th percentile with linear interpolation (numpy's default), in plain Python."""
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class LatencyTracker:
+    """Rolling window of the most recent latencies (seconds)."""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, q: float):
+        with self._lock:
+            return float(percentile(self.samples, q)) if self.samples else None
+
+
+class ProviderEndpoint:
+    """
+    One OpenAI-compatible chat completions provider.
+
+    connect is a zero-argument callable returning the SDK client; it is only
+    called on the first request. At most max_concurrency requests are in
+    flight at once. Latency of whole completions and time to first streamed
+    token are tracked separately, since they feed separate hedge delays.
+    """
+
+    def __init__(self, name: str, model: str, connect, max_concurrency: int = 4,
+                 failure_threshold: int = 3, reset_timeout: float = 30.0, latency_window: int = 200):
+        self.name = name
+        self.model = model
+        self.connect = connect
+        self.max_concurrency = max_concurrency
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyTracker(latency_window)
+        self.first_token = LatencyTracker(latency_window)
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.in_flight = 0
+        self.slot_freed = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self.connect()
+            return self._client
+
+    def acquire(self) -> bool:
+        """Reserves a request slot if the provider is under its limit and its circuit allows a call."""
+        with self._lock:
+            if self.in_flight >= self.max_concurrency:
+                self.rejected += 1
+                return False
+            if not self.breaker.allow():
+                return False
+            self.in_flight += 1
+            self.calls += 1
+            return True
+
+    def _release(self, outcome):
+        with self._lock:
+            self.in_flight -= 1
+            if outcome is False:
+                self.failures += 1
+        if outcome is True:
+            self.breaker.record_success()
+        elif outcome is False:
+            self.breaker.record_failure()
+        else:
+            self.breaker.abandon()
+        if self.slot_freed is not None:
+            with self.slot_freed:
+                self.slot_freed.notify_all()
+
+    def complete(self, messages, **params):
+        """
+        Runs one completion in a slot taken with acquire(), and releases it.
+
+        Returns (text, usage): usage is (prompt tokens, completion tokens), or
+        None if the provider did not report it.
+        """
+        start = time.monotonic()
+        outcome = False
+        try:
+            response = self.client.chat.completions.create(model=self.model, messages=messages, **params)
+            text = response.choices[0].message.content
+            self.latency.add(time.monotonic() - start)
+            outcome = True
+            usage = getattr(response, "usage", None)
+            return text, (usage.prompt_tokens, usage.completion_tokens) if usage is not None else None
+        finally:
+            self._release(outcome)
+
+    def stream(self, messages, **params):
+        """Yields streamed tokens in a slot taken with acquire(), and releases it."""
+        start = time.monotonic()
+        outcome = None
+        response = None
+        try:
+            response = self.client.chat.completions.create(model=self.model, messages=messages, stream=True, **params)
+            first = True
+            for chunk in response:
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    if first:
+                        self.first_token.add(time.monotonic() - start)
+                        first = False
+                    yield token
+            self.latency.add(time.monotonic() - start)
+            outcome = True
+        except Exception:
+            outcome = False
+            raise
+        finally:
+            if response is not None and hasattr(response, "close"):
+                response.close()
+            self._release(outcome)
+
+    def stats(self) -> dict:
+        return {
+            'provider': self.name,
+            'model': self.model,
+            'state': self.breaker.state,
+            'calls': self.calls,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'hedges': self.hedges,
+            'in_flight': self.in_flight,
+            'p50_s': self.latency.percentile(50),
+            'p95_s': self.latency.percentile(95),
+            'first_token_p95_s': self.first_token.percentile(95),
+        }
+
+
+class ProviderRouter:
+    """
+    Sends each request to the first healthy provider in priority order.
+
+    If that provider has not answered within its own p95 latency (or
+    DEFAULT_HEDGE_AFTER before enough samples exist), one hedged request goes
+    to the next provider and the first answer wins. A failed request fails
+    over to the next provider at once. Providers with an open circuit or no
+    free concurrency slot are skipped, so one degraded provider only costs
+    its p95 instead of its timeout. When every provider is at its limit, a
+    new request waits up to queue_timeout for a slot; hedges never wait.
+    """
+
+    def __init__(self, endpoints, default_hedge_after: float = DEFAULT_HEDGE_AFTER,
+                 min_samples: int = MIN_LATENCY_SAMPLES, queue_timeout: float = QUEUE_TIMEOUT,
+                 max_workers: int = 16):
+        self.endpoints = list(endpoints)
+        self.default_hedge_after = default_hedge_after
+        self.min_samples = min_samples
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+        self._slot_freed = threading.Condition()
+        for endpoint in self.endpoints:
+            endpoint.slot_freed = self._slot_freed
+
+    def _hedge_after(self, endpoint: ProviderEndpoint, tracker: LatencyTracker) -> float:
+        if len(tracker) < self.min_samples:
+            return self.default_hedge_after
+        return tracker.percentile(95)
+
+    def _acquire_next(self, tried: set):
+        for endpoint in self.endpoints:
+            if endpoint.name not in tried and endpoint.acquire():
+                tried.add(endpoint.name)
+                return endpoint
+        return None
+
+    def _acquire_first(self, tried: set):
+        """Like _acquire_next, but waits for a slot while some provider is merely busy."""
+        deadline = time.monotonic() + self.queue_timeout
+        with self._slot_freed:
+            while True:
+                endpoint = self._acquire_next(tried)
+                if endpoint is not None:
+                    return endpoint
+                busy = any(e.in_flight >= e.max_concurrency and e.breaker.state != "open" for e in self.endpoints)
+                remaining = deadline - time.monotonic()
+                if not busy or remaining <= 0:
+                    raise NoProviderAvailable(
+                        "No LLM provider available (circuits open or concurrency limits reached)")
+                self._slot_freed.wait(remaining)
+
+    def complete(self, messages, trace: dict = None, **params):
+        """
+        Returns (text, provider name) of the first successful completion.
+
+        If trace is a dict it is filled with provider, model, attempts
+        (including hedges and failovers) and the token usage the winner
+        reported (usage: (prompt, completion) tokens or None).
+
+        Raises the last provider error if every attempt failed, or
+        NoProviderAvailable if no provider could take the request.
+        """
+        tried = set()
+        primary = self._acquire_first(tried)
+        pending = {self.executor.submit(primary.complete, messages, **params): primary}
+        hedge_at = time.monotonic() + self._hedge_after(primary, primary.latency)
+        last_error = None
+
+        while pending:
+            timeout = max(0.0, hedge_at - time.monotonic()) if hedge_at is not None else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedge_at = None
+                hedge = self._acquire_next(tried)
+                if hedge is not None:
+                    hedge.hedges += 1
+                    logging.info(f"Hedging {primary.name} request to {hedge.name}")
+                    pending[self.executor.submit(hedge.complete, messages, **params)] = hedge
+                continue
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    text, usage = future.result()
+                    if trace is not None:
+                        trace.update(provider=endpoint.name, model=endpoint.model, attempts=len(tried), usage=usage)
+                    return text, endpoint.name
+                except Exception as e:
+                    logging.warning(f"{endpoint.name} request failed: {e}")
+                    last_error = e
+                    failover = self._acquire_next(tried)
+                    if failover is not None:
+                        pending[self.executor.submit(failover.complete, messages, **params)] = failover
+        if trace is not None:
+            trace.update(attempts=len(tried))
+        raise last_error
+
+    def stream(self, messages, trace: dict = None, **params):
+        """
+        Yields tokens from the first provider to produce one.
+
+        Hedging and failover apply until the first token arrives; after that
+        the answer is committed to that provider and the others are stopped.
+        If trace is a dict it is filled with provider, model, attempts and
+        first_token_s (seconds from the call to the first token).
+        """
+        start = time.monotonic()
+        events = queue.Queue()
+        tried = set()
+        active = {}
+
+        def run(endpoint, stop):
+            tokens = endpoint.stream(messages, **params)
+            try:
+                for token in tokens:
+                    if stop.is_set():
+                        break
+                    events.put((endpoint, "token", token))
+                events.put((endpoint, "done", None))
+            except Exception as e:
+                events.put((endpoint, "error", e))
+            finally:
+                tokens.close()
+
+        def launch(endpoint):
+            active[endpoint.name] = threading.Event()
+            self.executor.submit(run, endpoint, active[endpoint.name])
+
+        primary = self._acquire_first(tried)
+        launch(primary)
+        hedge_at = time.monotonic() + self._hedge_after(primary, primary.first_token)
+        winner = None
+        last_error = None
+
+        try:
+            while active:
+                timeout = max(0.0, hedge_at - time.monotonic()) if hedge_at is not None and winner is None else None
+                try:
+                    endpoint, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedge_at = None
+                    hedge = self._acquire_next(tried)
+                    if hedge is not None:
+                        hedge.hedges += 1
+                        logging.info(f"Hedging {primary.name} stream to {hedge.name}")
+                        launch(hedge)
+                    continue
+
+                if winner is not None and endpoint is not winner:
+                    if kind != "token":
+                        active.pop(endpoint.name, None)
+                    continue
+                if kind == "token":
+                    if winner is None:
+                        winner = endpoint
+                        for name, stop in active.items():
+                            if name != endpoint.name:
+                                stop.set()
+                        if trace is not None:
+                            trace.update(provider=endpoint.name, model=endpoint.model, attempts=len(tried),
+                                         first_token_s=time.monotonic() - start)
+                    yield value
+                elif kind == "done":
+                    return
+                else:
+                    active.pop(endpoint.name, None)
+                    if winner is not None:
+                        raise value
+                    logging.warning(f"{endpoint.name} stream failed: {value}")
+                    last_error = value
+                    failover = self._acquire_next(tried)
+                    if failover is not None:
+                        launch(failover)
+            if trace is not None:
+                trace.update(attempts=len(tried))
+            raise last_error
+        finally:
+            # Stops losing or abandoned streams once the caller is done.
+            for stop in active.values():
+                stop.set()
+
+    def stats(self):
+        """Per-provider counters, circuit state and latency percentiles."""
+        return [endpoint.stats() for endpoint in self.endpoints]
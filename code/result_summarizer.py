@@ -0,0 +1,149 @@
+import math
+import numpy as np
+import pandas as pd
+
+
+# Rough size of a token for English text and numbers; good enough for budgeting.
+CHARS_PER_TOKEN = 4
+CONTEXT_TOKEN_BUDGET = 400
+# Results up to this many rows are sent whole when they fit the budget.
+WHOLE_RESULT_ROWS = 100
+
+# Columns that identify a group rather than measure something.
+KEY_COLUMN_HINTS = ("hour", "day", "weekday", "month", "year", "date", "time", "zone", "lat", "lon", "id", "type")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to about max_tokens, at a line boundary where possible."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    return text[:cut if cut > limit // 2 else limit] + "\n... (truncated)"
+
+
+def _format_value(value) -> str:
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return ""
+        if value == int(value) and abs(value) < 1e15:
+            return str(int(value))
+        return f"{value:.2f}" if 1 <= abs(value) < 1e4 else f"{value:.4g}"
+    return str(value)
+
+
+def _format_rows(df: pd.DataFrame, positions) -> str:
+    """Compact CSV of the given row positions (no index, no padding)."""
+    rows = df.iloc[positions]
+    lines = [",".join(df.columns.astype(str))]
+    columns = [rows[c].to_numpy() for c in df.columns]
+    lines += [",".join(_format_value(col[i]) for col in columns) for i in range(len(rows))]
+    return "\n".join(lines)
+
+
+def pick_measure(df: pd.DataFrame):
+    """The column to rank rows by: the last numeric column that is not a group key."""
+    numeric = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+    measures = [c for c in numeric if not any(hint in str(c).lower() for hint in KEY_COLUMN_HINTS)]
+    return (measures or numeric or [None])[-1]
+
+
+def column_stats(df: pd.DataFrame) -> list:
+    """One line per column: numeric sum/mean/min/max, distinct counts otherwise."""
+    lines = []
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            values = series.to_numpy(dtype='float64')
+            valid = values[~np.isnan(values)]
+            if len(valid) == 0:
+                lines.append(f"- {column}: all null")
+                continue
+            nulls = len(values) - len(valid)
+            lines.append(
+                f"- {column}: sum {_format_value(valid.sum())}, mean {_format_value(valid.mean())}, "
+                f"min {_format_value(valid.min())}, max {_format_value(valid.max())}"
+                + (f", {nulls} null" if nulls else ""))
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            lines.append(f"- {column}: {series.min()} to {series.max()}")
+        else:
+            lines.append(f"- {column}: {series.nunique()} distinct")
+    return lines
+
+
+def summarize_result(df: pd.DataFrame, max_tokens: int = CONTEXT_TOKEN_BUDGET, top_k: int = 10,
+                     measure: str = None) -> str:
+    """
+    Turns a query result into a compact LLM context of at most ~max_tokens.
+
+    Small results that fit are sent whole, in their original order. Larger ones are
+    described by their row count, schema, per-column stats and the top_k
+    rows by measure (default: pick_measure) plus the lowest few; top_k
+    shrinks until the summary fits the budget. Stats and ranking are numpy
+    reductions, so the cost is a few passes over the columns, and only the
+    rows shown are ever formatted.
+    """
+    if df is None or len(df) == 0:
+        return "Rows: 0 (empty result)"
+    n = len(df)
+    schema = "Columns: " + ", ".join(f"{c} ({df[c].dtype})" for c in df.columns)
+
+    if n == 1:
+        row = ", ".join(f"{c}={_format_value(v)}" for c, v in zip(df.columns, df.iloc[0].to_numpy()))
+        return truncate_to_tokens(f"Rows: 1\n{row}", max_tokens)
+
+    if n <= WHOLE_RESULT_ROWS:
+        whole = f"Rows: {n}\n{_format_rows(df, np.arange(n))}"
+        if estimate_tokens(whole) <= max_tokens:
+            return whole
+
+    measure = measure or pick_measure(df)
+    stats = "Stats:\n" + "\n".join(column_stats(df))
+    if measure is not None:
+        values = df[measure].to_numpy(dtype='float64')
+        # Nulls rank last in both directions.
+        high = np.where(np.isnan(values), -np.inf, values)
+        low_values = np.where(np.isnan(values), np.inf, values)
+
+    k = top_k
+    while True:
+        if measure is not None:
+            top = np.argpartition(-high, min(k, n) - 1)[:k]
+            top = top[np.argsort(-high[top], kind='stable')]
+            m = min(max(1, k // 3), n)
+            low = np.argpartition(low_values, m - 1)[:m]
+            low = low[np.argsort(low_values[low], kind='stable')]
+            low = low[~np.isin(low, top)]
+            rows = f"Top {len(top)} rows by {measure}:\n{_format_rows(df, top)}"
+            if len(low):
+                rows += f"\nLowest {len(low)} rows by {measure}:\n{_format_rows(df, low)}"
+        else:
+            half = max(1, k // 2)
+            rows = (f"First {half} rows:\n{_format_rows(df, np.arange(half))}\n"
+                    f"Last {half} rows:\n{_format_rows(df, np.arange(n - half, n))}")
+        summary = f"Rows: {n} (summarized)\n{schema}\n{stats}\n{rows}"
+        if estimate_tokens(summary) <= max_tokens or k <= 1:
+            return truncate_to_tokens(summary, max_tokens)
+        k //= 2
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    result = pd.DataFrame({
+        'pickup_day': rng.integers(1, 32, 100000),
+        'pickup_hour': rng.integers(0, 24, 100000),
+        'trips': rng.integers(1, 500, 100000),
+        'revenue': rng.gamma(2, 500, 100000),
+    })
+    start = time.perf_counter()
+    summary = summarize_result(result)
+    elapsed = time.perf_counter() - start
+    print(f"{len(result.to_string()):,} chars as to_string() -> {len(summary):,} chars "
+          f"(~{estimate_tokens(summary)} tokens) in {elapsed:.3f}s\n")
+    print(summary)
@@ -0,0 +1,78 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from code.pipeline import ZONE_CELL_SIZE
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Parquet outputs of spark_etl.process_data that the app needs.
+SERVING_TABLES = ("revenue_daily", "hourly_demand", "zone_hourly_demand", "serving_sample")
+
+
+class SparkServingStore:
+    """
+    Serves the dashboard from the Parquet outputs of spark_etl.py instead of
+    raw CSV rows.
+
+    The KPI tables are already aggregated over every cleaned trip, and the
+    row-level views get serving_sample, a fixed-size slice. Startup and query
+    cost therefore do not grow with the raw data volume. Each table is read
+    once and kept in memory.
+    """
+
+    def __init__(self, output_dir: str = "spark_output"):
+        self.output_dir = output_dir
+        self._tables = {}
+
+    @staticmethod
+    def available(output_dir: str) -> bool:
+        """True if output_dir holds every table in SERVING_TABLES."""
+        return all(os.path.isdir(os.path.join(output_dir, name)) for name in SERVING_TABLES)
+
+    def table(self, name: str) -> pd.DataFrame:
+        if name not in self._tables:
+            self._tables[name] = pd.read_parquet(os.path.join(self.output_dir, name))
+        return self._tables[name]
+
+    def load_sample(self) -> pd.DataFrame:
+        """The serving sample of cleaned trips, in the shape MobilityDataAnalyzer produces."""
+        sample = self.table("serving_sample").copy()
+        for column in ('tpep_pickup_datetime', 'tpep_dropoff_datetime'):
+            sample[column] = pd.to_datetime(sample[column]).dt.tz_localize(None)
+        for column in ('pickup_year', 'pickup_month', 'pickup_day'):
+            sample[column] = sample[column].astype('int32')
+        logging.info(f"Loaded {len(sample):,} serving-sample trips from {self.output_dir}.")
+        return sample.reset_index(drop=True)
+
+    def get_hourly_demand(self) -> pd.DataFrame:
+        demand = self.table("hourly_demand")
+        return demand[['pickup_hour', 'trip_count', 'avg_distance']].sort_values('pickup_hour').reset_index(drop=True)
+
+    def get_revenue_trends(self) -> pd.DataFrame:
+        """Revenue per day; keeps year/month so multi-month outputs stay distinct."""
+        daily = self.table("revenue_daily").sort_values(['pickup_year', 'pickup_month', 'pickup_day'])
+        return daily[['pickup_year', 'pickup_month', 'pickup_day', 'total_revenue', 'avg_fare']].reset_index(drop=True)
+
+    def get_top_pickup_zones(self, limit: int = 10) -> pd.DataFrame:
+        """Busiest zone cells (the 0.01 degree grid of zone_hourly_demand)."""
+        zones = self.table("zone_hourly_demand").groupby(['zone_lat', 'zone_lon'], as_index=False) \
+            .agg(trip_count=('trip_count', 'sum'), revenue=('total_revenue', 'sum'))
+        zones['avg_revenue'] = zones['revenue'] / zones['trip_count']
+        top = zones.nlargest(limit, 'trip_count')
+        top = top.rename(columns={'zone_lat': 'lat', 'zone_lon': 'lon'})[
+            ['lat', 'lon', 'trip_count', 'avg_revenue']].reset_index(drop=True)
+        top['cell_deg'] = ZONE_CELL_SIZE
+        return top
+
+    def get_kpi_summary(self) -> dict:
+        """Headline totals over every cleaned trip, derived from the daily and hourly tables."""
+        daily, hourly = self.table("revenue_daily"), self.table("hourly_demand")
+        trips = int(daily['trip_count'].sum())
+        return {
+            'total_trips': trips,
+            'total_revenue': float(daily['total_revenue'].sum()),
+            'avg_fare': float(np.dot(daily['avg_fare'], daily['trip_count']) / trips) if trips else 0.0,
+            'avg_distance': float(np.dot(hourly['avg_distance'], hourly['trip_count']) / trips) if trips else 0.0,
+        }
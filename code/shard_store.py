@@ -0,0 +1,208 @@
+import os
+import sqlite3
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CATALOG_FILE = "catalog.db"
+AGGREGATES = ('count', 'sum', 'avg', 'min', 'max')
+
+
+def _run_on_shard(path: str, query: str, params: tuple) -> pd.DataFrame:
+    """Process-pool worker: runs one query against one shard file."""
+    conn = sqlite3.connect(path)
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+
+class ShardedTripStore:
+    """
+    Stores trips as one SQLite file per pickup month, with a catalog of each
+    shard's row count and pickup-time range.
+
+    Queries with a time range only open the shards whose range overlaps it,
+    and aggregations run on every selected shard in a process pool. Each shard
+    returns partial counts/sums/minima/maxima, which are merged here. The pool
+    is started on the first fan-out and kept until close().
+    """
+
+    def __init__(self, root_dir: str = "mobility_shards", max_workers: int = None):
+        self.root_dir = root_dir
+        self.max_workers = max_workers
+        self._touched = set()
+        self._pool = None
+        os.makedirs(root_dir, exist_ok=True)
+        self.catalog = sqlite3.connect(os.path.join(root_dir, CATALOG_FILE), check_same_thread=False)
+        with self.catalog:
+            self.catalog.execute("""
+                CREATE TABLE IF NOT EXISTS shards (
+                    month TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    min_pickup_ts INTEGER,
+                    max_pickup_ts INTEGER
+                )
+            """)
+
+    def begin_ingest(self):
+        """Starts a new ingest: the first write to each month replaces its shard."""
+        self._touched = set()
+
+    def end_ingest(self):
+        """Drops the shards of months the ingest did not write, e.g. left over from another file."""
+        stale = self.catalog.execute(
+            f"SELECT month, path FROM shards WHERE month NOT IN ({', '.join('?' * len(self._touched))})",
+            sorted(self._touched)).fetchall()
+        with self.catalog:
+            self.catalog.executemany("DELETE FROM shards WHERE month = ?", [(month,) for month, _ in stale])
+        for month, path in stale:
+            path = os.path.join(self.root_dir, path)
+            if os.path.exists(path):
+                os.remove(path)
+            logging.info(f"Dropped stale shard {month}")
+
+    def write(self, df: pd.DataFrame):
+        """
+        Routes a chunk of timestamp-encoded trips (epoch seconds) to its month
+        shards and updates the catalog.
+        """
+        months = pd.to_datetime(df['tpep_pickup_datetime'], unit='s').dt.strftime('%Y-%m')
+        for month, part in df.groupby(months.to_numpy(), sort=True):
+            path = os.path.join(self.root_dir, f"trips_{month.replace('-', '_')}.db")
+            mode = 'append' if month in self._touched else 'replace'
+            self._touched.add(month)
+
+            conn = sqlite3.connect(path)
+            try:
+                part.to_sql('trips', conn, if_exists=mode, index=False)
+                with conn:
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_trips_pickup_ts ON trips (tpep_pickup_datetime)")
+                rows, low, high = conn.execute(
+                    "SELECT COUNT(*), MIN(tpep_pickup_datetime), MAX(tpep_pickup_datetime) FROM trips"
+                ).fetchone()
+            finally:
+                conn.close()
+
+            with self.catalog:
+                self.catalog.execute(
+                    "INSERT OR REPLACE INTO shards (month, path, row_count, min_pickup_ts, max_pickup_ts) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (month, os.path.basename(path), rows, low, high)
+                )
+            logging.info(f"Shard {month}: {rows:,} rows")
+
+    def list_shards(self) -> pd.DataFrame:
+        return pd.read_sql_query("SELECT * FROM shards ORDER BY month", self.catalog)
+
+    def shards_for(self, start: int = None, end: int = None) -> list:
+        """Paths of the shards whose pickup range overlaps [start, end) (epoch seconds)."""
+        query = "SELECT path FROM shards WHERE row_count > 0"
+        params = []
+        if start is not None:
+            query += " AND max_pickup_ts >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND min_pickup_ts < ?"
+            params.append(end)
+        rows = self.catalog.execute(query + " ORDER BY month", params).fetchall()
+        return [os.path.join(self.root_dir, path) for (path,) in rows]
+
+    def _fan_out(self, paths: list, query: str, params: tuple) -> list:
+        if len(paths) <= 1 or self.max_workers == 1:
+            return [_run_on_shard(path, query, params) for path in paths]
+        if self._pool is None:
+            # Worker start-up (a full interpreter under spawn) is paid once per store.
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return list(self._pool.map(_run_on_shard, paths, [query] * len(paths), [params] * len(paths)))
+
+    def close(self):
+        """Stops the worker pool and closes the catalog."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self.catalog.close()
+
+    def query(self, query: str, params: tuple = (), start: int = None, end: int = None) -> pd.DataFrame:
+        """
+        Runs the same query on every shard overlapping [start, end) and
+        concatenates the results. The caller's WHERE clause must apply the
+        time range itself; start/end only prune shards.
+        """
+        paths = self.shards_for(start, end)
+        if not paths:
+            return pd.DataFrame()
+        return pd.concat(self._fan_out(paths, query, tuple(params)), ignore_index=True)
+
+    def aggregate(self, measures: dict, group_by=(), start: int = None, end: int = None,
+                  where: str = None, params: tuple = ()) -> pd.DataFrame:
+        """
+        Fans an aggregation out over the shards for [start, end) and merges
+        the partial results.
+
+        Args:
+            measures (dict): Output column -> (function, column), with function
+                one of AGGREGATES, e.g. {'revenue': ('sum', 'total_amount')}.
+            group_by (list): Columns to group by.
+            start, end (int): Optional pickup-time bounds in epoch seconds.
+            where (str): Extra SQL predicate, with '?' placeholders bound from params.
+
+        Returns:
+            pd.DataFrame: One row per group, sorted by the group columns.
+        """
+        group_by = list(group_by)
+
+        partials, merge = [], {}
+        for name, (func, column) in measures.items():
+            if func not in AGGREGATES:
+                raise ValueError(f"Unsupported aggregate: {func}")
+            if func in ('sum', 'avg'):
+                partials.append(f"SUM({column}) AS {name}__sum")
+                merge[f"{name}__sum"] = 'sum'
+            if func in ('count', 'avg'):
+                counted = "*" if column in ("*", None) else column
+                partials.append(f"COUNT({counted}) AS {name}__count")
+                merge[f"{name}__count"] = 'sum'
+            if func in ('min', 'max'):
+                partials.append(f"{func.upper()}({column}) AS {name}__{func}")
+                merge[f"{name}__{func}"] = func
+
+        clauses, bound = [], []
+        if start is not None:
+            clauses.append("tpep_pickup_datetime >= ?")
+            bound.append(start)
+        if end is not None:
+            clauses.append("tpep_pickup_datetime < ?")
+            bound.append(end)
+        if where:
+            clauses.append(f"({where})")
+            bound.extend(params)
+
+        query = f"SELECT {', '.join(group_by + partials)} FROM trips"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        if group_by:
+            query += f" GROUP BY {', '.join(group_by)}"
+
+        parts = self._fan_out(self.shards_for(start, end), query, tuple(bound))
+        if not parts:
+            return pd.DataFrame(columns=group_by + list(measures))
+        combined = pd.concat(parts, ignore_index=True)
+        if group_by:
+            merged = combined.groupby(group_by, sort=True).agg(merge).reset_index()
+        else:
+            merged = combined.agg(merge).to_frame().T
+
+        result = merged[group_by].copy()
+        for name, (func, _) in measures.items():
+            if func == 'avg':
+                result[name] = merged[f"{name}__sum"] / merged[f"{name}__count"]
+            elif func == 'count':
+                result[name] = merged[f"{name}__count"].astype('int64')
+            else:
+                result[name] = merged[f"{name}__{func}"]
+        return result
@@ -0,0 +1,303 @@
+import logging
+import numpy as np
+import pandas as pd
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+QUANTILE_COLUMNS = ['fare_amount', 'trip_distance', 'total_amount', 'tip_amount']
+
+# Pickup cells use the same 3-decimal rounding as the SQLite get_top_pickup_zones().
+PICKUP_CELL_SIZE = 0.001
+CELL_LON_OFFSET = 500_000
+
+
+def pickup_cell_key(lat, lon) -> np.ndarray:
+    """Packs ROUND(lat, 3), ROUND(lon, 3) into a single int64 key."""
+    lat_i = np.round(np.asarray(lat, dtype='float64') * 1000).astype('int64')
+    lon_i = np.round(np.asarray(lon, dtype='float64') * 1000).astype('int64')
+    return lat_i * 1_000_000 + (lon_i + CELL_LON_OFFSET)
+
+
+def decode_pickup_cell(key):
+    """Inverse of pickup_cell_key(): returns (lat, lon) arrays."""
+    lat_i, lon_i = np.divmod(np.asarray(key, dtype='int64'), 1_000_000)
+    return lat_i / 1000.0, (lon_i - CELL_LON_OFFSET) / 1000.0
+
+
+def _hash(values) -> np.ndarray:
+    return pd.util.hash_array(np.asarray(values))
+
+
+def _mix(h: np.ndarray, seed: int) -> np.ndarray:
+    """splitmix64 finalizer, used to derive independent hashes per sketch row."""
+    with np.errstate(over='ignore'):
+        z = h + np.uint64((seed * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """Exact bit length of uint64 values, computed on two 32-bit halves."""
+    hi = (x >> np.uint64(32)).astype('float64')
+    lo = (x & np.uint64(0xFFFFFFFF)).astype('float64')
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1])
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter with 2^p one-byte registers
+    (~1.04 / sqrt(2^p) relative error; p=12 gives ~1.6%).
+    """
+
+    def __init__(self, p: int = 12, registers: np.ndarray = None):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype='uint8') if registers is None else registers
+
+    def update(self, values):
+        h = _hash(values)
+        if len(h) == 0:
+            return self
+        shift = np.uint64(64 - self.p)
+        index = (h >> shift).astype('int64')
+        rest = h & np.uint64((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p - _bit_length(rest) + 1).astype('uint8')
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLogs with different precision.")
+        return HyperLogLog(self.p, np.maximum(self.registers, other.registers))
+
+    def count(self) -> float:
+        m = float(len(self.registers))
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype('int64')))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return float(estimate)
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch with optional weights. Estimates never undercount and
+    overcount by at most e/width of the total weight with probability
+    1 - exp(-depth).
+    """
+
+    def __init__(self, width: int = 1 << 16, depth: int = 4, table: np.ndarray = None):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width)) if table is None else table
+
+    def _indexes(self, keys):
+        h = _hash(keys)
+        return [(_mix(h, row + 1) % np.uint64(self.width)).astype('int64') for row in range(self.depth)]
+
+    def update(self, keys, weights=None):
+        for row, index in enumerate(self._indexes(keys)):
+            self.table[row] += np.bincount(index, weights=weights, minlength=self.width)
+        return self
+
+    def estimate(self, keys) -> np.ndarray:
+        return np.min([self.table[row, index] for row, index in enumerate(self._indexes(keys))], axis=0)
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge Count-Min sketches with different dimensions.")
+        return CountMinSketch(self.width, self.depth, self.table + other.table)
+
+
+class HeavyHitters:
+    """
+    Top-K tracker: Count-Min sketches for counts and a summed value, plus a
+    bounded candidate set re-ranked after every update.
+    """
+
+    def __init__(self, capacity: int = 200, counts: CountMinSketch = None,
+                 values: CountMinSketch = None, candidates: np.ndarray = None):
+        self.capacity = capacity
+        self.counts = counts or CountMinSketch()
+        self.values = values or CountMinSketch()
+        self.candidates = np.empty(0, dtype='int64') if candidates is None else candidates
+
+    def _prune(self, keys):
+        keys = np.unique(keys)
+        if len(keys) > self.capacity:
+            keys = keys[np.argsort(-self.counts.estimate(keys), kind='stable')[:self.capacity]]
+        self.candidates = keys
+
+    def update(self, keys, values=None):
+        keys = np.asarray(keys, dtype='int64')
+        self.counts.update(keys)
+        if values is not None:
+            self.values.update(keys, np.nan_to_num(np.asarray(values, dtype='float64')))
+        self._prune(np.concatenate([self.candidates, keys]))
+        return self
+
+    def merge(self, other: "HeavyHitters") -> "HeavyHitters":
+        merged = HeavyHitters(max(self.capacity, other.capacity),
+                              self.counts.merge(other.counts), self.values.merge(other.values))
+        merged._prune(np.concatenate([self.candidates, other.candidates]))
+        return merged
+
+    def top(self, k: int = 10):
+        """Returns (keys, estimated_counts, estimated_value_sums) of the top k keys."""
+        counts = self.counts.estimate(self.candidates)
+        order = np.argsort(-counts, kind='stable')[:k]
+        keys = self.candidates[order]
+        return keys, counts[order], self.values.estimate(keys)
+
+
+class TDigest:
+    """
+    Merging t-digest for streaming quantiles, compressed with the arcsine
+    scale function so centroids stay small near the tails.
+    """
+
+    def __init__(self, delta: float = 200, means: np.ndarray = None, weights: np.ndarray = None,
+                 minimum: float = np.inf, maximum: float = -np.inf):
+        self.delta = delta
+        self.means = np.empty(0) if means is None else means
+        self.weights = np.empty(0) if weights is None else weights
+        self.min = minimum
+        self.max = maximum
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = np.floor(self.delta / (2 * np.pi) * np.arcsin(2 * q - 1))
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(k)) + 1])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(len(values))]))
+        return self
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        merged = TDigest(self.delta, minimum=min(self.min, other.min), maximum=max(self.max, other.max))
+        if len(self.means) or len(other.means):
+            merged._compress(np.concatenate([self.means, other.means]),
+                             np.concatenate([self.weights, other.weights]))
+        return merged
+
+    def quantile(self, q):
+        """Estimated value(s) at quantile(s) q in [0, 1]."""
+        if len(self.means) == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        total = self.weights.sum()
+        mids = np.concatenate([[0], np.cumsum(self.weights) - self.weights / 2, [total]])
+        points = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(np.asarray(q) * total, mids, points)
+
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+
+class MobilitySketches:
+    """
+    The sketches maintained at ingest: distinct pickup cells (overall and per
+    hour), top pickup cells with revenue, and quantiles of the fare/distance
+    columns. Every part is mergeable, so chunks and partitions can be sketched
+    independently and combined.
+    """
+
+    def __init__(self):
+        self.distinct_cells = HyperLogLog()
+        self.distinct_cells_by_hour = [HyperLogLog() for _ in range(24)]
+        self.top_cells = HeavyHitters()
+        self.digests = {c: TDigest() for c in QUANTILE_COLUMNS}
+        self.rows = 0
+
+    def update(self, df: pd.DataFrame):
+        """Folds a cleaned, feature-engineered chunk into the sketches."""
+        keys = pickup_cell_key(df['pickup_latitude'].to_numpy(), df['pickup_longitude'].to_numpy())
+        self.distinct_cells.update(keys)
+        hours = df['pickup_hour'].to_numpy()
+        for hour in np.unique(hours):
+            self.distinct_cells_by_hour[int(hour)].update(keys[hours == hour])
+        self.top_cells.update(keys, df['total_amount'].to_numpy())
+        for column, digest in self.digests.items():
+            digest.update(df[column].to_numpy())
+        self.rows += len(df)
+        return self
+
+    def merge(self, other: "MobilitySketches") -> "MobilitySketches":
+        merged = MobilitySketches()
+        merged.distinct_cells = self.distinct_cells.merge(other.distinct_cells)
+        merged.distinct_cells_by_hour = [a.merge(b) for a, b in
+                                         zip(self.distinct_cells_by_hour, other.distinct_cells_by_hour)]
+        merged.top_cells = self.top_cells.merge(other.top_cells)
+        merged.digests = {c: self.digests[c].merge(other.digests[c]) for c in self.digests}
+        merged.rows = self.rows + other.rows
+        return merged
+
+    def top_pickup_zones(self, limit: int = 10) -> pd.DataFrame:
+        """Same shape as MobilityDBManager.get_top_pickup_zones(), from the sketch."""
+        keys, counts, revenue = self.top_cells.top(limit)
+        lat, lon = decode_pickup_cell(keys)
+        return pd.DataFrame({
+            'lat': lat,
+            'lon': lon,
+            'trip_count': counts.astype('int64'),
+            'avg_revenue': revenue / np.maximum(counts, 1),
+            'cell_deg': PICKUP_CELL_SIZE,
+        })
+
+    def distinct_pickup_cells(self, hour: int = None) -> float:
+        sketch = self.distinct_cells if hour is None else self.distinct_cells_by_hour[hour]
+        return sketch.count()
+
+    def quantile(self, column: str, q):
+        return self.digests[column].quantile(q)
+
+    def save(self, path: str):
+        arrays = {
+            'rows': np.array([self.rows]),
+            'hll': self.distinct_cells.registers,
+            'hll_by_hour': np.stack([h.registers for h in self.distinct_cells_by_hour]),
+            'hh_counts': self.top_cells.counts.table,
+            'hh_values': self.top_cells.values.table,
+            'hh_candidates': self.top_cells.candidates,
+        }
+        for column, digest in self.digests.items():
+            arrays[f"td_{column}_means"] = digest.means
+            arrays[f"td_{column}_weights"] = digest.weights
+            arrays[f"td_{column}_range"] = np.array([digest.min, digest.max])
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        logging.info(f"Saved sketches to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "MobilitySketches":
+        sketches = cls()
+        with np.load(path) as data:
+            sketches.rows = int(data['rows'][0])
+            sketches.distinct_cells = HyperLogLog(registers=data['hll'])
+            sketches.distinct_cells_by_hour = [HyperLogLog(registers=r) for r in data['hll_by_hour']]
+            counts, values = data['hh_counts'], data['hh_values']
+            sketches.top_cells = HeavyHitters(
+                counts=CountMinSketch(counts.shape[1], counts.shape[0], counts),
+                values=CountMinSketch(values.shape[1], values.shape[0], values),
+                candidates=data['hh_candidates'],
+            )
+            for column in QUANTILE_COLUMNS:
+                low, high = data[f"td_{column}_range"]
+                sketches.digests[column] = TDigest(
+                    means=data[f"td_{column}_means"], weights=data[f"td_{column}_weights"],
+                    minimum=float(low), maximum=float(high),
+                )
+        return sketches
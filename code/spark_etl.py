@@ -1,84 +1,455 @@
+import time
+import argparse
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, unix_timestamp, round, hour, dayofmonth, from_unixtime
+from pyspark.sql.functions import col, round, input_file_name, regexp_extract, broadcast, floor, least, \
+    greatest, lit, when, count, avg, sum as spark_sum, shiftleft, shiftright
+from pyspark.sql.window import Window
+from pyspark.sql.types import StructType, StructField, IntegerType, DoubleType, StringType, TimestampType
+from code.pipeline import NYC_LAT_RANGE, NYC_LON_RANGE, ZONE_CELL_SIZE, zone_grid_shape, run_spark
+from code.spark_metrics import SparkRunRecorder
 
-def create_spark_session(app_name="MobilityAnalyticsETL"):
+# Yellow tripdata (2015-2016 layout). Declaring it up front saves the extra
+# full pass over the CSV that inferSchema needs.
+TRIP_SCHEMA = StructType([
+    StructField("VendorID", IntegerType()),
+    StructField("tpep_pickup_datetime", TimestampType()),
+    StructField("tpep_dropoff_datetime", TimestampType()),
+    StructField("passenger_count", IntegerType()),
+    StructField("trip_distance", DoubleType()),
+    StructField("pickup_longitude", DoubleType()),
+    StructField("pickup_latitude", DoubleType()),
+    StructField("RatecodeID", IntegerType()),
+    StructField("store_and_fwd_flag", StringType()),
+    StructField("dropoff_longitude", DoubleType()),
+    StructField("dropoff_latitude", DoubleType()),
+    StructField("payment_type", IntegerType()),
+    StructField("fare_amount", DoubleType()),
+    StructField("extra", DoubleType()),
+    StructField("mta_tax", DoubleType()),
+    StructField("tip_amount", DoubleType()),
+    StructField("tolls_amount", DoubleType()),
+    StructField("improvement_surcharge", DoubleType()),
+    StructField("total_amount", DoubleType()),
+])
+
+TIMESTAMP_FORMAT = "yyyy-MM-dd HH:mm:ss"
+
+PARTITION_COLUMNS = ["pickup_year", "pickup_month", "pickup_day"]
+LEDGER_DIR = "_processed_files"
+# TLC files are named by month (yellow_tripdata_2016-01.csv); rows of a file
+# are kept only for that month, so a few mis-dated trips cannot overwrite a
+# partition that belongs to another file.
+FILE_MONTH_PATTERN = r"(\d{4})-(\d{2})[^/]*$"
+
+# Output layout of cleaned_trips. Day partitions hold a few hundred thousand
+# trips, so files are capped at TARGET_FILE_MB. Within a day rows are sorted
+# by Z-order over lat/lon first, so each row group covers one contiguous
+# Z-range, and row groups of ~20k rows keep those ranges small enough for
+# bounding-box reads to skip most groups (time is pruned by day partition).
+TARGET_FILE_MB = 128
+ROW_GROUP_MB = 1
+ESTIMATED_ROW_BYTES = 48  # compressed Parquet bytes per cleaned trip
+ZORDER_BITS = 16
+
+# Rows of cleaned trips kept in serving_sample, the bounded slice the
+# dashboard loads for row-level views and ad-hoc SQL.
+SERVING_SAMPLE_ROWS = 50000
+
+PEAK_HOURS = [7, 8, 9, 16, 17, 18, 19]
+# Upper bounds (USD, total_amount) of the revenue segments; the last is open-ended.
+REVENUE_SEGMENTS = [("low", 10.0), ("standard", 25.0), ("premium", 60.0), ("high_value", None)]
+
+def timed_action(timings, label, action, recorder=None, plan=None):
+    """
+    Runs one Spark action, records and prints its wall time. With a
+    SparkRunRecorder, its stages are tagged with label and the physical plan
+    of the `plan` DataFrame is kept for the run report.
+    """
+    if recorder is not None:
+        action = recorder.track(label, action)
+    start = time.perf_counter()
+    result = action()
+    timings[label] = time.perf_counter() - start
+    print(f"[timing] {label}: {timings[label]:.2f}s")
+    if recorder is not None and plan is not None:
+        recorder.save_plan(label, plan)
+    return result
+
+def create_spark_session(app_name="MobilityAnalyticsETL", master=None, shuffle_partitions=None):
     """
     Creates and returns a SparkSession.
     """
-    return SparkSession.builder \
-        .appName(app_name) \
-        .getOrCreate()
+    builder = SparkSession.builder.appName(app_name)
+    if master:
+        builder = builder.master(master)
+    if shuffle_partitions:
+        builder = builder.config("spark.sql.shuffle.partitions", str(shuffle_partitions))
+    # Timestamps are naive local times: parse and extract them in UTC so no
+    # DST shift makes hour/day differ from the pandas path.
+    builder = builder.config("spark.sql.session.timeZone", "UTC")
+    # Overwrites replace only the partitions present in the written data.
+    builder = builder.config("spark.sql.sources.partitionOverwriteMode", "dynamic")
+    return builder.getOrCreate()
 
-def process_data(input_path, output_path):
+def list_input_files(spark, input_paths):
     """
-    Reads, cleans, and computes KPIs using PySpark.
+    Expands paths and globs through the Hadoop FileSystem API (so local, HDFS
+    and S3 inputs all work) into (path, size, modified) records.
     """
-    spark = create_spark_session()
-    
+    if isinstance(input_paths, str):
+        input_paths = [input_paths]
+    jvm = spark.sparkContext._jvm
+    conf = spark.sparkContext._jsc.hadoopConfiguration()
+    files = {}
+    for pattern in input_paths:
+        path = jvm.org.apache.hadoop.fs.Path(pattern)
+        statuses = path.getFileSystem(conf).globStatus(path) or []
+        for status in statuses:
+            if status.isFile():
+                files[status.getPath().toString()] = {
+                    "path": status.getPath().toString(),
+                    "size": status.getLen(),
+                    "modified": status.getModificationTime(),
+                }
+    return sorted(files.values(), key=lambda f: f["path"])
 
-    print(f"Reading data from {input_path}...")
-    df = spark.read.option("header", "true").option("inferSchema", "true").csv(input_path)
-    
-    initial_count = df.count()
-    print(f"Initial Count: {initial_count}")
-    
+def read_ledger(spark, output_path):
+    """(path, size, modified) of every input file already processed into output_path."""
+    ledger_path = f"{output_path}/{LEDGER_DIR}"
+    jvm = spark.sparkContext._jvm
+    path = jvm.org.apache.hadoop.fs.Path(ledger_path)
+    if not path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration()).exists(path):
+        return set()
+    return {(r["path"], r["size"], r["modified"]) for r in spark.read.json(ledger_path).collect()}
+
+def append_ledger(spark, output_path, files, mode="append"):
+    """Records files as processed. Written last, so a failed run is retried in full."""
+    processed_at = int(time.time())
+    rows = [dict(f, processed_at=processed_at) for f in files]
+    spark.createDataFrame(rows, "path string, size long, modified long, processed_at long") \
+        .coalesce(1).write.mode(mode).json(f"{output_path}/{LEDGER_DIR}")
+
+def read_trips(spark, input_paths):
+    """
+    Reads one or more monthly tripdata CSVs with the declared schema.
+
+    Args:
+        input_paths (str or list): A path, a glob such as
+            "data/yellow_tripdata_2016-*.csv", or a list of either.
+    """
+    if isinstance(input_paths, str):
+        input_paths = [input_paths]
+    return spark.read \
+        .option("header", "true") \
+        .option("timestampFormat", TIMESTAMP_FORMAT) \
+        .schema(TRIP_SCHEMA) \
+        .csv(input_paths)
+
+def zorder_key(lat_col="pickup_latitude", lon_col="pickup_longitude", bits=ZORDER_BITS):
+    """
+    Column expression for the Z-order (Morton) code of a point: lat/lon are
+    quantized to `bits` bits over the NYC bounding box and their bits
+    interleaved, so nearby points get nearby codes.
+    """
+    scale = (1 << bits) - 1
+    def quantize(column, low_high):
+        low, high = low_high
+        return least(greatest(floor((col(column) - low) / (high - low) * scale), lit(0)), lit(scale)).cast("long")
+    y, x = quantize(lat_col, NYC_LAT_RANGE), quantize(lon_col, NYC_LON_RANGE)
+    code = lit(0).cast("long")
+    for i in range(bits):
+        code = code.bitwiseOR(shiftleft(shiftright(x, i).bitwiseAND(1), 2 * i)) \
+                   .bitwiseOR(shiftleft(shiftright(y, i).bitwiseAND(1), 2 * i + 1))
+    return code
+
+def layout_for_write(df, target_file_mb=TARGET_FILE_MB, row_group_mb=ROW_GROUP_MB):
+    """
+    Arranges cleaned trips for the Parquet write: one task per output
+    partition (so a day becomes one file, split at the target size instead of
+    one small file per shuffle task) and rows sorted by Z-order cell, then
+    pickup hour, within it.
 
-    df_clean = df.filter(
-        (col("passenger_count") > 0) & 
-        (col("trip_distance") > 0) & 
-        (col("total_amount") > 0)
+    Returns:
+        tuple: (DataFrame, dict of writer options)
+    """
+    laid_out = df.repartition(*PARTITION_COLUMNS) \
+                 .sortWithinPartitions(*PARTITION_COLUMNS, zorder_key(), "pickup_hour", "tpep_pickup_datetime")
+    options = {
+        "maxRecordsPerFile": str(target_file_mb * 1024 * 1024 // ESTIMATED_ROW_BYTES),
+        "parquet.block.size": str(row_group_mb * 1024 * 1024),
+    }
+    return laid_out, options
+
+def describe_layout(spark, path):
+    """Prints the number of Parquet files under path and their average size."""
+    jvm = spark.sparkContext._jvm
+    hadoop_path = jvm.org.apache.hadoop.fs.Path(path)
+    fs = hadoop_path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration())
+    files = fs.listFiles(hadoop_path, True)
+    count_files, total = 0, 0
+    while files.hasNext():
+        status = files.next()
+        if status.getPath().getName().endswith(".parquet"):
+            count_files += 1
+            total += status.getLen()
+    if count_files:
+        print(f"[layout] {path}: {count_files} files, avg {total / count_files / 1024 / 1024:.1f} MB")
+
+def zone_lookup(spark, cell_size=ZONE_CELL_SIZE):
+    """
+    One row per zone cell of the NYC grid (same ids as
+    mobility_analytics.assign_zone_cell) with its row, column and centre.
+    A few thousand rows, small enough to broadcast to every executor.
+    """
+    rows, cols = zone_grid_shape(cell_size)
+    return spark.range(rows * cols).select(
+        col("id").cast("int").alias("pickup_zone"),
+        floor(col("id") / cols).cast("int").alias("zone_row"),
+        (col("id") % cols).cast("int").alias("zone_col"),
+    ).withColumn("zone_lat", round(lit(NYC_LAT_RANGE[0]) + (col("zone_row") + 0.5) * cell_size, 5)) \
+     .withColumn("zone_lon", round(lit(NYC_LON_RANGE[0]) + (col("zone_col") + 0.5) * cell_size, 5))
+
+def assign_zones(trips, zones, cell_size=ZONE_CELL_SIZE):
+    """
+    Adds pickup_zone plus the zone centre. The cell id is plain arithmetic on
+    the coordinates and the lookup is a broadcast join, so no trips are shuffled.
+    """
+    rows, cols = zone_grid_shape(cell_size)
+    zone_row = least(greatest(floor((col("pickup_latitude") - NYC_LAT_RANGE[0]) / cell_size), lit(0)), lit(rows - 1))
+    zone_col = least(greatest(floor((col("pickup_longitude") - NYC_LON_RANGE[0]) / cell_size), lit(0)), lit(cols - 1))
+    trips = trips.withColumn("pickup_zone", (zone_row * cols + zone_col).cast("int"))
+    return trips.join(broadcast(zones.select("pickup_zone", "zone_lat", "zone_lon")), "pickup_zone")
+
+def revenue_segment(column):
+    """Column expression naming the REVENUE_SEGMENTS band of a total_amount column."""
+    expr = None
+    for name, upper in REVENUE_SEGMENTS:
+        if upper is None:
+            return expr.otherwise(name) if expr is not None else lit(name)
+        expr = when(column < upper, name) if expr is None else expr.when(column < upper, name)
+    return expr
+
+def compute_zone_kpis(trips, zones):
+    """
+    Builds the zone-level KPI tables from the cleaned trips.
+
+    Returns:
+        dict: Output name -> DataFrame with
+            zone_hourly_demand: trips, revenue and average fare per zone and hour.
+            zone_congestion: average speed per zone and hour, with a congestion
+                index = the zone's all-day speed / that hour's speed (>1 is slower
+                than usual) and a peak-hour flag.
+            revenue_segments: trip count, revenue, share and tip rate per
+                revenue band and hour.
+    """
+    zoned = assign_zones(trips, zones)
+    keys = ["pickup_zone", "zone_lat", "zone_lon", "pickup_hour"]
+
+    zone_hourly_demand = zoned.groupBy(*keys).agg(
+        count("*").alias("trip_count"),
+        round(spark_sum("total_amount"), 2).alias("total_revenue"),
+        round(avg("fare_amount"), 2).alias("avg_fare"),
     )
-    
 
-    df_clean = df_clean.filter(
-        (col("pickup_latitude").between(40.5, 40.95)) &
-        (col("pickup_longitude").between(-74.25, -73.7))
+    # Speed is a ratio of sums (miles / hours), so short trips do not dominate it.
+    timed = zoned.filter((col("trip_duration_min") > 0) & (col("trip_duration_min") < 600))
+    zone_congestion = timed.groupBy(*keys).agg(
+        count("*").alias("trip_count"),
+        spark_sum("trip_distance").alias("miles"),
+        (spark_sum("trip_duration_min") / 60).alias("hours"),
     )
+    by_zone = Window.partitionBy("pickup_zone")
+    zone_congestion = zone_congestion \
+        .withColumn("avg_speed_mph", round(col("miles") / col("hours"), 2)) \
+        .withColumn("zone_speed_mph", spark_sum("miles").over(by_zone) / spark_sum("hours").over(by_zone)) \
+        .withColumn("congestion_index", round(col("zone_speed_mph") / (col("miles") / col("hours")), 3)) \
+        .withColumn("is_peak_hour", col("pickup_hour").isin(PEAK_HOURS)) \
+        .drop("miles", "hours", "zone_speed_mph")
+
+    segmented = trips.withColumn("revenue_segment", revenue_segment(col("total_amount")))
+    revenue_segments = segmented.groupBy("revenue_segment", "pickup_hour").agg(
+        count("*").alias("trip_count"),
+        round(spark_sum("total_amount"), 2).alias("total_revenue"),
+        round(spark_sum("tip_amount") / spark_sum("fare_amount"), 4).alias("tip_rate"),
+    ).withColumn("revenue_share", round(
+        col("total_revenue") / spark_sum("total_revenue").over(Window.partitionBy("pickup_hour")), 4))
+
+    return {
+        "zone_hourly_demand": zone_hourly_demand,
+        "zone_congestion": zone_congestion,
+        "revenue_segments": revenue_segments,
+    }
+
+def process_data(input_paths, output_path, spark=None, count_input=False, full_refresh=False,
+                 target_file_mb=TARGET_FILE_MB, row_group_mb=ROW_GROUP_MB, report_dir=None):
+    """
+    Reads, cleans, and computes KPIs using PySpark.
+
+    The CSV is scanned once: the cleaned trips are written to Parquet and
+    read back, and every KPI is computed from that columnar copy instead of
+    re-reading and re-cleaning the source for each action.
+
+    Runs are incremental: input files already listed in the output's ledger
+    (same path, size and modification time) are skipped, and the cleaned trips
+    are written with dynamic partition overwrite, so only the year/month/day
+    partitions of the new files are rewritten. The KPIs, including the zone
+    demand/congestion and revenue-segment tables, are then recomputed from the
+    full cleaned dataset.
+
+    Args:
+        count_input (bool): Also count raw input rows. This costs a second
+            full scan of the CSV, so it is off by default.
+        full_refresh (bool): Ignore the ledger and rebuild every partition.
+        target_file_mb, row_group_mb (int): Parquet file and row-group sizes
+            for cleaned_trips (see layout_for_write).
+        report_dir (str): If set, collect per-stage metrics and physical plans
+            and write a JSON/HTML run report there (see spark_metrics).
+
+    Returns:
+        dict: Wall time in seconds for each Spark action.
+    """
+    owns_session = spark is None
+    spark = spark or create_spark_session()
+    timings = {}
+    recorder = SparkRunRecorder(spark, report_dir) if report_dir else None
     
 
-    df_clean = df_clean.withColumn("pickup_time", col("tpep_pickup_datetime").cast("timestamp")) \
-                       .withColumn("dropoff_time", col("tpep_dropoff_datetime").cast("timestamp"))
+    files = list_input_files(spark, input_paths)
+    if not files:
+        raise FileNotFoundError(f"No input files match {input_paths}")
+    if not full_refresh:
+        processed = read_ledger(spark, output_path)
+        skipped = [f for f in files if (f["path"], f["size"], f["modified"]) in processed]
+        files = [f for f in files if f not in skipped]
+        for f in skipped:
+            print(f"Skipping already processed file: {f['path']}")
+    if not files:
+        print("No new input files; outputs are up to date.")
+        if owns_session:
+            spark.stop()
+        return timings
+
+    input_files = [f["path"] for f in files]
+    print(f"Reading data from {input_files}...")
+    df = read_trips(spark, input_files)
+    
+    if count_input:
+        initial_count = timed_action(timings, "count_input (extra CSV scan)", df.count, recorder)
+        print(f"Initial Count: {initial_count}")
     
 
-    df_clean = df_clean.withColumn("pickup_hour", hour(col("pickup_time"))) \
-                       .withColumn("pickup_day", dayofmonth(col("pickup_time")))
+    # Same rules and features as MobilityDataAnalyzer (see pipeline.py).
+    df_clean = run_spark(df)
     
 
-    df_clean = df_clean.withColumn("trip_duration_min", 
-        (unix_timestamp(col("dropoff_time")) - unix_timestamp(col("pickup_time"))) / 60
+    source = input_file_name()
+    file_year = regexp_extract(source, FILE_MONTH_PATTERN, 1)
+    file_month = regexp_extract(source, FILE_MONTH_PATTERN, 2)
+    df_clean = df_clean.filter(
+        (file_year == "") |
+        ((col("pickup_year") == file_year.cast("int")) & (col("pickup_month") == file_month.cast("int")))
     )
     
 
+    print(f"Writing results to {output_path}...")
+    cleaned_path = f"{output_path}/cleaned_trips"
+    overwrite_mode = "static" if full_refresh else "dynamic"
+    df_clean, write_options = layout_for_write(df_clean, target_file_mb, row_group_mb)
+    timed_action(timings, "write_cleaned_trips (single CSV scan)",
+                 lambda: df_clean.write.mode("overwrite")
+                         .option("partitionOverwriteMode", overwrite_mode)
+                         .options(**write_options)
+                         .partitionBy(*PARTITION_COLUMNS).parquet(cleaned_path),
+                 recorder, plan=df_clean)
+    describe_layout(spark, cleaned_path)
+    
+
+    trips = spark.read.parquet(cleaned_path)
+    clean_count = timed_action(timings, "count_cleaned (parquet)", trips.count, recorder)
+    print(f"Cleaned Count: {clean_count}")
     
 
-    revenue_daily = df_clean.groupBy("pickup_day") \
-        .agg({"total_amount": "sum", "fare_amount": "avg"}) \
-        .orderBy("pickup_day")
+    # KPI tables are Parquet with named columns, matching what
+    # MobilityDBManager returns, so the app can serve them directly.
+    revenue_daily = trips.groupBy(*PARTITION_COLUMNS) \
+        .agg(count("*").alias("trip_count"),
+             spark_sum("total_amount").alias("total_revenue"),
+             avg("fare_amount").alias("avg_fare")) \
+        .orderBy(*PARTITION_COLUMNS)
         
 
-    hourly_demand = df_clean.groupBy("pickup_hour") \
-        .count() \
+    hourly_demand = trips.groupBy("pickup_hour") \
+        .agg(count("*").alias("trip_count"),
+             avg("trip_distance").alias("avg_distance")) \
         .orderBy("pickup_hour")
         
 
-    print(f"Writing results to {output_path}...")
+    serving_sample = trips.sample(False, min(1.0, SERVING_SAMPLE_ROWS / max(clean_count, 1)), seed=42)
     
 
-    df_clean.write.mode("overwrite").partitionBy("pickup_day").parquet(f"{output_path}/cleaned_trips")
+    for name, table in (("revenue_daily", revenue_daily), ("hourly_demand", hourly_demand),
+                        ("serving_sample", serving_sample)):
+        timed_action(timings, f"write_{name}",
+                     lambda table=table, name=name: table.coalesce(1).write.mode("overwrite")
+                                                         .parquet(f"{output_path}/{name}"),
+                     recorder, plan=table)
     
 
-    revenue_daily.write.mode("overwrite").csv(f"{output_path}/revenue_daily")
-    hourly_demand.write.mode("overwrite").csv(f"{output_path}/hourly_demand")
+    # The aggregates are small: one compact Parquet file each.
+    for name, table in compute_zone_kpis(trips, zone_lookup(spark)).items():
+        timed_action(timings, f"write_{name}",
+                     lambda table=table, name=name: table.coalesce(1).write.mode("overwrite")
+                                                         .parquet(f"{output_path}/{name}"),
+                     recorder, plan=table)
+    append_ledger(spark, output_path, files, mode="overwrite" if full_refresh else "append")
     
-    spark.stop()
-    print("ETL Job Complete.")
+    if recorder is not None:
+        recorder.write_report(timings, params={
+            "input_files": [f["path"] for f in files],
+            "output_path": output_path,
+            "full_refresh": full_refresh,
+            "target_file_mb": target_file_mb,
+            "row_group_mb": row_group_mb,
+            "shuffle_partitions": spark.conf.get("spark.sql.shuffle.partitions"),
+        })
+    
+    if owns_session:
+        spark.stop()
+    print(f"ETL Job Complete in {sum(timings.values()):.2f}s of Spark actions.")
+    return timings
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Urban Mobility PySpark ETL")
+    parser.add_argument("--input", nargs="+", default=["yellow_tripdata_2016-01.csv"],
+                        help="Input CSV path(s) or glob(s), e.g. 'data/yellow_tripdata_2016-*.csv'")
+    parser.add_argument("--output", default="spark_output", help="Output directory")
+    parser.add_argument("--master", default=None, help="Spark master URL, e.g. local[*]")
+    parser.add_argument("--shuffle-partitions", type=int, default=None,
+                        help="Value for spark.sql.shuffle.partitions")
+    parser.add_argument("--app-name", default="MobilityAnalyticsETL")
+    parser.add_argument("--count-input", action="store_true",
+                        help="Also count raw input rows (one extra full CSV scan)")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="Reprocess every input file and rebuild all partitions")
+    parser.add_argument("--target-file-mb", type=int, default=TARGET_FILE_MB,
+                        help="Target size of cleaned_trips Parquet files")
+    parser.add_argument("--row-group-mb", type=int, default=ROW_GROUP_MB,
+                        help="Parquet row-group size for cleaned_trips")
+    parser.add_argument("--report-dir", default="spark_reports",
+                        help="Where to write the per-run metrics report")
+    parser.add_argument("--no-report", action="store_true",
+                        help="Skip collecting stage metrics and plans")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
+    args = parse_args()
 
-    INPUT_FILE = "c:/Users/HarshKumar/OneDrive - Blend 360/Projects/dataset/yellow_tripdata_2016-01.csv"
-    OUTPUT_DIR = "c:/Users/HarshKumar/OneDrive - Blend 360/Projects/spark_output"
-    
     try:
-        process_data(INPUT_FILE, OUTPUT_DIR)
+        spark = create_spark_session(args.app_name, args.master, args.shuffle_partitions)
+        process_data(args.input, args.output, spark, count_input=args.count_input,
+                     full_refresh=args.full_refresh, target_file_mb=args.target_file_mb,
+                     row_group_mb=args.row_group_mb,
+                     report_dir=None if args.no_report else args.report_dir)
+        spark.stop()
     except Exception as e:
         print(f"Spark execution failed (ensure Java/Hadoop is set up): {e}")
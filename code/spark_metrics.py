@@ -0,0 +1,179 @@
+import os
+import re
+import json
+import time
+import urllib.request
+from datetime import datetime
+import pandas as pd
+
+STAGE_FIELDS = [
+    "stageId", "attemptId", "name", "status", "numTasks", "executorRunTime",
+    "inputBytes", "outputBytes", "shuffleReadBytes", "shuffleWriteBytes",
+    "memoryBytesSpilled", "diskBytesSpilled",
+]
+# Flag an action as a regression when it is this much slower than the previous run.
+REGRESSION_THRESHOLD = 0.2
+
+
+def _plan_file(label):
+    return re.sub(r"\W+", "_", label).strip("_") + ".txt"
+
+
+def _parse_time(value):
+    """Spark REST timestamps look like 2016-01-01T10:00:00.123GMT."""
+    if not value:
+        return None
+    return datetime.strptime(value.replace("GMT", "+0000"), "%Y-%m-%dT%H:%M:%S.%f%z").timestamp()
+
+
+class SparkRunRecorder:
+    """
+    Records what each ETL action cost on the cluster.
+
+    Every tracked action runs in its own Spark job group; afterwards the
+    Spark REST status API (served by the driver UI, also in local mode) is
+    read to attribute stages to actions: duration, input bytes, shuffle
+    read/write, spill and task skew (max / median task run time). Physical
+    plans of the outputs are saved as text, and write_report() produces a
+    JSON and an HTML report compared against the previous run.
+    """
+
+    def __init__(self, spark, report_dir: str = "spark_reports"):
+        self.spark = spark
+        self.sc = spark.sparkContext
+        self.report_dir = report_dir
+        self.run_dir = os.path.join(report_dir, datetime.now().strftime("run_%Y%m%d_%H%M%S"))
+        self.api = f"{self.sc.uiWebUrl}/api/v1/applications/{self.sc.applicationId}" if self.sc.uiWebUrl else None
+        self.plans = {}
+        if self.api is None:
+            print("[metrics] Spark UI is disabled (spark.ui.enabled=false); only wall times will be reported.")
+
+    def track(self, label, action):
+        """Wraps action so the jobs it triggers are tagged with label."""
+        def run():
+            self.sc.setJobGroup(label, label)
+            try:
+                return action()
+            finally:
+                self.sc.setLocalProperty("spark.jobGroup.id", None)
+        return run
+
+    def save_plan(self, label, df):
+        """Keeps the formatted physical plan of df for the report."""
+        jvm = self.sc._jvm
+        try:
+            self.plans[label] = jvm.org.apache.spark.sql.api.python.PythonSQLUtils.explainString(
+                df._jdf.queryExecution(), "formatted")
+        except Exception as e:
+            self.plans[label] = f"Plan unavailable: {e}"
+
+    def _get(self, path):
+        with urllib.request.urlopen(f"{self.api}{path}", timeout=10) as response:
+            return json.loads(response.read())
+
+    def collect_stages(self) -> pd.DataFrame:
+        """One row per stage attempt, with the job group (action label) that ran it."""
+        if self.api is None:
+            return pd.DataFrame(columns=STAGE_FIELDS + ["action", "duration_s", "task_skew"])
+        stage_action = {}
+        for job in self._get("/jobs"):
+            for stage_id in job.get("stageIds", []):
+                stage_action[stage_id] = job.get("jobGroup")
+
+        rows = []
+        for stage in self._get("/stages"):
+            if stage.get("status") not in ("COMPLETE", "FAILED"):
+                continue
+            row = {field: stage.get(field) for field in STAGE_FIELDS}
+            start, end = _parse_time(stage.get("submissionTime")), _parse_time(stage.get("completionTime"))
+            row["duration_s"] = end - start if start and end else None
+            row["action"] = stage_action.get(stage["stageId"])
+            try:
+                summary = self._get(f"/stages/{stage['stageId']}/{stage['attemptId']}/taskSummary?quantiles=0.5,1.0")
+                median, longest = summary["executorRunTime"]
+                row["task_skew"] = longest / median if median else None
+            except Exception:
+                row["task_skew"] = None
+            rows.append(row)
+        return pd.DataFrame(rows).sort_values("stageId") if rows else pd.DataFrame(rows)
+
+    def summarize(self, stages: pd.DataFrame, timings: dict) -> pd.DataFrame:
+        """Per-action totals: wall time from timings plus the stage metrics."""
+        summary = pd.DataFrame({"action": list(timings), "wall_s": list(timings.values())})
+        if stages.empty:
+            return summary
+        totals = stages.groupby("action").agg(
+            stages=("stageId", "count"),
+            tasks=("numTasks", "sum"),
+            input_bytes=("inputBytes", "sum"),
+            shuffle_read_bytes=("shuffleReadBytes", "sum"),
+            shuffle_write_bytes=("shuffleWriteBytes", "sum"),
+            memory_spill_bytes=("memoryBytesSpilled", "sum"),
+            disk_spill_bytes=("diskBytesSpilled", "sum"),
+            max_task_skew=("task_skew", "max"),
+        ).reset_index()
+        return summary.merge(totals, on="action", how="left")
+
+    def _previous_report(self):
+        path = os.path.join(self.report_dir, "latest.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def write_report(self, timings: dict, params: dict = None) -> str:
+        """
+        Writes report.json, report.html and plans/*.txt to a new run directory
+        and updates latest.json. Returns the run directory.
+        """
+        stages = self.collect_stages()
+        actions = self.summarize(stages, timings)
+
+        previous = self._previous_report()
+        if previous:
+            before = {a["action"]: a["wall_s"] for a in previous["actions"]}
+            actions["previous_wall_s"] = actions["action"].map(before)
+            actions["change"] = actions["wall_s"] / actions["previous_wall_s"] - 1
+            actions["regression"] = actions["change"] > REGRESSION_THRESHOLD
+
+        os.makedirs(os.path.join(self.run_dir, "plans"), exist_ok=True)
+        for label, plan in self.plans.items():
+            with open(os.path.join(self.run_dir, "plans", _plan_file(label)), "w") as f:
+                f.write(plan)
+
+        report = {
+            "app_id": self.sc.applicationId,
+            "spark_version": self.spark.version,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": params or {},
+            "total_wall_s": sum(timings.values()),
+            "actions": json.loads(actions.to_json(orient="records")),
+            "stages": json.loads(stages.to_json(orient="records")),
+            "plans": sorted(self.plans),
+        }
+        text = json.dumps(report, indent=2)
+        with open(os.path.join(self.run_dir, "report.json"), "w") as f:
+            f.write(text)
+        with open(os.path.join(self.report_dir, "latest.json"), "w") as f:
+            f.write(text)
+
+        plan_links = "".join(f'<li><a href="plans/{_plan_file(label)}">{label}</a></li>' for label in sorted(self.plans))
+        html = f"""<html><head><meta charset="utf-8"><title>Spark ETL run {report['created_at']}</title></head>
+<body>
+<h1>Spark ETL run {report['created_at']}</h1>
+<p>Application {report['app_id']} (Spark {report['spark_version']}), {report['total_wall_s']:.2f}s of actions.</p>
+<h2>Actions</h2>
+{actions.to_html(index=False, float_format=lambda v: f"{v:,.3f}")}
+<h2>Stages</h2>
+{stages.to_html(index=False, float_format=lambda v: f"{v:,.3f}")}
+<h2>Physical plans</h2>
+<ul>{plan_links}</ul>
+</body></html>"""
+        with open(os.path.join(self.run_dir, "report.html"), "w") as f:
+            f.write(html)
+
+        if previous and actions["regression"].any():
+            for row in actions[actions["regression"]].itertuples():
+                print(f"[metrics] Regression: {row.action} took {row.wall_s:.2f}s vs {row.previous_wall_s:.2f}s last run")
+        print(f"[metrics] Run report written to {self.run_dir}")
+        return self.run_dir
@@ -0,0 +1,302 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+from urllib.request import pathname2url
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ROLLUP_TABLE = "trips_rollup"
+# Grain of the rollup: one row per pickup hour of each day.
+ROLLUP_DIMENSIONS = ["pickup_year", "pickup_month", "pickup_day", "pickup_hour", "pickup_weekday"]
+ROLLUP_MEASURES = ["total_amount", "fare_amount", "tip_amount", "trip_distance", "passenger_count", "trip_duration_min"]
+
+DEFAULT_LIMIT = 1000
+# Queries estimated to read more rows than this are rejected.
+MAX_SCAN_ROWS = 5_000_000
+# Assumed fraction of a table an index range search reads.
+INDEX_SELECTIVITY = 0.1
+
+AGGREGATE_PATTERN = re.compile(r"\b(COUNT|SUM|AVG|TOTAL)\s*\(", re.IGNORECASE)
+LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/", re.DOTALL)
+PLAN_TABLE_PATTERN = re.compile(r"^(SCAN|SEARCH)\s+(?:TABLE\s+)?(\w+)", re.IGNORECASE)
+
+ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+DENIED_FUNCTIONS = {"load_extension", "readfile", "writefile", "edit", "fts3_tokenizer"}
+
+
+class SQLValidationError(ValueError):
+    """Generated SQL that must not run: writes, several statements, unknown columns or too costly."""
+
+
+def build_rollup(conn: sqlite3.Connection, table: str = "trips") -> int:
+    """
+    (Re)creates ROLLUP_TABLE from table: trip_count plus <measure>_sum per
+    ROLLUP_DIMENSIONS group, over whichever of those columns table has.
+
+    Returns:
+        int: Number of rollup rows.
+    """
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    dims = [c for c in ROLLUP_DIMENSIONS if c in columns]
+    if not dims:
+        return 0
+    sums = [f"SUM({c}) AS {c}_sum" for c in ROLLUP_MEASURES if c in columns]
+    with conn:
+        conn.execute(f"DROP TABLE IF EXISTS {ROLLUP_TABLE}")
+        conn.execute(
+            f"CREATE TABLE {ROLLUP_TABLE} AS SELECT {', '.join(dims + ['COUNT(*) AS trip_count'] + sums)} "
+            f"FROM {table} GROUP BY {', '.join(dims)}"
+        )
+    rows = conn.execute(f"SELECT COUNT(*) FROM {ROLLUP_TABLE}").fetchone()[0]
+    logging.info(f"Built {ROLLUP_TABLE}: {rows:,} rows.")
+    return rows
+
+
+def connect_read_only(db_path: str) -> sqlite3.Connection:
+    """
+    A read-only connection to the database file at db_path, for SQLGuard.
+
+    The guard installs an authorizer while it compiles a query, and an
+    authorizer applies to every statement on its connection, so it gets one
+    of its own instead of sharing the app's.
+    """
+    uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+
+def _mask_literals(sql: str) -> str:
+    """sql with string literals, quoted identifiers and comments blanked out, same length."""
+    return LITERAL_PATTERN.sub(lambda m: " " * len(m.group(0)), sql)
+
+
+def _closing_paren(masked: str, start: int) -> int:
+    depth = 0
+    for i in range(start, len(masked)):
+        if masked[i] == '(':
+            depth += 1
+        elif masked[i] == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+    raise SQLValidationError("Unbalanced parentheses in query.")
+
+
+def _has_top_level(masked: str, keyword: str) -> bool:
+    depth = 0
+    for m in re.finditer(rf"\(|\)|\b{keyword}\b", masked, re.IGNORECASE):
+        if m.group(0) == "(":
+            depth += 1
+        elif m.group(0) == ")":
+            depth -= 1
+        elif depth == 0:
+            return True
+    return False
+
+
+class ValidatedQuery:
+    """A query that passed SQLGuard, with what was changed and what it is expected to cost."""
+
+    def __init__(self, sql, original, access, estimated_rows, plan, columns, limit_added, rewritten):
+        self.sql = sql
+        self.original = original
+        self.access = access
+        self.estimated_rows = estimated_rows
+        self.plan = plan
+        self.columns = columns
+        self.limit_added = limit_added
+        self.rewritten = rewritten
+
+    def describe(self) -> str:
+        notes = [f"{self.access.replace('_', ' ')}", f"~{self.estimated_rows:,} rows read"]
+        if self.rewritten:
+            notes.append(f"rewritten to {ROLLUP_TABLE}")
+        if self.limit_added:
+            notes.append("LIMIT added")
+        return " · ".join(notes)
+
+
+class SQLGuard:
+    """
+    Checks generated SQL before it runs against SQLite.
+
+    The statement is compiled by SQLite itself (EXPLAIN QUERY PLAN) under an
+    authorizer that only permits reads, so writes, PRAGMA and ATTACH are
+    refused and every column read is known. A single SELECT/WITH statement
+    over the allowed tables is accepted; unknown columns are reported with
+    the real schema. Aggregates over 'trips' that only group and filter on
+    rollup dimensions are rewritten to ROLLUP_TABLE, a LIMIT is added when
+    the outer query has none, and the query plan gives the access path and
+    an estimate of rows read, which is capped at max_scan_rows.
+
+    conn should be dedicated to the guard (see connect_read_only): while a
+    query compiles, its authorizer denies anything but reads to every other
+    user of the connection as well.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, table: str = "trips", allowed_tables=(),
+                 default_limit: int = DEFAULT_LIMIT, max_scan_rows: int = MAX_SCAN_ROWS):
+        self.conn = conn
+        self.table = table
+        self.allowed_tables = {table, ROLLUP_TABLE, *allowed_tables}
+        self.default_limit = default_limit
+        self.max_scan_rows = max_scan_rows
+        self._row_counts = {}
+        # Held while the authorizer is installed, so a call from another
+        # thread neither runs under it nor clears it early.
+        self._lock = threading.RLock()
+
+    def schema(self, table: str = None) -> list:
+        with self._lock:
+            return [row[1] for row in self.conn.execute(f"PRAGMA table_info({table or self.table})")]
+
+    def table_rows(self, table: str) -> int:
+        if table not in self._row_counts:
+            with self._lock:
+                self._row_counts[table] = self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return self._row_counts[table]
+
+    def _explain(self, sql: str):
+        """Compiles sql read-only; returns (plan detail lines, {table: columns read})."""
+        reads, denied = {}, []
+
+        def authorize(action, arg1, arg2, db_name, source):
+            if action not in ALLOWED_ACTIONS:
+                denied.append(f"operation code {action}")
+                return sqlite3.SQLITE_DENY
+            if action == sqlite3.SQLITE_FUNCTION and (arg2 or "").lower() in DENIED_FUNCTIONS:
+                denied.append(arg2)
+                return sqlite3.SQLITE_DENY
+            if action == sqlite3.SQLITE_READ:
+                if arg1 not in self.allowed_tables:
+                    denied.append(arg1)
+                    return sqlite3.SQLITE_DENY
+                if arg2:
+                    reads.setdefault(arg1, set()).add(arg2)
+            return sqlite3.SQLITE_OK
+
+        with self._lock:
+            self.conn.set_authorizer(authorize)
+            try:
+                return [row[3] for row in self.conn.execute(f"EXPLAIN QUERY PLAN {sql}")], reads
+            except sqlite3.DatabaseError as e:
+                error = e
+            finally:
+                self.conn.set_authorizer(None)
+
+        if denied:
+            raise SQLValidationError(
+                f"Not allowed: {denied[0]}. Only reads of {', '.join(sorted(self.allowed_tables))} are permitted.") from error
+        column = re.match(r"no such column: (.+)", str(error))
+        if column:
+            raise SQLValidationError(
+                f"Unknown column {column.group(1)}. {self.table} columns: {', '.join(self.schema())}") from error
+        raise SQLValidationError(f"Invalid SQL: {error}") from error
+
+    def _rewrite_to_rollup(self, sql: str, masked: str):
+        """sql over ROLLUP_TABLE if every aggregate maps onto its sums, else None."""
+        if (len(re.findall(r"\bSELECT\b", masked, re.IGNORECASE)) != 1
+                or re.search(r"\bJOIN\b|\bDISTINCT\b|\bWITH\b", masked, re.IGNORECASE)
+                or len(re.findall(rf"\bFROM\s+{self.table}\b", masked, re.IGNORECASE)) != 1
+                or not AGGREGATE_PATTERN.search(masked)):
+            return None
+        rollup_columns = set(self.schema(ROLLUP_TABLE))
+        if not rollup_columns:
+            return None
+
+        out, pos = [], 0
+        for match in AGGREGATE_PATTERN.finditer(masked):
+            if match.start() < pos:
+                return None
+            open_idx = match.end() - 1
+            close_idx = _closing_paren(masked, open_idx)
+            func, arg = match.group(1).upper(), sql[open_idx + 1:close_idx].strip()
+            if func == "COUNT" and (arg in ("*", "1") or arg in rollup_columns or f"{arg}_sum" in rollup_columns):
+                # Cleaned trips have no NULL measures, so COUNT(col) is the row count.
+                replacement = "COALESCE(SUM(trip_count), 0)"
+            elif f"{arg}_sum" in rollup_columns and func in ("SUM", "TOTAL"):
+                replacement = f"{func}({arg}_sum)"
+            elif f"{arg}_sum" in rollup_columns and func == "AVG":
+                replacement = f"(SUM({arg}_sum) * 1.0 / SUM(trip_count))"
+            else:
+                return None
+            out.append(sql[pos:match.start()])
+            out.append(replacement)
+            pos = close_idx + 1
+        out.append(sql[pos:])
+        rewritten = re.sub(rf"\bFROM\s+{self.table}\b", f"FROM {ROLLUP_TABLE}", "".join(out),
+                           count=1, flags=re.IGNORECASE)
+        try:
+            # Anything still referring to row-level columns fails to compile here.
+            self._explain(rewritten)
+        except SQLValidationError:
+            return None
+        return rewritten
+
+    def _estimate(self, plan):
+        """(access path, estimated rows read) from EXPLAIN QUERY PLAN details."""
+        access, rows = "constant", 0
+        for detail in plan:
+            match = PLAN_TABLE_PATTERN.match(detail)
+            if not match:
+                continue
+            kind, table = match.group(1).upper(), match.group(2)
+            if table not in self.allowed_tables:
+                continue
+            table_rows = self.table_rows(table)
+            if table == ROLLUP_TABLE:
+                step = "rollup"
+            elif kind == "SEARCH":
+                step, table_rows = "index", int(table_rows * INDEX_SELECTIVITY)
+            else:
+                step = "full_scan"
+            rows += table_rows
+            # The most expensive step names the access path.
+            rank = ["constant", "rollup", "index", "full_scan"]
+            if rank.index(step) > rank.index(access):
+                access = step
+        return access, rows
+
+    def validate(self, sql: str, use_rollup: bool = True) -> ValidatedQuery:
+        """
+        Returns the checked (and possibly rewritten) query.
+
+        Raises:
+            SQLValidationError: If the SQL is not a single read-only query over
+                the allowed tables, references unknown columns, or is estimated
+                to read more than max_scan_rows rows.
+        """
+        original = sql
+        sql = sql.strip()
+        masked = _mask_literals(sql)
+        statements = [s for s in masked.split(";") if s.strip()]
+        if not statements:
+            raise SQLValidationError("Empty query.")
+        if len(statements) > 1:
+            raise SQLValidationError("Only a single statement is allowed.")
+        # Drop trailing semicolons (and anything blank after them).
+        end = len(masked.rstrip().rstrip(";").rstrip())
+        sql, masked = sql[:end], masked[:end]
+        if not re.match(r"^\s*(SELECT|WITH)\b", masked, re.IGNORECASE):
+            raise SQLValidationError("Only SELECT queries are allowed.")
+
+        _, reads = self._explain(sql)
+        columns = sorted(reads.get(self.table, set()))
+
+        rewritten = self._rewrite_to_rollup(sql, masked) if use_rollup else None
+        if rewritten is not None:
+            sql, masked = rewritten, _mask_literals(rewritten)
+
+        limit_added = not _has_top_level(masked, "LIMIT")
+        if limit_added:
+            sql = f"{sql}\nLIMIT {self.default_limit}"
+
+        plan, _ = self._explain(sql)
+        access, estimated_rows = self._estimate(plan)
+        if self.max_scan_rows is not None and estimated_rows > self.max_scan_rows:
+            raise SQLValidationError(
+                f"Query would read ~{estimated_rows:,} rows ({access.replace('_', ' ')}); "
+                f"the limit is {self.max_scan_rows:,}. Add a time range or aggregate by hour/day.")
+        return ValidatedQuery(sql, original, access, estimated_rows, plan, columns, limit_added, rewritten is not None)
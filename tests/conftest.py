@@ -0,0 +1,45 @@
+import os
+import sys
+import types
+
+import pytest
+
+# The app's modules are imported as code.<module>, but the standard library
+# also has a "code" module, which wins on sys.path. Register code/ as the
+# package explicitly so the tests import the app's modules.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_DIR = os.path.join(ROOT, "code")
+
+if list(getattr(sys.modules.get("code"), "__path__", [])) != [CODE_DIR]:
+    package = types.ModuleType("code")
+    package.__path__ = [CODE_DIR]
+    sys.modules["code"] = package
+
+
+@pytest.fixture
+def assistant_for(monkeypatch):
+    """
+    Factory for a live GenAIAssistant (OpenAI provider, no SDK retries) backed
+    by a local MockLLMServer; returns (assistant, server). Keyword arguments
+    go to the server, metrics to the assistant. .env is not read.
+    """
+    pytest.importorskip("openai")
+    import code.genai_assistant as genai_assistant
+    from code.mock_llm_server import MockLLMServer
+
+    monkeypatch.setattr(genai_assistant, "_env_loaded", True)
+    for name in ("GROQ_API_KEY", "DEEPSEEK_API_KEY", "LLM_BASE_URL", "OPENAI_BASE_URL"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+    servers = []
+
+    def make(first_token_delay=0.0, token_delay=0.0, metrics=None, **server_options):
+        server = MockLLMServer(first_token_delay=first_token_delay, token_delay=token_delay, **server_options)
+        servers.append(server.start())
+        assistant = genai_assistant.GenAIAssistant(cache_path=None, base_url=server.base_url, max_retries=0,
+                                                   metrics=metrics)
+        return assistant, server
+
+    yield make
+    for server in servers:
+        server.stop()
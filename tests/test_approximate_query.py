@@ -0,0 +1,35 @@
+from code.approximate_query import rewrite_to_sample, _split_alias
+
+
+def test_explicit_and_bare_aliases():
+    assert _split_alias("COUNT(*) AS trips") == ("COUNT(*)", "trips")
+    assert _split_alias("COUNT(*) trips") == ("COUNT(*)", "trips")
+    assert _split_alias("pickup_hour hr") == ("pickup_hour", "hr")
+    assert _split_alias('SUM(total_amount) "revenue"') == ("SUM(total_amount)", '"revenue"')
+
+
+def test_expressions_are_not_split_into_alias():
+    assert _split_alias("pickup_hour * 2") == ("pickup_hour * 2", None)
+    assert _split_alias("pickup_hour + offset") == ("pickup_hour + offset", None)
+    assert _split_alias("DISTINCT pickup_hour") == ("DISTINCT pickup_hour", None)
+    assert _split_alias("tip_amount IS NULL") == ("tip_amount IS NULL", None)
+    assert _split_alias("CASE WHEN tip_amount > 0 THEN 1 ELSE 0 END tipped") == \
+        ("CASE WHEN tip_amount > 0 THEN 1 ELSE 0 END", "tipped")
+
+
+def test_group_key_expression_is_kept():
+    sql, intervals = rewrite_to_sample(
+        "SELECT pickup_hour * 2, COUNT(*) AS trips FROM trips GROUP BY pickup_hour * 2", "trips_sample_1pct")
+    assert sql.startswith("SELECT pickup_hour * 2, SUM(sample_weight) AS \"trips\"")
+    assert "FROM trips_sample_1pct GROUP BY pickup_hour * 2" in sql
+    assert [column for column, _, _ in intervals] == ["trips"]
+
+
+def test_unsafe_queries_fall_back_to_exact():
+    for query in [
+        "SELECT DISTINCT pickup_hour, COUNT(*) FROM trips GROUP BY pickup_hour",
+        "SELECT COUNT(DISTINCT pickup_day) FROM trips",
+        "SELECT pickup_hour, SUM(COUNT(*)) OVER (ORDER BY pickup_hour) FROM trips GROUP BY pickup_hour",
+        "SELECT AVG(n) FROM (SELECT pickup_day, COUNT(*) AS n FROM trips GROUP BY pickup_day)",
+    ]:
+        assert rewrite_to_sample(query, "trips_sample_1pct") == (None, [])
@@ -0,0 +1,19 @@
+import pandas as pd
+
+from code.database_manager import encode_timestamps, to_epoch_seconds
+
+
+def test_aware_timestamps_map_to_new_york_wall_clock():
+    naive = to_epoch_seconds("2016-01-05 17:00")
+    assert naive == 1452013200
+    assert to_epoch_seconds(pd.Timestamp("2016-01-05 17:00", tz="America/New_York")) == naive
+    assert to_epoch_seconds(pd.Timestamp("2016-01-05 22:00", tz="UTC")) == naive
+    # Summer time: 21:00 UTC is 17:00 EDT.
+    assert to_epoch_seconds(pd.Timestamp("2016-07-05 21:00", tz="UTC")) == to_epoch_seconds("2016-07-05 17:00")
+
+
+def test_encode_timestamps_converts_aware_columns():
+    times = pd.to_datetime(["2016-01-05 17:00", "2016-01-05 18:30"])
+    naive = encode_timestamps(pd.DataFrame({'tpep_pickup_datetime': times}))
+    aware = encode_timestamps(pd.DataFrame({'tpep_pickup_datetime': times.tz_localize("America/New_York")}))
+    assert naive['tpep_pickup_datetime'].tolist() == aware['tpep_pickup_datetime'].tolist() == [1452013200, 1452018600]
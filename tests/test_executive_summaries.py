@@ -0,0 +1,75 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from code.executive_summaries import ExecutiveSummaryBatch, SummaryStore, build_reports
+from code.sql_guard import build_rollup
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE trips (pickup_year, pickup_month, pickup_day, pickup_hour, pickup_weekday, "
+                 "total_amount, fare_amount, tip_amount, trip_distance)")
+    rows = [(2016, 1, day, hour, "Friday" if day % 7 == 1 else "Saturday", 15.0, 12.0, 2.0, 2.5)
+            for day in range(1, 15) for hour in (8, 13, 18, 23)]
+    # A month whose fares are all zero (e.g. a batch of voided trips).
+    rows += [(2016, 2, 1, 9, "Monday", 0.0, 0.0, 0.0, 0.0)]
+    conn.executemany("INSERT INTO trips VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    build_rollup(conn)
+    return conn
+
+
+def test_reports_survive_zero_denominators(conn):
+    reports = build_reports(conn, pd.DataFrame({'lat': [40.75], 'lon': [-73.99], 'trip_count': [0],
+                                                'avg_revenue': [0.0]}), scale=0.0)
+    february = next(r for r in reports if r.key == "month:2016-02")
+    assert "Tips: n/a of fares" in february.context
+    assert "average fare n/a" in reports[0].context
+
+
+def test_zone_counts_are_not_scaled_with_the_sampled_rollup(conn):
+    # The rollup holds a 10% sample (57 trips for 570), the zone counts every trip.
+    zones = pd.DataFrame({'lat': [40.750], 'lon': [-73.990], 'trip_count': [285], 'avg_revenue': [15.0]})
+    [zone] = [r for r in build_reports(conn, zones, scale=10.0) if r.scope == "zone"]
+    assert "Trips: 285 (50.00% of all trips)" in zone.context
+
+
+def test_offline_mock_run(conn, assistant_for, tmp_path):
+    assistant, server = assistant_for(failure_rate=0.3, seed=1)
+    assistant.router.endpoints[0].breaker.reset_timeout = 0.05
+    reports = build_reports(conn)
+    store = SummaryStore(str(tmp_path / "summaries.db"))
+    batch = ExecutiveSummaryBatch(assistant, store, max_workers=2, requests_per_minute=6000,
+                                  max_retries=8, backoff=0.01)
+
+    stats = batch.run(reports, "v1")
+    assert stats['generated'] == len(reports) and stats['failed'] == 0
+    assert stats['rate_limited'] > 0
+    # Every request the mock answered with 429 was counted once.
+    assert server.requests == stats['generated'] + stats['rate_limited']
+    assert [e['key'] for e in store.list("v1")] == sorted(r.key for r in reports)
+
+    assert batch.run(reports, "v1")['skipped'] == len(reports)
+
+
+def test_failed_reports_count_rate_limits(conn, assistant_for, tmp_path):
+    assistant, server = assistant_for(failure_rate=1.0)
+    assistant.router.endpoints[0].breaker.reset_timeout = 0.05
+    reports = build_reports(conn)[:2]
+    batch = ExecutiveSummaryBatch(assistant, SummaryStore(str(tmp_path / "summaries.db")), max_workers=1,
+                                  requests_per_minute=6000, max_retries=2, backoff=0.01)
+
+    stats = batch.run(reports, "v1")
+    assert stats['failed'] == 2 and stats['generated'] == 0
+    assert stats['rate_limited'] == server.requests > 0
+    assert set(stats['errors']) == {r.key for r in reports}
+
+
+def test_zone_reports_name_the_cell_size(conn):
+    zones = pd.DataFrame({'lat': [40.75], 'lon': [-73.99], 'trip_count': [10], 'avg_revenue': [15.0],
+                          'cell_deg': [0.01]})
+    [zone] = [r for r in build_reports(conn, zones) if r.scope == "zone"]
+    assert zone.key == "zone:0.01:40.750,-73.990"
+    assert "0.01° grid cell around (40.750, -73.990)" in zone.context
@@ -0,0 +1,49 @@
+import os
+import re
+import subprocess
+import sys
+
+from conftest import CODE_DIR
+
+# Cumulative import time of code.genai_assistant, in microseconds. The module
+# itself needs only the stdlib, sqlite and the small code.* helpers (~50ms
+# here); numpy, pandas, dotenv and the provider SDKs load on first use.
+IMPORT_BUDGET_US = 200_000
+HEAVY_MODULES = ("numpy", "pandas", "openai", "groq", "dotenv")
+
+SCRIPT = f"""
+import sys, types
+package = types.ModuleType("code")
+package.__path__ = [{CODE_DIR!r}]
+sys.modules["code"] = package
+import code.genai_assistant as ga
+print("after-import", *[m for m in {HEAVY_MODULES!r} if m in sys.modules])
+ga.load_env = lambda: None
+ga.GenAIAssistant(cache_path=None)
+print("after-init", *[m for m in {HEAVY_MODULES!r} if m in sys.modules])
+"""
+
+
+def _run(tmp_path):
+    env = dict(os.environ, OPENAI_API_KEY="test")
+    env.pop("GROQ_API_KEY", None)
+    env.pop("DEEPSEEK_API_KEY", None)
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", SCRIPT], cwd=tmp_path, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def test_import_stays_within_budget(tmp_path):
+    result = _run(tmp_path)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)", line)
+        if match:
+            times[match.group(2)] = int(match.group(1))
+    assert times["code.genai_assistant"] < IMPORT_BUDGET_US
+
+
+def test_heavy_modules_load_on_first_use(tmp_path):
+    lines = dict(line.split(" ", 1) if " " in line else (line, "")
+                 for line in _run(tmp_path).stdout.splitlines())
+    assert lines["after-import"] == ""
+    assert lines["after-init"] == ""
@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+from code.intent_sql import IntentEngine
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return IntentEngine()
+
+
+@pytest.mark.parametrize("question, sql", [
+    ("What is the total fare?", "SELECT SUM(fare_amount) AS total_fare FROM trips"),
+    ("Sum of fares by day",
+     "SELECT pickup_day, SUM(fare_amount) AS total_fare FROM trips GROUP BY pickup_day ORDER BY pickup_day"),
+    ("top 3 days by total tips",
+     "SELECT pickup_day, SUM(tip_amount) AS total_tip FROM trips GROUP BY pickup_day ORDER BY total_tip DESC LIMIT 3"),
+    ("What is the maximum fare?", "SELECT MAX(fare_amount) AS max_fare FROM trips"),
+    ("minimum distance", "SELECT MIN(trip_distance) AS min_distance FROM trips"),
+    ("average revenue per trip", "SELECT AVG(total_amount) AS avg_revenue FROM trips"),
+    ("Trips in the first 5 days", "SELECT COUNT(*) AS trips FROM trips WHERE pickup_day BETWEEN 1 AND 5"),
+    ("What's the revenue trend?",
+     "SELECT pickup_day, SUM(total_amount) AS revenue FROM trips GROUP BY pickup_day ORDER BY pickup_day"),
+    ("What's the average fare?", "SELECT AVG(fare_amount) AS avg_fare FROM trips"),
+    ("What is the total number of trips?", "SELECT COUNT(*) AS trips FROM trips"),
+    ("Which day had the highest revenue?",
+     "SELECT pickup_day, SUM(total_amount) AS revenue FROM trips GROUP BY pickup_day ORDER BY revenue DESC LIMIT 1"),
+    ("highest average fare by hour",
+     "SELECT pickup_hour, AVG(fare_amount) AS avg_fare FROM trips GROUP BY pickup_hour ORDER BY avg_fare DESC LIMIT 1"),
+    ("Top 5 busiest hours",
+     "SELECT pickup_hour, COUNT(*) AS trips FROM trips GROUP BY pickup_hour ORDER BY trips DESC LIMIT 5"),
+    ("What are the peak hours?",
+     "SELECT pickup_hour, COUNT(*) AS trips FROM trips GROUP BY pickup_hour ORDER BY trips DESC LIMIT 5"),
+    ("Show me peak hours",
+     "SELECT pickup_hour, COUNT(*) AS trips FROM trips GROUP BY pickup_hour ORDER BY trips DESC LIMIT 5"),
+    ("rush hour demand",
+     "SELECT pickup_hour, COUNT(*) AS trips FROM trips GROUP BY pickup_hour ORDER BY trips DESC LIMIT 1"),
+    ("revenue per trip by hour",
+     "SELECT pickup_hour, AVG(total_amount) AS avg_revenue FROM trips GROUP BY pickup_hour ORDER BY pickup_hour"),
+    ("revenue per day",
+     "SELECT pickup_day, SUM(total_amount) AS revenue FROM trips GROUP BY pickup_day ORDER BY pickup_day"),
+    ("trips in the morning rush", "SELECT COUNT(*) AS trips FROM trips WHERE pickup_hour BETWEEN 6 AND 11"),
+])
+def test_aggregate_words_choose_the_aggregate(engine, question, sql):
+    assert engine.to_sql(question) == sql
+
+
+@pytest.mark.parametrize("question", [
+    "average fare for trips over 10 miles",
+    "Revenue on weekdays vs weekends",
+    "count of trips with zero tip",
+    "trips after 5pm",
+    "average trips per day",
+    "Which payment type tips the most?",
+])
+def test_unparsed_conditions_defer_to_the_llm(engine, question):
+    intent = engine.parse(question)
+    assert intent.confidence < engine.threshold
+    assert intent.unknown_words
+    assert engine.to_sql(question) is None
+
+
+def test_generated_sql_runs(engine):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE trips (pickup_day, pickup_hour, pickup_weekday, total_amount, fare_amount, "
+                 "tip_amount, trip_distance, passenger_count, trip_duration_min)")
+    conn.execute("INSERT INTO trips VALUES (3, 8, 'Sunday', 20.5, 15.0, 3.0, 2.1, 1, 12.0)")
+    for question in ["Total tips by weekday", "mean duration on weekends", "Average distance between 5pm and 8pm",
+                     "lowest average passengers by hour", "maximum fare on January 3rd"]:
+        sql = engine.to_sql(question)
+        assert sql is not None, question
+        assert conn.execute(sql).fetchall()
@@ -0,0 +1,31 @@
+from code.llm_metrics import MetricsRegistry
+
+
+def test_finished_stream_is_recorded(assistant_for):
+    assistant, _ = assistant_for(metrics=MetricsRegistry())
+    answer = "".join(assistant.generate_insight_stream("hour,trips\n18,120", "When is peak demand?"))
+    assert answer
+    [row] = assistant.metrics.summary()
+    assert (row['operation'], row['provider'], row['calls'], row['errors'], row['cancelled']) == \
+        ("insight", "openai", 1, 0, 0)
+    assert row['completion_tokens'] > 0
+    assert row['first_token_p50_s'] is not None
+
+
+def test_abandoned_stream_is_recorded_as_cancelled(assistant_for):
+    assistant, _ = assistant_for(metrics=MetricsRegistry())
+    stream = assistant.generate_insight_stream("hour,trips\n18,120", "When is peak demand?")
+    next(stream)
+    stream.close()
+    totals = assistant.metrics.totals()
+    assert (totals['calls'], totals['errors'], totals['cancelled']) == (1, 0, 1)
+    assert 'llm_cancelled_total{operation="insight",provider="openai",model="gpt-3.5-turbo"} 1' \
+        in assistant.metrics.to_prometheus()
+
+
+def test_failed_stream_is_recorded_as_error(assistant_for):
+    assistant, _ = assistant_for(failure_rate=1.0, metrics=MetricsRegistry())
+    answer = "".join(assistant.generate_insight_stream("hour,trips\n18,120", "When is peak demand?"))
+    assert "quota" in answer.lower()
+    totals = assistant.metrics.totals()
+    assert (totals['calls'], totals['errors'], totals['cancelled']) == (1, 1, 0)
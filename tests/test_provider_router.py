@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+from code.mock_llm_server import MockLLMServer
+from code.provider_router import ProviderEndpoint, ProviderRouter
+
+openai = pytest.importorskip("openai")
+
+REPLY = "Evening demand peaks at 6 PM."
+MESSAGES = [{"role": "user", "content": "When is peak demand?"}]
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(**kwargs):
+        kwargs.setdefault("first_token_delay", 0.01)
+        kwargs.setdefault("token_delay", 0.0)
+        started.append(MockLLMServer(reply=REPLY, **kwargs).start())
+        return started[-1]
+
+    yield start
+    for server in started:
+        server.stop()
+
+
+def endpoint(name, server, reset_timeout=30.0):
+    connect = lambda: openai.OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+    return ProviderEndpoint(name, f"{name}-model", connect, reset_timeout=reset_timeout)
+
+
+def states(router):
+    return {s['provider']: s['state'] for s in router.stats()}
+
+
+def test_stream_reports_provider_and_first_token(servers):
+    router = ProviderRouter([endpoint("primary", servers()), endpoint("backup", servers())])
+    trace = {}
+    assert "".join(router.stream(MESSAGES, trace=trace)) == REPLY
+    assert trace['provider'] == "primary"
+    assert trace['attempts'] == 1
+    assert trace['first_token_s'] > 0
+
+
+def test_failover_opens_breaker_of_failing_provider(servers):
+    failing = servers(failure_rate=1.0)
+    router = ProviderRouter([endpoint("primary", failing), endpoint("backup", servers())])
+
+    for _ in range(3):
+        trace = {}
+        assert router.complete(MESSAGES, trace=trace) == (REPLY, "backup")
+        assert trace['attempts'] == 2
+    assert states(router) == {"primary": "open", "backup": "closed"}
+
+    # While open, the failing provider is skipped without a request.
+    assert router.complete(MESSAGES) == (REPLY, "backup")
+    assert "".join(router.stream(MESSAGES)) == REPLY
+    assert failing.requests == 3
+
+
+def test_stream_fails_over_before_first_token(servers):
+    router = ProviderRouter([endpoint("primary", servers(failure_rate=1.0)), endpoint("backup", servers())])
+    trace = {}
+    assert "".join(router.stream(MESSAGES, trace=trace)) == REPLY
+    assert trace['provider'] == "backup"
+    assert trace['attempts'] == 2
+
+
+def test_half_open_trial_closes_or_reopens_breaker(servers):
+    flaky = servers(failure_rate=1.0)
+    router = ProviderRouter([endpoint("primary", flaky, reset_timeout=0.2), endpoint("backup", servers())])
+    for _ in range(3):
+        router.complete(MESSAGES)
+    assert states(router)["primary"] == "open"
+
+    # A failed half-open trial re-opens the circuit at once.
+    time.sleep(0.25)
+    assert router.complete(MESSAGES) == (REPLY, "backup")
+    assert flaky.requests == 4
+    assert states(router)["primary"] == "open"
+
+    # A successful trial closes it and the provider answers again.
+    flaky.failure_rate = 0.0
+    time.sleep(0.25)
+    assert router.complete(MESSAGES) == (REPLY, "primary")
+    assert states(router) == {"primary": "closed", "backup": "closed"}
+
+
+def test_slow_provider_is_hedged(servers):
+    router = ProviderRouter([endpoint("primary", servers(first_token_delay=1.0)), endpoint("backup", servers())],
+                            default_hedge_after=0.1)
+    start = time.monotonic()
+    trace = {}
+    assert router.complete(MESSAGES, trace=trace) == (REPLY, "backup")
+    assert time.monotonic() - start < 0.8
+    assert trace['attempts'] == 2
+    assert router.endpoints[1].hedges == 1
+
+
+def test_hedged_stream_cancels_loser_without_tripping_breaker(servers):
+    slow = servers(first_token_delay=0.5, token_delay=0.05)
+    router = ProviderRouter([endpoint("primary", slow), endpoint("backup", servers())], default_hedge_after=0.1)
+    trace = {}
+    assert "".join(router.stream(MESSAGES, trace=trace)) == REPLY
+    assert trace['provider'] == "backup"
+
+    # The losing stream stops at its first token and frees its slot; being
+    # cancelled is neither a success nor a failure for its breaker.
+    primary = router.endpoints[0]
+    deadline = time.monotonic() + 2.0
+    while primary.in_flight and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert primary.in_flight == 0
+    assert primary.failures == 0
+    assert states(router) == {"primary": "closed", "backup": "closed"}
+    assert len(primary.latency) == 0
@@ -0,0 +1,42 @@
+import os
+import pandas as pd
+from code.shard_store import ShardedTripStore
+
+
+def _trips(*days):
+    pickup = pd.to_datetime(list(days))
+    return pd.DataFrame({
+        'tpep_pickup_datetime': (pickup - pd.Timestamp("1970-01-01")) // pd.Timedelta(seconds=1),
+        'total_amount': [10.0] * len(days),
+    })
+
+
+def test_reingest_drops_months_of_previous_file(tmp_path):
+    store = ShardedTripStore(str(tmp_path), max_workers=2)
+    store.begin_ingest()
+    store.write(_trips("2016-01-05", "2016-02-05", "2016-03-05"))
+    store.end_ingest()
+    assert list(store.list_shards()['month']) == ["2016-01", "2016-02", "2016-03"]
+
+    store.begin_ingest()
+    store.write(_trips("2016-02-07", "2016-02-08"))
+    store.end_ingest()
+    shards = store.list_shards()
+    assert list(shards['month']) == ["2016-02"]
+    assert not os.path.exists(tmp_path / "trips_2016_01.db")
+    assert store.aggregate({'trips': ('count', '*')})['trips'].tolist() == [2]
+    store.close()
+
+
+def test_pool_is_reused_across_aggregations(tmp_path):
+    store = ShardedTripStore(str(tmp_path), max_workers=2)
+    store.begin_ingest()
+    store.write(_trips("2016-01-05", "2016-02-05", "2016-02-06"))
+    store.end_ingest()
+    first = store.aggregate({'revenue': ('sum', 'total_amount')})
+    pool = store._pool
+    second = store.aggregate({'revenue': ('sum', 'total_amount')})
+    assert pool is not None and store._pool is pool
+    assert first['revenue'].tolist() == second['revenue'].tolist() == [30.0]
+    store.close()
+    assert store._pool is None
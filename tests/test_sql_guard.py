@@ -0,0 +1,57 @@
+import sqlite3
+import threading
+
+import pytest
+
+from code.database_manager import MobilityDBManager
+from code.sql_guard import SQLValidationError
+
+
+@pytest.fixture
+def manager(tmp_path):
+    path = str(tmp_path / "trips.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE trips (pickup_day INTEGER, pickup_hour INTEGER, fare_amount REAL)")
+        conn.executemany("INSERT INTO trips VALUES (?, ?, ?)",
+                         [(day, hour, 10.0 + hour) for day in range(1, 8) for hour in range(24)])
+    db = MobilityDBManager(path)
+    db.connect()
+    return db
+
+
+def test_guard_uses_its_own_read_only_connection(manager):
+    assert manager.validate_sql("SELECT pickup_hour, COUNT(*) FROM trips GROUP BY pickup_hour").rewritten
+    assert manager.guard.conn is not manager.conn
+    with pytest.raises(sqlite3.OperationalError):
+        manager.guard.conn.execute("DELETE FROM trips")
+    with pytest.raises(SQLValidationError):
+        manager.validate_sql("SELECT * FROM trips; DELETE FROM trips")
+
+
+def test_validation_does_not_block_other_threads(manager):
+    manager.validate_sql("SELECT 1")
+    errors = []
+
+    def write():
+        for _ in range(200):
+            try:
+                with manager.conn:
+                    manager.conn.execute("CREATE TEMP TABLE IF NOT EXISTS scratch (x)")
+                    manager.conn.execute("INSERT INTO scratch VALUES (1)")
+            except sqlite3.Error as e:
+                errors.append(e)
+
+    def validate():
+        for i in range(200):
+            try:
+                manager.validate_sql("SELECT fare_amount FROM trips WHERE pickup_hour = 3" if i % 2
+                                     else "SELECT COUNT(*) FROM trips WHERE pickup_day = 2")
+            except (sqlite3.Error, SQLValidationError) as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=f) for f in (write, validate, validate)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []